@@ -1,16 +1,41 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, g
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, g, Response, stream_with_context
+from flask import before_render_template, template_rendered, abort, send_from_directory
 from werkzeug.utils import secure_filename
 import os
 import json
 import logging
 import datetime
+import time
+import uuid
+import mimetypes
 from config import Config
-from utils.openai_client import OpenAIClient
-from utils.document_parser import parse_document
+from utils.openai_client import (OpenAIClient, DEFAULT_SYSTEM_PROMPT, DEFAULT_MAX_TOKENS, DEFAULT_TEMPERATURE,
+                                 estimate_request_tokens)
+from utils.completion_cache import CompletionCache
+from utils.parse_cache import ParsedTextCache
+from utils.image_prep import ImageCache
+from utils.background_parser import BackgroundParser, STATUS_UPLOADED, STATUS_PARSING, STATUS_PARSED
+from utils.disk_cache import file_sha256
+from utils.document_parser import (REPRESENTATION_FULL, REPRESENTATIONS, TABULAR_EXTENSIONS, IMAGE_EXTENSIONS,
+                                   MARKUP_EXTENSIONS, supported_extensions, reduction_ratio)
+from utils.dispatch import fan_out_completions
+from utils.retrieval import fit_documents
+from utils.tokens import estimate_tokens, truncate_to_tokens, trim_to_fit
+from utils.result_store import ResultStore, STATUS_PENDING, STATUS_COMPLETE, UNFINISHED
+from utils.blob_store import BlobStore
+from utils.rate_limiter import RateLimiter, RateLimitTimeout
+from utils.model_registry import ModelRegistry
+from utils.routing import RoutingPolicy
+from utils.static_assets import StaticAssets
+from utils.batch_jobs import (BatchQueue, BatchWorker, export_tasks, read_prompt_list, MODE_EACH_DOCUMENT,
+                              MODE_PROMPT_LIST)
+from utils.metrics import (registry, span, configure_logging, cache_hit_rates, request_id_var, REQUEST_SECONDS,
+                           SPAN_SECONDS)
 from flask_session import Session
+from markupsafe import Markup, escape
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging as JSON lines (or plain text) tagged with the request ID
+configure_logging(Config.LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -21,12 +46,78 @@ if app.config['SUBDIRECTORY_PATH']:
     app.config['SESSION_COOKIE_PATH'] = app.config['SUBDIRECTORY_PATH']
 
 app.config['SESSION_TYPE'] = 'filesystem'
-app.config['SESSION_FILE_DIR'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flask_session')
 os.makedirs(app.config['SESSION_FILE_DIR'], exist_ok=True)
 Session(app)
 
+# Time how long the session takes to pickle and write on each request
+_save_session = app.session_interface.save_session
+
+
+def save_session_timed(*args, **kwargs):
+    with span('session_save'):
+        return _save_session(*args, **kwargs)
+
+
+app.session_interface.save_session = save_session_timed
+
+# Fingerprint and precompress the stylesheets and scripts once, at startup
+static_assets = StaticAssets(app.static_folder, app.config['STATIC_BUILD_DIR'])
+static_assets.build()
+
+# The models users can choose from, defined once in configuration
+model_registry = ModelRegistry(app.config['AVAILABLE_MODELS'])
+
+# Requests and tokens per minute for each model, queued fairly across every worker process
+rate_limiter = RateLimiter(app.config['RATE_LIMIT_DB_PATH'], model_registry.limits())
+
+# Rolling latencies per model and endpoint, used to order endpoints and hedge slow requests
+routing = RoutingPolicy(window=app.config['LATENCY_WINDOW'], min_samples=app.config['HEDGE_MIN_SAMPLES'],
+                        min_hedge_delay=app.config['HEDGE_MIN_DELAY'], cooldown=app.config['ENDPOINT_COOLDOWN'],
+                        hedging=app.config['HEDGE_REQUESTS'])
+
 # Initialize OpenAI client
-openai_client = OpenAIClient(api_key=app.config['OPENAI_API_KEY'])
+openai_client = OpenAIClient(api_key=app.config['OPENAI_API_KEY'],
+                             api_url=app.config['OPENAI_API_URL'],
+                             pool_size=app.config['OPENAI_POOL_SIZE'],
+                             connect_timeout=app.config['OPENAI_CONNECT_TIMEOUT'],
+                             read_timeout=app.config['OPENAI_READ_TIMEOUT'],
+                             max_retries=app.config['OPENAI_MAX_RETRIES'],
+                             backoff_base=app.config['OPENAI_BACKOFF_BASE'],
+                             backoff_max=app.config['OPENAI_BACKOFF_MAX'],
+                             rate_limiter=rate_limiter,
+                             queue_timeout=app.config['RATE_LIMIT_QUEUE_TIMEOUT'],
+                             fallback_api_url=app.config['OPENAI_FALLBACK_API_URL'],
+                             fallback_api_key=app.config['OPENAI_FALLBACK_API_KEY'],
+                             models=model_registry,
+                             routing=routing)
+
+# Initialize the parsed document cache
+parse_cache = ParsedTextCache(app.config['PARSE_CACHE_DIR'], app.config['PARSE_CACHE_MAX_BYTES'])
+
+# Initialize the cache of images downscaled for vision requests
+image_cache = ImageCache(app.config['IMAGE_CACHE_DIR'], app.config['IMAGE_CACHE_MAX_BYTES'],
+                         detail=app.config['IMAGE_DETAIL'], quality=app.config['IMAGE_JPEG_QUALITY'])
+
+# Initialize the opt-in completion cache
+completion_cache = CompletionCache(app.config['COMPLETION_CACHE_DIR'], app.config['COMPLETION_CACHE_MAX_BYTES'],
+                                   ttl=app.config['COMPLETION_CACHE_TTL'])
+
+# Prompts and responses live in the result store; the session only references them
+result_store = ResultStore(app.config['RESULT_DB_PATH'], ttl=app.config['RESULT_TTL'])
+
+# Parse uploads in the background as soon as they are saved
+background_parser = BackgroundParser(parse_cache, max_workers=app.config['PARSE_WORKERS'])
+# Fork the parser processes before the batch worker and upload sweeper start their threads
+background_parser.start()
+
+
+# Batch jobs are queued in SQLite and run by a worker pool in every process
+batch_queue = BatchQueue(app.config['BATCH_DB_PATH'], lease_seconds=app.config['BATCH_LEASE_SECONDS'],
+                         max_attempts=app.config['BATCH_MAX_ATTEMPTS'], ttl=app.config['BATCH_TTL'])
+batch_worker = BatchWorker(batch_queue, openai_client, threads=app.config['BATCH_WORKERS'],
+                           model_limits={}, default_limit=app.config['BATCH_MODEL_CONCURRENCY'],
+                           timeout=app.config['MODEL_TIMEOUT'])
+batch_worker.start()
 
 
 # Configure the app to work in a subdirectory
@@ -34,7 +125,7 @@ class PrefixMiddleware:
     def __init__(self, app, prefix=''):
         self.app = app
         self.prefix = prefix
-        print(f"Configuring app with prefix: {prefix}")
+        logger.info(f"Configuring app with prefix: {prefix}")
 
     def __call__(self, environ, start_response):
         if environ['PATH_INFO'].startswith(self.prefix):
@@ -49,11 +140,74 @@ class PrefixMiddleware:
 # Apply the prefix middleware if we're in a subdirectory
 if app.config['SUBDIRECTORY_PATH']:
     app.wsgi_app = PrefixMiddleware(app.wsgi_app, prefix=app.config['SUBDIRECTORY_PATH'])
-    print(f"Using subdirectory: {app.config['SUBDIRECTORY_PATH']}")
+    logger.info(f"Using subdirectory: {app.config['SUBDIRECTORY_PATH']}")
 
 # Ensure the upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Uploads are stored by content hash and shared between sessions
+blob_store = BlobStore(app.config['UPLOAD_FOLDER'], quota_bytes=app.config['UPLOAD_QUOTA_BYTES'],
+                       session_ttl=app.config['PERMANENT_SESSION_LIFETIME'].total_seconds(),
+                       orphan_grace=app.config['UPLOAD_ORPHAN_GRACE'])
+blob_store.start_sweeper(app.config['UPLOAD_SWEEP_INTERVAL'])
+
+# Minimum seconds between marking a session's uploads as in use
+UPLOAD_TOUCH_INTERVAL = 5 * 60
+
+# Seconds between saves of a streaming response's progress, and between polls by requests following it
+STREAM_PROGRESS_INTERVAL = 1.0
+
+# Appended to a document shortened to fit a model's context window
+TRIMMED_MARKER = "\n\n[... the rest of this document was left out to fit the model's context window]"
+
+
+@app.before_request
+def start_request():
+    """Tag the request with an ID for logs and start timing it"""
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.request_token = request_id_var.set(g.request_id)
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def finish_request(response):
+    """Record how long the request took and return its ID"""
+    if 'request_started' in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, endpoint=request.endpoint or 'unknown',
+                                method=request.method, status=response.status_code)
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+
+@app.teardown_request
+def clear_request_id(exception=None):
+    # Streamed responses tear down again once the body is sent, so only reset once
+    token = g.pop('request_token', None)
+    if token is not None:
+        try:
+            request_id_var.reset(token)
+        except ValueError:
+            # The token was created in a different context, e.g. the handler ran in another thread
+            request_id_var.set('-')
+
+
+@before_render_template.connect_via(app)
+def start_render(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def finish_render(sender, template, context, **extra):
+    if 'render_started' in g:
+        SPAN_SECONDS.observe(time.perf_counter() - g.pop('render_started'), span='render', kind=template.name)
+
+
+def get_owner_id():
+    """Return the random ID that ties stored results to this session"""
+    if 'owner_id' not in session:
+        session['owner_id'] = uuid.uuid4().hex
+    return session['owner_id']
+
 
 # Store uploaded files in session
 def get_session_uploads():
@@ -62,12 +216,120 @@ def get_session_uploads():
     return session['uploads']
 
 
+def markup_reduction(upload):
+    """Describe how much smaller a parsed HTML or markdown upload is once its markup is stripped"""
+    text = parse_cache.get(upload['path'], upload.get('hash'))
+    if text is None:
+        return None
+    size = os.path.getsize(upload['path'])
+    return (f"Sent as {len(text):,} characters of text, "
+            f"{reduction_ratio(size, len(text)):.1f}x smaller than the {size:,} byte file")
+
+
+def refresh_upload_statuses():
+    """Update the parse status of each upload in the session"""
+    uploads = get_session_uploads()
+    changed = False
+    for upload in uploads:
+        status = background_parser.status(upload)
+        if status != upload.get('status'):
+            upload['status'] = status
+            changed = True
+        if status == STATUS_PARSED and upload.get('markup') and not upload.get('reduction'):
+            upload['reduction'] = markup_reduction(upload)
+            changed = changed or upload['reduction'] is not None
+        if status == STATUS_PARSED and upload.get('tokens') is None:
+            # Counted by the background parser along with the text
+            upload['tokens'] = parse_cache.tokens(upload['path'], upload.get('hash'),
+                                                  upload.get('representation', REPRESENTATION_FULL))
+            changed = changed or upload['tokens'] is not None
+    if changed:
+        session['uploads'] = uploads
+        session.modified = True
+    return uploads
+
+
+def context_limit(model):
+    """The most tokens a request to a model may add up to, leaving a margin for estimation error"""
+    return int(model_registry.context_window(model) * (1 - app.config['CONTEXT_WINDOW_MARGIN']))
+
+
+def context_window_error(model, tokens):
+    """Explain that a request is too large for a model even after shortening what can be shortened"""
+    return (f"This prompt and its answer need about {tokens:,} tokens, more than the {context_limit(model):,} "
+            f"that fit in {model_registry.name(model)}'s context window")
+
+
+def format_cost(cost):
+    """Describe the most a request may cost, in US dollars to the nearest cent"""
+    return "under $0.01" if cost < 0.01 else f"at most ${cost:,.2f}"
+
+
+def token_estimates(uploads):
+    """
+    Estimate what a prompt about the session's uploads will cost with each model
+
+    Uploads still being parsed are left out until their text has been counted.
+
+    Returns:
+        dict: 'documents' (estimated tokens in all of the uploads) and 'models', a list with each
+            model's 'id', 'tokens' (input tokens before the prompt itself) and a 'description'
+    """
+    document_tokens = sum(upload.get('tokens') or 0 for upload in uploads if not is_image(upload))
+    images_tokens = sum(upload.get('tokens') or 0 for upload in uploads if is_image(upload))
+    # The system prompt, which every request starts with
+    base_tokens = estimate_request_tokens('', 0)
+
+    models = []
+    for model in model_registry:
+        budget = model_registry.budget(model['id'], app.config['DEFAULT_DOCUMENT_TOKEN_BUDGET'])
+        tokens = base_tokens + min(document_tokens, budget) + images_tokens
+        description = f"{model['name']}: about {tokens:,} tokens before your prompt"
+        cost = model_registry.cost(model['id'], tokens, DEFAULT_MAX_TOKENS)
+        if cost:
+            description += f", {format_cost(cost)} per prompt including the answer"
+        if document_tokens > budget:
+            description += f". Only the {budget:,} tokens most relevant to your prompt will be sent"
+        if tokens + DEFAULT_MAX_TOKENS > context_limit(model['id']):
+            description += ". This is more than fits in its context window, so the largest files will be shortened"
+        models.append({'id': model['id'], 'tokens': tokens, 'description': description})
+    return {'documents': document_tokens + images_tokens, 'models': models}
+
+
+def touch_uploads(force=False):
+    """Keep this session's uploads from being swept while it is active"""
+    uploads = session.get('uploads')
+    if not uploads:
+        return
+    now = datetime.datetime.now().timestamp()
+    if force or now - session.get('uploads_touched', 0) > UPLOAD_TOUCH_INTERVAL:
+        blob_store.touch(get_owner_id(), [upload['hash'] for upload in uploads if upload.get('hash')])
+        session['uploads_touched'] = now
+
+
 @app.route('/')
 def index():
-    return render_template('index.html', uploads=get_session_uploads(),
+    touch_uploads()
+    uploads = refresh_upload_statuses()
+    return render_template('index.html', uploads=uploads, estimates=token_estimates(uploads),
+                           models=list(model_registry),
+                           completion_cache_enabled=app.config['COMPLETION_CACHE_ENABLED'],
                            is_connect=app.config['IS_CONNECT'])
 
 
+@app.route('/uploads/status')
+def upload_status():
+    """Lightweight parse status of the session's uploads, polled by the index page"""
+    uploads = refresh_upload_statuses()
+    return jsonify({
+        'uploads': [{'id': upload.get('id'), 'filename': upload['filename'], 'status': upload['status'],
+                     'reduction': upload.get('reduction'), 'tokens': upload.get('tokens')}
+                    for upload in uploads],
+        'estimates': token_estimates(uploads),
+        'pending': any(upload['status'] == STATUS_PARSING for upload in uploads)
+    })
+
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
@@ -80,46 +342,62 @@ def upload_file():
 
     if file:
         filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
 
         # Determine file type
         _, ext = os.path.splitext(filename)
         ext = ext.lower()
 
-        # Check if the file type is supported
-        supported_extensions = ['.pdf', '.docx', '.xlsx', '.xls', '.csv', '.txt', '.md', '.html', '.htm', '.jpg',
-                                '.jpeg', '.png']
-        if ext not in supported_extensions:
-            os.remove(file_path)  # Remove unsupported file
+        # Check if the file type is supported by a parser (or is an image)
+        if ext not in supported_extensions():
             logger.warning(f"Unsupported file type: {ext}")
             return redirect(url_for('index'))
 
-        # Add file to session
-        uploads = get_session_uploads()
-        uploads.append({
+        # Hash while saving, identical files are only stored once
+        upload_id = uuid.uuid4().hex
+        content_hash, file_path = blob_store.save(file.stream, ext, get_owner_id(), upload_id)
+
+        upload = {
+            'id': upload_id,
             'filename': filename,
             'path': file_path,
-            'status': 'Uploaded',
-            'type': ext[1:]  # Remove the dot from extension
-        })
+            'hash': content_hash,
+            'status': STATUS_UPLOADED,
+            'type': ext[1:],  # Remove the dot from extension
+            'representation': REPRESENTATION_FULL,
+            'tabular': ext in TABULAR_EXTENSIONS,
+            'markup': ext in MARKUP_EXTENSIONS
+        }
+
+        # Start extracting text straight away, images are not parsed
+        if ext not in IMAGE_EXTENSIONS:
+            background_parser.submit(upload['id'], file_path, upload['hash'])
+            upload['status'] = STATUS_PARSING
+        else:
+            upload['tokens'] = image_cache.tokens(file_path)
+
+        # Add file to session
+        uploads = get_session_uploads()
+        uploads.append(upload)
         session['uploads'] = uploads
         session.modified = True
 
     return redirect(url_for('index'))
 
 
-@app.route('/remove/<filename>')
-def remove_file(filename):
+@app.route('/remove/<upload_id>')
+def remove_file(upload_id):
+    # Uploads are looked up by ID, since two can share a filename
     uploads = get_session_uploads()
 
     for i, upload in enumerate(uploads):
-        if upload['filename'] == filename:
-            # Remove file from disk
+        if upload.get('id') == upload_id:
+            background_parser.forget(upload_id)
+
+            # Release this session's reference, the sweeper deletes the file once nothing uses it
             try:
-                os.remove(upload['path'])
+                blob_store.remove_ref(get_owner_id(), upload_id)
             except Exception as e:
-                logger.error(f"Error removing file {filename}: {str(e)}")
+                logger.error(f"Error removing file {upload['filename']}: {str(e)}")
 
             # Remove from session
             uploads.pop(i)
@@ -130,129 +408,598 @@ def remove_file(filename):
     return redirect(url_for('index'))
 
 
-@app.route('/submit', methods=['POST'])
-def submit_prompt():
-    prompt = request.form.get('prompt', '')
-    selected_models = request.form.getlist('modelComparison')
-
-    # Log the prompt to the console
-    print("\n" + "=" * 50)
-    print("PROMPT RECEIVED:")
-    print(prompt)
-    print("=" * 50 + "\n")
+def is_image(upload):
+    return f".{upload.get('type', '')}" in IMAGE_EXTENSIONS
 
-    if not prompt:
-        # No prompt provided, redirect back to the index page
-        return redirect(url_for('index'))
 
-    if not selected_models:
-        # No models selected, redirect back to the index page
-        return redirect(url_for('index'))
-
-    # Log selected models
-    print(f"Selected models: {', '.join(selected_models)}")
-
-    # Get uploaded files content
-    uploads = get_session_uploads()
+def load_documents(uploads):
+    """Get the text of each upload, using the text parsed at upload time where possible"""
     files_content = []
-
-    print(f"Processing {len(uploads)} uploaded files...")
-
     for upload in uploads:
+        if is_image(upload):
+            # Images are sent to the model as images, see load_images
+            continue
         try:
             file_path = upload['path']
             file_type = upload.get('type', '')
 
-            # Parse file based on type
-            if file_type in ['jpg', 'jpeg', 'png']:
-                # We can't parse image content directly, just mention it
-                content = f"[Image file: {upload['filename']}]"
-            else:
-                # Use document parser for text-based files
-                content = parse_document(file_path)
+            # Use the text parsed at upload time, waiting for it if still in flight
+            with span('parse', file_type):
+                background_parser.wait(upload.get('id'), timeout=app.config['PARSE_WAIT_TIMEOUT'])
+                content = parse_cache.get_or_parse(file_path, upload.get('hash'),
+                                                   upload.get('representation', REPRESENTATION_FULL))
+                tokens = parse_cache.tokens(file_path, upload.get('hash'),
+                                            upload.get('representation', REPRESENTATION_FULL))
 
             files_content.append({
                 'filename': upload['filename'],
-                'content': content
+                'hash': f"{upload.get('hash') or upload['path']}:{upload.get('representation', REPRESENTATION_FULL)}",
+                'content': content,
+                # Parse errors are not cached, so have no count
+                'tokens': tokens if tokens is not None else estimate_tokens(content)
             })
-            print(f"Successfully processed file: {upload['filename']}")
+            logger.info(f"Processed file: {upload['filename']}", extra={'file_type': file_type,
+                                                                        'characters': len(content)})
         except Exception as e:
             logger.error(f"Error processing file {upload['filename']}: {str(e)}")
-            print(f"Error processing file {upload['filename']}: {str(e)}")
+    return files_content
 
-    # Create a combined prompt with file content if available
-    combined_prompt = prompt
-    if files_content:
-        combined_prompt += "\n\nReference Documents:\n"
-        for file_info in files_content:
-            combined_prompt += f"\n--- {file_info['filename']} ---\n{file_info['content']}\n"
 
-    # Log the combined prompt length
-    print(f"Combined prompt length: {len(combined_prompt)} characters")
-    print("Sending prompt to OpenAI API...")
+def image_refs(uploads):
+    """The image uploads to send with a prompt, as stored with a pending response"""
+    return [{'filename': upload['filename'], 'path': upload['path'], 'hash': upload.get('hash')}
+            for upload in uploads if is_image(upload)]
 
-    # Get responses from each selected model
-    responses = {}
-    for model in selected_models:
+
+def load_images(refs):
+    """Downscale each image for the model, or fetch it from the image cache"""
+    images = []
+    for ref in refs:
         try:
-            response = openai_client.get_completion(combined_prompt, model)
-            responses[model] = response
-            print(f"Got response from {model}, length: {len(response)} characters")
+            images.append(image_cache.prepare(ref['path'], ref.get('hash')))
         except Exception as e:
-            error_message = str(e)
-            logger.error(f"Error from OpenAI API ({model}): {error_message}")
-            responses[model] = f"Error: {error_message}"
+            logger.error(f"Error preparing image {ref['filename']}: {str(e)}")
+    return images
 
-    # Store responses in session for display
-    session['responses'] = responses
-    session['prompt'] = prompt
-    session.modified = True
 
-    # Debug: print the stored session data
-    print(f"Stored in session - prompt length: {len(session.get('prompt', ''))}")
-    print(f"Stored in session - responses: {list(session.get('responses', {}).keys())}")
+def build_context(files_content, image_names=()):
+    """List the reference documents, and the names of any attached images, to send ahead of a prompt"""
+    context = ""
+    if files_content:
+        context += "Reference Documents:\n"
+        for file_info in files_content:
+            context += f"\n--- {file_info['filename']} ---\n{file_info['content']}\n"
+    if image_names:
+        context += f"\n\nAttached images, in order: {', '.join(image_names)}\n"
+    return context.strip()
+
+
+def build_combined_prompt(prompt, files_content, image_names=()):
+    """Append reference documents, and the names of any attached images, to the user's prompt"""
+    context = build_context(files_content, image_names)
+    return f"{prompt}\n\n{context}" if context else prompt
+
+
+def context_messages(context):
+    """The chat messages carrying a conversation's document context, sent before everything else"""
+    return [{'role': 'user', 'content': context}] if context else []
+
+
+def fit_context_window(model, prompt, documents, image_names=(), images=None):
+    """
+    Build a model's document context, shortening the largest documents if the request would overflow its window
+
+    The largest documents are cut down to a common length, just enough for
+    the request to fit, rather than sending a request the API would refuse.
+
+    Args:
+        model (str): Model ID
+        prompt (str): The user's prompt
+        documents (list): Dicts with 'filename' and 'content' keys, and optionally 'tokens'
+        image_names (list): Names of the attached images
+        images (list): Prepared images sent with the prompt
+
+    Returns:
+        tuple: (context, estimated request tokens, error), where error explains why the request
+            cannot be sent even with the documents left out, or is None
+    """
+    limit = context_limit(model)
+    counts = [document['tokens'] if 'tokens' in document else estimate_tokens(document['content'])
+              for document in documents]
+    # Estimates of the shortened documents can still be off slightly, so check again after trimming
+    for _ in range(3):
+        context = build_context(documents, image_names)
+        tokens = estimate_request_tokens(prompt, DEFAULT_MAX_TOKENS, images, context_messages(context))
+        if tokens <= limit or not any(counts):
+            break
+        keep = trim_to_fit(counts, tokens - limit)
+        logger.warning(f"Request to {model} needs about {tokens} tokens, more than its limit of {limit}; "
+                       f"shortening documents from {sum(counts)} to {sum(keep)} tokens")
+        documents = [dict(document, content=truncate_to_tokens(document['content'], kept, TRIMMED_MARKER),
+                          tokens=kept)
+                     for document, kept in zip(documents, keep)]
+        counts = keep
+
+    if tokens <= limit:
+        return context, tokens, None
+    return context, tokens, context_window_error(model, tokens) + ". Try a shorter prompt or fewer images."
+
+
+def pending_request(pending, model):
+    """
+    Build the request for a pending response from ResultStore.get_pending
+
+    The document context comes first, byte for byte as on the first turn, then
+    the conversation so far, so every follow-up shares the earlier requests'
+    prefix and the API can serve it from its prompt cache. A conversation too
+    long for the model's context window loses its oldest exchanges.
+
+    Args:
+        pending (dict): The pending response
+        model (str): Model ID
+
+    Returns:
+        tuple: (prompt, history, prepared images, estimated request tokens)
+    """
+    prompt = pending['pending_prompt']
+    context = context_messages(pending['context'])
+    images = load_images(pending['context_images'])
+    tokens = estimate_request_tokens(prompt, DEFAULT_MAX_TOKENS, images, context)
+    counts = [estimate_tokens(message['content']) for message in pending['history']]
+    limit = context_limit(model)
+
+    # Exchanges are dropped a question and answer at a time
+    start = 0
+    while start < len(counts) and tokens + sum(counts[start:]) > limit:
+        start += 2
+    if start:
+        logger.warning(f"Leaving the first {start // 2} exchanges out of a conversation with {model} "
+                       f"to fit its context window")
+    tokens += sum(counts[start:])
+    if tokens > limit:
+        raise ValueError(context_window_error(model, tokens))
+    return prompt, context + pending['history'][start:], images, tokens
+
+
+@app.route('/representation/<upload_id>/<representation>')
+def set_representation(upload_id, representation):
+    """Choose whether a spreadsheet or CSV is sent as rows or as a statistical profile"""
+    if representation not in REPRESENTATIONS:
+        return redirect(url_for('index'))
+
+    uploads = get_session_uploads()
+    for upload in uploads:
+        if upload.get('id') == upload_id and upload.get('tabular'):
+            upload['representation'] = representation
+            upload['tokens'] = None
+            background_parser.submit(upload['id'], upload['path'], upload.get('hash'), representation)
+            upload['status'] = STATUS_PARSING
+            session['uploads'] = uploads
+            session.modified = True
+            break
+
+    return redirect(url_for('index'))
+
+
+@app.route('/submit', methods=['POST'])
+def submit_prompt():
+    prompt = request.form.get('prompt', '')
+    selected_models = [model for model in request.form.getlist('modelComparison') if model in model_registry]
+
+    logger.info("Prompt received", extra={'prompt_characters': len(prompt), 'models': selected_models})
+
+    if not prompt:
+        # No prompt provided, redirect back to the index page
+        return redirect(url_for('index'))
+
+    if not selected_models:
+        # No models selected, redirect back to the index page
+        return redirect(url_for('index'))
 
-    # Use url_for with _scheme and _external to ensure proper redirection
-    results_url = url_for('results')
-    print(f"Redirecting to: {results_url}")
-    return redirect(results_url)
+    uploads = get_session_uploads()
+    touch_uploads(force=True)
+
+    # Serve repeat requests from the completion cache unless the user asked to bypass it
+    cache_keys = {}
+    cached_responses = {}
+    if app.config['COMPLETION_CACHE_ENABLED']:
+        document_hashes = [f"{upload.get('hash') or file_sha256(upload['path'])}:"
+                           f"{upload.get('representation', REPRESENTATION_FULL)}" for upload in uploads]
+        for model in selected_models:
+            cache_keys[model] = CompletionCache.key(model, DEFAULT_TEMPERATURE, DEFAULT_MAX_TOKENS,
+                                                    DEFAULT_SYSTEM_PROMPT, prompt, document_hashes)
+            if not request.form.get('bypass_cache'):
+                cached = completion_cache.get(cache_keys[model])
+                if cached is not None:
+                    cached_responses[model] = cached
+                    logger.info(f"Using cached response for {model}")
+    uncached_models = [model for model in selected_models if model not in cached_responses]
+
+    # Get uploaded files content and images. Cached responses still need the documents,
+    # for any follow-up questions; images are only prepared if a model has to be called
+    files_content = load_documents(uploads)
+    images = image_refs(uploads)
+    prepared_images = load_images(images) if uncached_models else []
+
+    # Fit the documents into each model's token budget, keeping only the most
+    # relevant chunks when they are too large to send whole. The documents are sent as a
+    # message of their own ahead of the prompt, and kept for any follow-up questions
+    documents_key = tuple(file_info['hash'] for file_info in files_content)
+    contexts = {}
+    request_tokens = {}
+    oversized = {}
+    for model in selected_models:
+        with span('prompt_assembly', model):
+            documents = fit_documents(prompt, files_content,
+                                      model_registry.budget(model, app.config['DEFAULT_DOCUMENT_TOKEN_BUDGET']),
+                                      documents_key, chunk_tokens=app.config['RETRIEVAL_CHUNK_TOKENS'])
+            # Check the request fits the model's context window before sending it
+            contexts[model], request_tokens[model], error = fit_context_window(
+                model, prompt, documents, [image['filename'] for image in images], prepared_images)
+        if error and model not in cached_responses:
+            oversized[model] = f"Error: {error}"
+
+        # Log the context length
+        logger.info(f"Document context length for {model}: {len(contexts[model])} characters, "
+                    f"about {request_tokens[model]} request tokens")
+
+    # Models the request cannot fit are answered with the error instead of being called
+    uncached_models = [model for model in uncached_models if model not in oversized]
+
+    # Streamed responses are sent to the results page by stream_response. Models that would
+    # have to queue for their rate limit are streamed too, so the page can show the queue position
+    if request.form.get('stream') or app.config['ASYNC_COMPLETIONS']:
+        streamed_models = uncached_models
+    else:
+        streamed_models = [model for model in uncached_models if rate_limiter.would_wait(
+            model, request_tokens[model])]
+    if streamed_models:
+        logger.info(f"Streaming responses from: {', '.join(streamed_models)}")
+
+    # Get responses from the other uncached models concurrently
+    fresh_responses = {}
+    waiting_models = [model for model in uncached_models if model not in streamed_models]
+    if waiting_models:
+        fresh_responses = fan_out_completions(openai_client, {model: prompt for model in waiting_models},
+                                              model_timeout=app.config['MODEL_TIMEOUT'],
+                                              deadline=app.config['REQUEST_DEADLINE'],
+                                              max_workers=app.config['MODEL_DISPATCH_WORKERS'],
+                                              images=prepared_images,
+                                              histories={model: context_messages(contexts[model])
+                                                         for model in waiting_models})
+    for model, response in fresh_responses.items():
+        logger.info(f"Got response from {model}, length: {len(response)} characters")
+        if model in cache_keys:
+            completion_cache.set(cache_keys[model], response)
+
+    # Store the run, keeping only its ID in the session
+    responses = {**oversized, **fresh_responses, **cached_responses}
+    run_id = result_store.create_run(get_owner_id(), prompt, [
+        {'model': model, 'pending_prompt': prompt, 'cache_key': cache_keys.get(model),
+         'context': contexts[model], 'context_images': images}
+        if model in streamed_models else
+        {'model': model, 'response': responses.get(model),
+         'cached': model in cached_responses, 'context': contexts[model], 'context_images': images}
+        for model in selected_models
+    ])
+    session['last_run_id'] = run_id
+    logger.info(f"Stored run {run_id} with responses: {', '.join(selected_models)}")
+
+    return redirect(url_for('run_results', run_id=run_id))
 
 
 @app.route('/results')
 def results():
-    # Get responses and prompt from session
-    responses = session.get('responses', {})
-    prompt = session.get('prompt', '')
+    # Show the latest run from this session
+    run_id = session.get('last_run_id')
+    if not run_id:
+        logger.info("No results found in session, redirecting to index")
+        return redirect(url_for('index'))
+    return redirect(url_for('run_results', run_id=run_id))
 
-    print(f"Results route - found prompt: {bool(prompt)}, responses: {list(responses.keys()) if responses else 'None'}")
 
-    if not responses:
-        print("No responses found in session, redirecting to index")
-        return redirect(url_for('index'))
+@app.route('/results/<run_id>')
+def run_results(run_id):
+    run = result_store.get_run(run_id)
 
-    # Get model display names
-    model_names = {
-        'gpt-4o': 'GPT-4o',
-        'gpt-4o-mini': 'GPT-4o Mini'
-    }
+    if run is None:
+        logger.info(f"Run {run_id} not found or expired, redirecting to index")
+        return redirect(url_for('index'))
+    if run['owner'] != get_owner_id():
+        logger.info(f"Run {run_id} is not owned by this session")
+        abort(404)
 
-    # Format responses for template
+    # Format responses for template. Only one turn of a conversation can be unfinished at a time,
+    # and it is the one the model's stream URL serves. A turn already streaming is replayed from
+    # the start by the stream, so its partial text is not shown here
     formatted_responses = []
-    for model_id, response in responses.items():
+    for response in run['responses']:
+        model_id = response['model']
+        stream_url = url_for('stream_response', run_id=run_id, model=model_id)
+        followups = [{
+            'prompt': followup['prompt'],
+            'response': '' if followup['status'] in UNFINISHED else followup['response'],
+            'stream_url': stream_url if followup['status'] in UNFINISHED else None
+        } for followup in response['followups']]
+        pending = response['status'] in UNFINISHED
         formatted_responses.append({
             'model_id': model_id,
-            'model_name': model_names.get(model_id, model_id),
-            'response': response
+            'model_name': model_registry.name(model_id),
+            'response': '' if pending else response['response'],
+            'cached': bool(response['cached']),
+            'stream_url': stream_url if pending else None,
+            'followups': followups,
+            'answering': pending or any(followup['stream_url'] for followup in followups),
+            'followup_url': url_for('followup', run_id=run_id, model=model_id)
         })
 
-    print(f"Rendering results template with {len(formatted_responses)} responses")
     return render_template('results.html',
-                           prompt=prompt,
+                           prompt=run['prompt'],
                            responses=formatted_responses,
                            single_response=len(formatted_responses) == 1,
                            is_connect=app.config['IS_CONNECT'])
 
 
+@app.route('/results/<run_id>/<model>/followup', methods=['POST'])
+def followup(run_id, model):
+    """Continue a model's conversation with a follow-up prompt, streamed to the results page"""
+    prompt = request.form.get('prompt', '').strip()
+    run = result_store.get_run(run_id)
+    if run is None or run['owner'] != get_owner_id():
+        logger.info(f"Run {run_id} not found or not owned by this session, redirecting to index")
+        return redirect(url_for('index'))
+
+    if prompt:
+        turn = result_store.add_followup(run_id, model, prompt)
+        if turn is None:
+            logger.info(f"Ignoring follow-up for {model} in run {run_id}: a response is still pending")
+        else:
+            logger.info(f"Follow-up {turn} for {model} in run {run_id}", extra={'prompt_characters': len(prompt)})
+
+    return redirect(url_for('run_results', run_id=run_id, _anchor=f"conversation-{model}"))
+
+
+@app.route('/history')
+def history():
+    """List the prompts this session has submitted"""
+    runs = result_store.list_runs(get_owner_id())
+    for run in runs:
+        run['created'] = datetime.datetime.fromtimestamp(run['created_at'])
+    return render_template('history.html', runs=runs, is_connect=app.config['IS_CONNECT'])
+
+
+def sse_event(data, event=None):
+    """Format a Server-Sent Event carrying a JSON payload"""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+def follow_stream(run_id, model, turn):
+    """
+    Relay a response that another request is streaming, from the progress it saves
+
+    Yields:
+        str: Server-Sent Events, as stream_response sends them
+    """
+    sent = 0
+    while True:
+        progress = result_store.get_progress(run_id, model, turn)
+        if progress is None:
+            yield sse_event({'error': 'No prompt is waiting for this model'}, event='error')
+            return
+        if len(progress['response']) > sent:
+            yield sse_event({'delta': progress['response'][sent:]})
+            sent = len(progress['response'])
+        if progress['status'] == STATUS_COMPLETE:
+            yield sse_event({}, event='done')
+            return
+        if (progress['status'] == STATUS_PENDING
+                or time.time() - progress['updated_at'] > app.config['STREAM_CLAIM_TIMEOUT']):
+            yield sse_event({'error': 'Error: the response was interrupted, reload the page to try again'},
+                            event='error')
+            return
+        time.sleep(STREAM_PROGRESS_INTERVAL)
+
+
+@app.route('/stream/<run_id>/<model>')
+def stream_response(run_id, model):
+    """Stream one model's response to the results page as Server-Sent Events"""
+    if result_store.get_owner(run_id) != get_owner_id():
+        return Response(sse_event({'error': 'Run not found'}, event='error'), status=404,
+                        mimetype='text/event-stream')
+    pending = result_store.claim_pending(run_id, model, stale_after=app.config['STREAM_CLAIM_TIMEOUT'])
+    if pending is None:
+        return Response(sse_event({'error': 'No prompt is waiting for this model'}, event='error'),
+                        mimetype='text/event-stream')
+    if not pending['claimed']:
+        # Another tab or an earlier load of the page is already generating this response
+        logger.info(f"Following the stream of {model} in run {run_id} started by another request")
+        return Response(stream_with_context(follow_stream(run_id, model, pending['turn'])),
+                        mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    def generate():
+        # The body is sent after the request handler returns, so carry the request ID over
+        request_id_var.set(g.request_id)
+        parts = []
+        saved_at = time.monotonic()
+        finished = False
+        try:
+            prompt, history, images, tokens = pending_request(pending, model)
+            for state in rate_limiter.wait_turn(model, tokens, timeout=app.config['RATE_LIMIT_QUEUE_TIMEOUT']):
+                # Saving marks the claim as alive while it waits in the queue
+                result_store.save_progress(run_id, model, pending['turn'], '')
+                yield sse_event(state, event='queue')
+            for delta in openai_client.stream_completion(prompt, model, timeout=app.config['MODEL_TIMEOUT'],
+                                                         images=images, history=history):
+                parts.append(delta)
+                if time.monotonic() - saved_at >= STREAM_PROGRESS_INTERVAL:
+                    result_store.save_progress(run_id, model, pending['turn'], ''.join(parts))
+                    saved_at = time.monotonic()
+                yield sse_event({'delta': delta})
+            response = ''.join(parts)
+            logger.info(f"Streamed response from {model}, length: {len(response)} characters")
+            result_store.complete_response(run_id, model, response, pending['turn'])
+            finished = True
+            if pending['cache_key']:
+                completion_cache.set(pending['cache_key'], response)
+            yield sse_event({}, event='done')
+        except RateLimitTimeout as e:
+            # Nothing was sent to the model, so the claim is released and reloading the page tries again
+            logger.warning(str(e))
+            yield sse_event({'error': f"{model_registry.name(model)} is rate limited right now, "
+                                      f"reload the page to try again"}, event='error')
+        except Exception as e:
+            logger.error(f"Error from OpenAI API ({model}): {str(e)}")
+            result_store.complete_response(run_id, model, ''.join(parts) + f"Error: {str(e)}", pending['turn'])
+            finished = True
+            yield sse_event({'error': f"Error: {str(e)}"}, event='error')
+        finally:
+            if not finished:
+                # The browser went away part way through; the next load of the page starts again
+                result_store.release(run_id, model, pending['turn'])
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def build_batch_tasks(mode, prompt, prompts, models, uploads):
+    """
+    Turn a batch submission into one task per model and document (or prompt)
+
+    Returns:
+        tuple: (job name, list of task dicts)
+    """
+    budgets = {model_id: model_registry.budget(model_id, app.config['DEFAULT_DOCUMENT_TOKEN_BUDGET'])
+               for model_id in model_registry.ids()}
+    chunk_tokens = app.config['RETRIEVAL_CHUNK_TOKENS']
+    documents = load_documents(uploads)
+    tasks = []
+
+    if mode == MODE_EACH_DOCUMENT:
+        # The same prompt against each document on its own
+        for document in documents:
+            for model in models:
+                fitted = fit_documents(prompt, [document], budgets[model], (document['hash'],), chunk_tokens)
+                tasks.append({'label': document['filename'], 'model': model,
+                              'prompt': build_combined_prompt(prompt, fitted)})
+        return f"{prompt[:80]} ({len(documents)} documents)", tasks
+
+    # Each prompt against all of the documents
+    documents_key = tuple(document['hash'] for document in documents)
+    for item in prompts:
+        for model in models:
+            fitted = fit_documents(item, documents, budgets[model], documents_key, chunk_tokens)
+            tasks.append({'label': item, 'model': model, 'prompt': build_combined_prompt(item, fitted)})
+    return f"{len(prompts)} prompts", tasks
+
+
+def render_batch_page(error=None):
+    """Show the batch form and this session's jobs, with an error from a rejected submission"""
+    return render_template('batch.html', jobs=batch_queue.list_jobs(get_owner_id()),
+                           uploads=refresh_upload_statuses(), models=list(model_registry), error=error,
+                           is_connect=app.config['IS_CONNECT'])
+
+
+@app.route('/batch', methods=['GET', 'POST'])
+def batch():
+    """Submit a batch job, or list this session's jobs"""
+    if request.method == 'GET':
+        return render_batch_page()
+
+    # Accept JSON for scripted submissions as well as the form
+    data = request.get_json(silent=True) or {}
+    is_api = request.is_json
+    form = data if is_api else request.form
+    mode = form.get('mode', MODE_EACH_DOCUMENT)
+    prompt = (form.get('prompt') or '').strip()
+    models = data.get('models', []) if is_api else request.form.getlist('modelComparison')
+
+    prompts = []
+    if mode == MODE_PROMPT_LIST:
+        if is_api:
+            prompts = [item.strip() for item in data.get('prompts', []) if item and item.strip()]
+        elif request.files.get('prompts'):
+            prompts = read_prompt_list(request.files['prompts'].read())
+
+    uploads = get_session_uploads()
+    documents = [upload for upload in uploads if not is_image(upload)]
+    error = None
+    if mode not in (MODE_EACH_DOCUMENT, MODE_PROMPT_LIST):
+        error = f"Unknown batch mode: {mode}"
+    elif not models or not all(model in model_registry for model in models):
+        error = "Select at least one available model"
+    elif mode == MODE_EACH_DOCUMENT and (not prompt or not uploads):
+        error = "Enter a prompt and upload the documents to run it against"
+    elif mode == MODE_EACH_DOCUMENT and not documents:
+        error = "Batch jobs are not run against images, upload a document to run the prompt against"
+    elif mode == MODE_PROMPT_LIST and not prompts:
+        error = "Provide a list of prompts"
+    elif len(models) * (len(documents) if mode == MODE_EACH_DOCUMENT else len(prompts)) > app.config['BATCH_MAX_TASKS']:
+        error = f"Batch jobs are limited to {app.config['BATCH_MAX_TASKS']} requests"
+
+    if error:
+        logger.warning(f"Rejected batch job: {error}")
+        if is_api:
+            return jsonify({'error': error}), 400
+        return render_batch_page(error), 400
+
+    touch_uploads(force=True)
+    name, tasks = build_batch_tasks(mode, prompt, prompts, models, uploads)
+    job_id = batch_queue.create_job(get_owner_id(), name, mode, tasks)
+
+    if is_api:
+        return jsonify(batch_queue.get_job(job_id)), 202
+    return redirect(url_for('batch_job', job_id=job_id))
+
+
+def get_owned_job(job_id):
+    """Load a batch job if it belongs to this session"""
+    job = batch_queue.get_job(job_id)
+    if job is None or job['owner'] != get_owner_id():
+        return None
+    return job
+
+
+@app.route('/batch/<job_id>')
+def batch_job(job_id):
+    """Progress and results so far for a batch job"""
+    job = get_owned_job(job_id)
+    if job is None:
+        return redirect(url_for('batch'))
+    return render_template('batch_job.html', job=job, tasks=batch_queue.get_tasks(job_id),
+                           is_connect=app.config['IS_CONNECT'])
+
+
+@app.route('/batch/<job_id>/status')
+def batch_status(job_id):
+    """Progress of a batch job, optionally with a page of its results"""
+    job = get_owned_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if request.args.get('tasks'):
+        job['tasks'] = batch_queue.get_tasks(job_id, limit=request.args.get('limit', 100, type=int),
+                                             offset=request.args.get('offset', 0, type=int))
+    return jsonify(job)
+
+
+@app.route('/batch/<job_id>/download/<fmt>')
+def batch_download(job_id, fmt):
+    """Download a batch job's results as CSV or JSON Lines"""
+    job = get_owned_job(job_id)
+    if job is None or fmt not in ('csv', 'jsonl'):
+        return redirect(url_for('batch'))
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(export_tasks(batch_queue.get_tasks(job_id), fmt), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=batch-{job_id}.{fmt}'})
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for this process"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/debug')
 def debug_info():
     """Debug route to show configuration information"""
@@ -262,9 +1009,15 @@ def debug_info():
         'URL_MAP': str(app.url_map),
         'SESSION_COOKIE_PATH': app.config.get('SESSION_COOKIE_PATH', 'Not set'),
         'SESSION_TYPE': app.config.get('SESSION_TYPE', 'Not set'),
+        'PARSE_CACHE': parse_cache.stats(),
+        'IMAGE_CACHE': image_cache.stats(),
+        'CACHE_HIT_RATES': cache_hit_rates(),
+        'RATE_LIMITS': rate_limiter.status(),
+        'ROUTING': routing.status(),
+        'UPLOAD_STORAGE': blob_store.usage(),
+        'COMPLETION_CACHE': completion_cache.stats() if app.config['COMPLETION_CACHE_ENABLED'] else 'Disabled',
         'SESSION_DATA': {
-            'has_prompt': 'prompt' in session,
-            'has_responses': 'responses' in session,
+            'last_run_id': session.get('last_run_id'),
             'session_keys': list(session.keys())
         }
     }
@@ -290,9 +1043,30 @@ def before_request():
     g.current_year = datetime.datetime.now().year
 
 
+@app.route('/assets/<path:filename>')
+def static_asset(filename):
+    """Serve a fingerprinted static asset, precompressed if the browser accepts it and cacheable for good"""
+    variant = static_assets.variant(filename, request.accept_encodings)
+    if variant is None:
+        abort(404)
+    name, encoding = variant
+
+    response = send_from_directory(static_assets.build_folder, name, mimetype=mimetypes.guess_type(filename)[0])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # The name changes whenever the content does, so the response never needs revalidating
+    response.headers['Cache-Control'] = f"public, max-age={app.config['STATIC_MAX_AGE']}, immutable"
+    return response
+
+
 @app.context_processor
 def utility_processor():
     def url_for_static(filename):
+        # Fingerprinted assets where there is one, otherwise the plain static route
+        fingerprinted = static_assets.url_path(filename)
+        if fingerprinted:
+            return url_for('static_asset', filename=fingerprinted)
         return url_for('static', filename=filename)
 
     return dict(url_for_static=url_for_static)
@@ -300,8 +1074,9 @@ def utility_processor():
 
 @app.template_filter('nl2br')
 def nl2br(value):
-    # Convert newlines to <br> tags for displaying multiline text
-    return value.replace('\n', '<br>')
+    # Convert newlines to <br> tags for displaying multiline text, escaping the text itself
+    # so markup in a model's response is shown rather than rendered
+    return escape(value).replace('\n', Markup('<br>'))
 
 
 if __name__ == '__main__':
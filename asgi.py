@@ -0,0 +1,210 @@
+"""
+ASGI entry point for the application.
+
+Serves the Flask app through a thread pool, except the response streaming
+endpoint, which runs natively on the event loop with an async OpenAI client.
+Every model call is handed to that endpoint, so waiting on the API holds an
+open connection but no worker thread:
+
+    uvicorn asgi:application --host 0.0.0.0 --port 8000
+"""
+import re
+import time
+import uuid
+import asyncio
+import logging
+from asgiref.wsgi import WsgiToAsgiInstance
+from asgiref.sync import sync_to_async
+from flask import session
+from app import (app, result_store, completion_cache, rate_limiter, model_registry, routing, sse_event,
+                 pending_request, STREAM_PROGRESS_INTERVAL)
+from utils.async_openai_client import AsyncOpenAIClient
+from utils.metrics import request_id_var, REQUEST_SECONDS
+from utils.rate_limiter import RateLimitTimeout
+from utils.result_store import STATUS_PENDING, STATUS_COMPLETE
+
+logger = logging.getLogger(__name__)
+
+app.config['ASYNC_COMPLETIONS'] = True
+
+STREAM_PATH = re.compile(r'^/stream/([^/]+)/([^/]+)$')
+
+SSE_HEADERS = [(b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+               (b'x-accel-buffering', b'no')]
+
+async_client = AsyncOpenAIClient(api_key=app.config['OPENAI_API_KEY'],
+                                 api_url=app.config['OPENAI_API_URL'],
+                                 pool_size=app.config['OPENAI_ASYNC_POOL_SIZE'],
+                                 connect_timeout=app.config['OPENAI_CONNECT_TIMEOUT'],
+                                 read_timeout=app.config['OPENAI_READ_TIMEOUT'],
+                                 max_retries=app.config['OPENAI_MAX_RETRIES'],
+                                 backoff_base=app.config['OPENAI_BACKOFF_BASE'],
+                                 backoff_max=app.config['OPENAI_BACKOFF_MAX'],
+                                 rate_limiter=rate_limiter,
+                                 queue_timeout=app.config['RATE_LIMIT_QUEUE_TIMEOUT'],
+                                 fallback_api_url=app.config['OPENAI_FALLBACK_API_URL'],
+                                 fallback_api_key=app.config['OPENAI_FALLBACK_API_KEY'],
+                                 models=model_registry,
+                                 routing=routing)
+
+
+class ThreadPoolWsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs WSGI apps on a single shared thread by default; use the
+    # event loop's thread pool so requests are handled concurrently
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False)
+
+
+def session_owner(cookie):
+    """
+    Read the owner ID from the Flask session a Cookie header refers to, without starting a session
+
+    Args:
+        cookie (str): The request's Cookie header
+
+    Returns:
+        str: Owner ID, or None if the request has no session yet
+    """
+    with app.test_request_context(headers={'Cookie': cookie}):
+        return session.get('owner_id')
+
+
+async def follow_stream(send_event, run_id, model, turn):
+    """
+    Relay a response that another request is streaming, as app.follow_stream does
+
+    Args:
+        send_event (callable): Sends one Server-Sent Event
+        run_id (str): Run ID
+        model (str): Model ID
+        turn (int): Conversation turn being streamed
+    """
+    sent = 0
+    while True:
+        progress = await asyncio.to_thread(result_store.get_progress, run_id, model, turn)
+        if progress is None:
+            await send_event({'error': 'No prompt is waiting for this model'}, event='error')
+            return
+        if len(progress['response']) > sent:
+            await send_event({'delta': progress['response'][sent:]})
+            sent = len(progress['response'])
+        if progress['status'] == STATUS_COMPLETE:
+            await send_event({}, event='done')
+            return
+        if (progress['status'] == STATUS_PENDING
+                or time.time() - progress['updated_at'] > app.config['STREAM_CLAIM_TIMEOUT']):
+            await send_event({'error': 'Error: the response was interrupted, reload the page to try again'},
+                             event='error')
+            return
+        await asyncio.sleep(STREAM_PROGRESS_INTERVAL)
+
+
+async def stream_response(scope, send, run_id, model):
+    """
+    Stream one model's response as Server-Sent Events, as app.stream_response does
+
+    Args:
+        scope (dict): ASGI connection scope
+        send (callable): ASGI send function
+        run_id (str): Run ID
+        model (str): Model ID
+    """
+    started = time.perf_counter()
+    headers = dict(scope['headers'])
+    request_id = headers.get(b'x-request-id', b'').decode('latin-1') or uuid.uuid4().hex
+    request_id_var.set(request_id)
+
+    owner = await asyncio.to_thread(session_owner, headers.get(b'cookie', b'').decode('latin-1'))
+    if owner is None or owner != await asyncio.to_thread(result_store.get_owner, run_id):
+        await send({'type': 'http.response.start', 'status': 404,
+                    'headers': SSE_HEADERS + [(b'x-request-id', request_id.encode('latin-1'))]})
+        await send({'type': 'http.response.body',
+                    'body': sse_event({'error': 'Run not found'}, event='error').encode('utf-8')})
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint='stream_response', method='GET',
+                                status=404)
+        return
+
+    async def send_event(data, event=None):
+        await send({'type': 'http.response.body', 'body': sse_event(data, event).encode('utf-8'),
+                    'more_body': True})
+
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': SSE_HEADERS + [(b'x-request-id', request_id.encode('latin-1'))]})
+    try:
+        pending = await asyncio.to_thread(result_store.claim_pending, run_id, model,
+                                          stale_after=app.config['STREAM_CLAIM_TIMEOUT'])
+        if pending is None:
+            await send_event({'error': 'No prompt is waiting for this model'}, event='error')
+            return
+        if not pending['claimed']:
+            # Another tab or an earlier load of the page is already generating this response
+            logger.info(f"Following the stream of {model} in run {run_id} started by another request")
+            await follow_stream(send_event, run_id, model, pending['turn'])
+            return
+
+        # The response is finished and stored even if the browser goes away part way through
+        parts = []
+        saved_at = time.monotonic()
+        try:
+            prompt, history, images, tokens = await asyncio.to_thread(pending_request, pending, model)
+            async for state in rate_limiter.wait_turn_async(model, tokens,
+                                                            timeout=app.config['RATE_LIMIT_QUEUE_TIMEOUT']):
+                # Saving marks the claim as alive while it waits in the queue
+                await asyncio.to_thread(result_store.save_progress, run_id, model, pending['turn'], '')
+                await send_event(state, event='queue')
+            async for delta in async_client.stream_completion(prompt, model, timeout=app.config['MODEL_TIMEOUT'],
+                                                              images=images, history=history):
+                parts.append(delta)
+                if time.monotonic() - saved_at >= STREAM_PROGRESS_INTERVAL:
+                    await asyncio.to_thread(result_store.save_progress, run_id, model, pending['turn'],
+                                            ''.join(parts))
+                    saved_at = time.monotonic()
+                await send_event({'delta': delta})
+            response = ''.join(parts)
+            logger.info(f"Streamed response from {model}, length: {len(response)} characters")
+            await asyncio.to_thread(result_store.complete_response, run_id, model, response, pending['turn'])
+            if pending['cache_key']:
+                await asyncio.to_thread(completion_cache.set, pending['cache_key'], response)
+            await send_event({}, event='done')
+        except RateLimitTimeout as e:
+            # Nothing was sent to the model, so the claim is released and reloading the page tries again
+            logger.warning(str(e))
+            await asyncio.to_thread(result_store.release, run_id, model, pending['turn'])
+            await send_event({'error': f"{model_registry.name(model)} is rate limited right now, "
+                                       f"reload the page to try again"}, event='error')
+        except Exception as e:
+            logger.error(f"Error from OpenAI API ({model}): {str(e)}")
+            await asyncio.to_thread(result_store.complete_response, run_id, model,
+                                    ''.join(parts) + f"Error: {str(e)}", pending['turn'])
+            await send_event({'error': f"Error: {str(e)}"}, event='error')
+    finally:
+        await send({'type': 'http.response.body', 'body': b''})
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint='stream_response', method='GET',
+                                status=200)
+
+
+async def lifespan(receive, send):
+    """Close the API connection pool when the server shuts down"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_client.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI application: the streaming endpoint natively, everything else through Flask"""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        prefix = app.config['SUBDIRECTORY_PATH']
+        path = scope['path']
+        if path.startswith(prefix):
+            match = STREAM_PATH.match(path[len(prefix):])
+            if match:
+                return await stream_response(scope, send, *match.groups())
+
+    await ThreadPoolWsgiInstance(app)(scope, receive, send)
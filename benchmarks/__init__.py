@@ -0,0 +1,3 @@
+"""
+Benchmarks and load tests. Run each module with ``python -m benchmarks.<name> --help``.
+"""
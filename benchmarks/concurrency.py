@@ -0,0 +1,220 @@
+"""
+Concurrent-user capacity of the WSGI and ASGI entry points while users wait on the model
+
+    python -m benchmarks.concurrency --users 8 32 128 --threads 8 --latency 2
+
+Each simulated user submits a prompt, opens the results page and reads every
+streamed response, ``--iterations`` times. The WSGI app is served with a fixed
+pool of ``--threads`` worker threads, as on Posit Connect or gunicorn, and
+waits for the model inside /submit (or inside each stream with ``--stream``).
+The ASGI app is served by uvicorn from asgi.py. Both run in their own process
+against the same mock OpenAI server, so a user that is still waiting when
+``--timeout`` expires counts as an error rather than a slow success.
+"""
+import os
+import re
+import sys
+import time
+import socket
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+import requests  # noqa: E402
+
+from benchmarks.report import percentiles, save_results  # noqa: E402
+from mock_openai_server import make_server as make_mock_server  # noqa: E402
+
+STREAM_URL_PATTERN = re.compile(r'data-stream-url="([^"]+)"')
+
+
+def serve_wsgi(port, threads):
+    """Serve the Flask app with a fixed pool of worker threads (runs in the server process)"""
+    from werkzeug.serving import BaseWSGIServer
+    from app import app
+
+    class PooledWSGIServer(BaseWSGIServer):
+        request_queue_size = 1024
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.pool = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.process_request_thread, request, client_address)
+
+        def process_request_thread(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    PooledWSGIServer('127.0.0.1', port, app).serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(target, work_dir, mock_url, threads):
+    """
+    Start the app in a child process and wait until it answers
+
+    Args:
+        target (str): 'wsgi' or 'asgi'
+        work_dir (str): Directory for the app's storage
+        mock_url (str): Completions URL of the mock API
+        threads (int): Worker threads for the WSGI server
+
+    Returns:
+        tuple: The process and the app's base URL
+    """
+    port = free_port()
+    env = dict(os.environ, **{
+        'OPENAI_API_KEY': 'benchmark',
+        'OPENAI_API_URL': mock_url,
+        'UPLOAD_FOLDER': os.path.join(work_dir, 'uploads'),
+        'PARSE_CACHE_DIR': os.path.join(work_dir, 'cache', 'parsed'),
+        'COMPLETION_CACHE_DIR': os.path.join(work_dir, 'cache', 'completions'),
+        'RESULT_DB_PATH': os.path.join(work_dir, 'data', 'results.sqlite3'),
+        'BATCH_DB_PATH': os.path.join(work_dir, 'data', 'batch.sqlite3'),
+        'RATE_LIMIT_DB_PATH': os.path.join(work_dir, 'data', 'rate_limits.sqlite3'),
+        'IMAGE_CACHE_DIR': os.path.join(work_dir, 'cache', 'images'),
+        'STATIC_BUILD_DIR': os.path.join(work_dir, 'cache', 'static'),
+        'SESSION_FILE_DIR': os.path.join(work_dir, 'flask_session'),
+        # Measure the app, not the per-model rate limits (see benchmarks/README.md)
+        'GPT_4O_RPM': '0',
+        'GPT_4O_TPM': '0',
+        'GPT_4O_MINI_RPM': '0',
+        'GPT_4O_MINI_TPM': '0',
+        'BATCH_WORKERS': '0',
+        'LOG_FORMAT': 'text',
+    })
+    if target == 'wsgi':
+        command = [sys.executable, '-m', 'benchmarks.concurrency', '--serve-wsgi', str(port),
+                   '--threads', str(threads)]
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(port),
+                   '--log-level', 'warning', '--no-access-log', '--backlog', '1024']
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    from config import Config
+    base_url = f"http://127.0.0.1:{port}{Config.SUBDIRECTORY_PATH}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(base_url + '/', timeout=1)
+            return process, base_url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{target} server did not start")
+
+
+def run_user(base_url, iterations, models, stream, timeout, timings, errors):
+    """Simulate one user: submit a prompt and read every response, ``iterations`` times"""
+    session = requests.Session()
+    for iteration in range(iterations):
+        started = time.perf_counter()
+        try:
+            form = {'prompt': f"Summarise the outlook ({iteration}, {started})", 'modelComparison': models}
+            if stream:
+                form['stream'] = '1'
+            response = session.post(f"{base_url}/submit", data=form, allow_redirects=False, timeout=timeout)
+            response.raise_for_status()
+            response = session.get(requests.compat.urljoin(base_url + '/', response.headers['Location']),
+                                   timeout=timeout)
+            response.raise_for_status()
+            # The results page opens every model's stream at once, as a browser would
+            stream_urls = [requests.compat.urljoin(base_url + '/', url.replace('&amp;', '&'))
+                           for url in STREAM_URL_PATTERN.findall(response.text)]
+            if stream_urls:
+                with ThreadPoolExecutor(max_workers=len(stream_urls)) as streams:
+                    bodies = list(streams.map(lambda url: session.get(url, timeout=timeout).text, stream_urls))
+                for url, body in zip(stream_urls, bodies):
+                    if 'event: error' in body:
+                        raise Exception(f"stream error from {url}")
+            timings.append(time.perf_counter() - started)
+        except Exception as e:
+            errors.append(str(e))
+
+
+def measure(base_url, users, args):
+    """Run ``users`` concurrent users and summarise how they fared"""
+    timings, errors = [], []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        for _ in range(users):
+            executor.submit(run_user, base_url, args.iterations, args.models, args.stream, args.timeout,
+                            timings, errors)
+    elapsed = time.perf_counter() - started
+    return {
+        'users': users,
+        'completed': len(timings),
+        'errors': len(errors),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_per_second': round(len(timings) / elapsed, 3) if elapsed else 0,
+        'latency_seconds': {name: round(value, 4) for name, value in percentiles(timings).items()},
+        'first_error': errors[0] if errors else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, nargs='+', default=[8, 32, 128], help='concurrent users to try')
+    parser.add_argument('--iterations', type=int, default=2, help='submit/results cycles per user')
+    parser.add_argument('--targets', nargs='+', default=['wsgi', 'asgi'], choices=['wsgi', 'asgi'])
+    parser.add_argument('--threads', type=int, default=8, help='worker threads for the WSGI server')
+    parser.add_argument('--models', nargs='+', default=['gpt-4o', 'gpt-4o-mini'])
+    parser.add_argument('--stream', action='store_true', help='stream responses under WSGI too')
+    parser.add_argument('--latency', type=float, default=2.0, help='mock API latency in seconds')
+    parser.add_argument('--token-delay', type=float, default=0.01, help='mock API delay between streamed chunks')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds a user waits for each request')
+    parser.add_argument('--output', help='path for the JSON results')
+    parser.add_argument('--serve-wsgi', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_wsgi:
+        return serve_wsgi(args.serve_wsgi, args.threads)
+
+    mock = make_mock_server(port=0, latency=args.latency, token_delay=args.token_delay)
+    threading.Thread(target=mock.serve_forever, daemon=True).start()
+    mock_url = f"http://127.0.0.1:{mock.server_port}/v1/chat/completions"
+
+    results = {'config': {key: value for key, value in vars(args).items() if key not in ('output', 'serve_wsgi')},
+               'targets': {}}
+    for target in args.targets:
+        work_dir = tempfile.mkdtemp(prefix=f'genai-{target}-')
+        process, base_url = start_server(target, work_dir, mock_url, args.threads)
+        try:
+            results['targets'][target] = [measure(base_url, users, args) for users in args.users]
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    for target, runs in results['targets'].items():
+        print(target)
+        for run in runs:
+            latency = run['latency_seconds']
+            print(f"  {run['users']:>5} users: {run['completed']:>5} done, {run['errors']:>4} errors, "
+                  f"{run['throughput_per_second']:>7.2f}/s, p50 {latency.get('p50', 0):6.2f}s, "
+                  f"p95 {latency.get('p95', 0):6.2f}s")
+    print(f"Results saved to {save_results('concurrency', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
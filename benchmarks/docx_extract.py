@@ -0,0 +1,102 @@
+"""
+Wall time and peak memory of the streaming DOCX extractor against python-docx
+
+    python -m benchmarks.docx_extract --sizes medium large --repeat 3
+
+Each engine parses each document in a fresh interpreter, so the peak
+resident memory it reports is its own: the high-water mark after parsing,
+less the memory in use once its libraries were imported.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.generators import generate, SIZES  # noqa: E402
+from benchmarks.report import peak_rss_mb, save_results, RESULTS_DIR  # noqa: E402
+
+ENGINES = ['python-docx', 'streaming']
+
+
+def parse_python_docx(file_path):
+    """The previous parse_docx: every body paragraph through python-docx's object model"""
+    from docx import Document
+
+    document = Document(file_path)
+    return '\n'.join(para.text for para in document.paragraphs)
+
+
+def run_engine(engine, path, repeat):
+    """
+    Parse a document repeatedly with one engine (runs in the child process)
+
+    Returns:
+        dict: Timings in seconds, output size and peak memory growth in megabytes
+    """
+    # Import the engine's libraries before taking the baseline
+    if engine == 'python-docx':
+        import docx  # noqa: F401
+        parse = parse_python_docx
+    else:
+        from utils.docx_engine import extract_docx as parse
+
+    baseline = peak_rss_mb()['self']
+    timings = []
+    output = ''
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = parse(path)
+        timings.append(time.perf_counter() - started)
+    return {
+        'min': round(min(timings), 6),
+        'median': round(statistics.median(timings), 6),
+        'output_chars': len(output),
+        'peak_rss_growth_mb': round(peak_rss_mb()['self'] - baseline, 1),
+    }
+
+
+def measure(engine, path, repeat):
+    """Run one engine on one document in a fresh interpreter"""
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.docx_extract', '--child', engine, path,
+                             '--repeat', str(repeat)],
+                            cwd=ROOT, env=dict(os.environ, LOG_FORMAT='text'), capture_output=True, text=True,
+                            check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['medium', 'large'], choices=list(SIZES))
+    parser.add_argument('--engines', nargs='+', default=ENGINES, choices=ENGINES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data-dir', default=os.path.join(RESULTS_DIR, 'documents'),
+                        help='where generated documents are kept between runs')
+    parser.add_argument('--output', help='path for the JSON results')
+    parser.add_argument('--child', nargs=2, metavar=('ENGINE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_engine(*args.child, args.repeat)))
+        return
+
+    results = {}
+    for size in args.sizes:
+        path = generate(args.data_dir, size, ['docx'])['docx']
+        for engine in args.engines:
+            result = dict(measure(engine, path, args.repeat), input_bytes=os.path.getsize(path))
+            results.setdefault(size, {})[engine] = result
+            print(f"{size:<7} {engine:<12} median {result['median'] * 1000:9.1f} ms  "
+                  f"peak +{result['peak_rss_growth_mb']:7.1f} MB  "
+                  f"{result['input_bytes'] / 1024:7.0f} KB in  {result['output_chars'] / 1024:7.0f} K chars out")
+
+    print(f"Results saved to {save_results('docx_extract', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Synthetic documents for benchmarks, in each format the app parses
+"""
+import os
+import csv
+import random
+
+# Parameters for each size; a "unit" is a page, sheet row or paragraph depending on the format
+SIZES = {
+    'small': {'pages': 5, 'paragraphs': 50, 'rows': 500, 'columns': 8},
+    'medium': {'pages': 50, 'paragraphs': 500, 'rows': 20000, 'columns': 12},
+    'large': {'pages': 300, 'paragraphs': 3000, 'rows': 200000, 'columns': 16},
+}
+
+WORDS = ('revenue forecast policy guidance taxpayer return quarter region analysis estimate benefit '
+         'allowance threshold payment liability income review summary adjustment outcome').split()
+
+
+def _sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def make_pdf(path, pages, lines=40, seed=0):
+    """
+    Write a text-only PDF without any PDF library
+
+    Args:
+        path (str): Output path
+        pages (int): Number of pages
+        lines (int): Lines of text per page
+        seed (int): Random seed for the text
+    """
+    rng = random.Random(seed)
+    objects = [b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    font_id = 1
+
+    content_ids = []
+    for _ in range(pages):
+        text = b"BT /F1 10 Tf 50 780 Td 12 TL " + b" ".join(
+            b"(" + _sentence(rng, 10).encode('latin-1') + b") '" for _ in range(lines)) + b" ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(text) + text + b"\nendstream")
+        content_ids.append(len(objects))
+
+    pages_id = len(objects) + pages + 1
+    page_ids = []
+    for content_id in content_ids:
+        objects.append(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, content_id, font_id))
+        page_ids.append(len(objects))
+    objects.append(b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % page_id for page_id in page_ids) +
+                   b"] /Count %d >>" % pages)
+    objects.append(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+    catalog_id = len(objects)
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog_id, xref)
+
+    with open(path, 'wb') as file:
+        file.write(output)
+
+
+def make_docx(path, paragraphs, seed=0):
+    """
+    Write a Word document with a header and footer, headings, paragraphs and a table every 50 paragraphs
+
+    Args:
+        path (str): Output path
+        paragraphs (int): Number of body paragraphs
+        seed (int): Random seed for the text
+    """
+    from docx import Document
+
+    rng = random.Random(seed)
+    document = Document()
+    document.sections[0].header.paragraphs[0].text = _sentence(rng, 6)
+    document.sections[0].footer.paragraphs[0].text = _sentence(rng, 6)
+    for index in range(paragraphs):
+        if index % 20 == 0:
+            document.add_heading(_sentence(rng, 4), level=2)
+        document.add_paragraph(' '.join(_sentence(rng) for _ in range(4)))
+        if index % 50 == 49:
+            table = document.add_table(rows=5, cols=4)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = rng.choice(WORDS)
+    document.save(path)
+
+
+def _row(rng, index, columns):
+    row = [index, rng.choice(WORDS), round(rng.uniform(0, 100000), 2), rng.randint(0, 1000)]
+    while len(row) < columns:
+        row.append(rng.choice(WORDS) if len(row) % 2 else round(rng.gauss(50, 15), 3))
+    return row[:columns]
+
+
+def _header(columns):
+    return ['id', 'category', 'amount', 'count'] + [f'field_{i}' for i in range(4, columns)]
+
+
+def make_csv(path, rows, columns=8, seed=0):
+    """
+    Write a CSV of mixed text and numeric columns
+
+    Args:
+        path (str): Output path
+        rows (int): Number of data rows
+        columns (int): Number of columns (at least 4)
+        seed (int): Random seed for the values
+    """
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(_header(columns))
+        for index in range(rows):
+            writer.writerow(_row(rng, index, columns))
+
+
+def make_xlsx(path, rows, columns=8, sheets=2, seed=0):
+    """
+    Write an Excel workbook, split across sheets, using openpyxl's streaming writer
+
+    Args:
+        path (str): Output path
+        rows (int): Total number of data rows
+        columns (int): Number of columns (at least 4)
+        sheets (int): Number of sheets
+        seed (int): Random seed for the values
+    """
+    from openpyxl import Workbook
+
+    rng = random.Random(seed)
+    workbook = Workbook(write_only=True)
+    for number in range(sheets):
+        sheet = workbook.create_sheet(f'Sheet{number + 1}')
+        sheet.append(_header(columns))
+        for index in range(rows // sheets):
+            sheet.append(_row(rng, index, columns))
+    workbook.save(path)
+
+
+def make_html(path, paragraphs, seed=0):
+    """
+    Write an HTML page with navigation, scripts, styles, tables and body text
+
+    Args:
+        path (str): Output path
+        paragraphs (int): Number of body paragraphs
+        seed (int): Random seed for the text
+    """
+    rng = random.Random(seed)
+    parts = ['<!DOCTYPE html><html><head><title>Benchmark page</title>',
+             '<style>' + 'body { font-family: sans-serif; } ' * 50 + '</style>',
+             '<script>' + 'window.analytics = window.analytics || []; ' * 100 + '</script></head><body>',
+             '<nav><ul>' + ''.join(f'<li><a href="/page{i}">Link {i}</a></li>' for i in range(40)) + '</ul></nav>',
+             '<main>']
+    for index in range(paragraphs):
+        if index % 20 == 0:
+            parts.append(f'<h2>{_sentence(rng, 4)}</h2>')
+        parts.append(f'<p class="body-text">{" ".join(_sentence(rng) for _ in range(4))}</p>')
+        if index % 50 == 49:
+            parts.append('<table>' + ''.join(
+                '<tr>' + ''.join(f'<td>{rng.choice(WORDS)}</td>' for _ in range(4)) + '</tr>' for _ in range(5)) +
+                '</table>')
+    parts.append('</main><footer>' + 'Footer text. ' * 20 + '</footer></body></html>')
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('\n'.join(parts))
+
+
+def generate(directory, size, formats=('pdf', 'docx', 'xlsx', 'csv', 'html')):
+    """
+    Generate one document of each format at a given size, reusing files that already exist
+
+    Args:
+        directory (str): Output directory
+        size (str): 'small', 'medium' or 'large'
+        formats (iterable): File extensions to generate
+
+    Returns:
+        dict: Path of each generated file, keyed by extension
+    """
+    params = SIZES[size]
+    os.makedirs(directory, exist_ok=True)
+    makers = {
+        'pdf': lambda path: make_pdf(path, params['pages']),
+        'docx': lambda path: make_docx(path, params['paragraphs']),
+        'xlsx': lambda path: make_xlsx(path, params['rows'], params['columns']),
+        'csv': lambda path: make_csv(path, params['rows'], params['columns']),
+        'html': lambda path: make_html(path, params['paragraphs']),
+    }
+
+    paths = {}
+    for ext in formats:
+        path = os.path.join(directory, f'{size}.{ext}')
+        if not os.path.exists(path):
+            makers[ext](path)
+        paths[ext] = path
+    return paths
@@ -0,0 +1,85 @@
+"""
+Cold-start benchmark: how long a fresh interpreter takes to import the app,
+and which heavy parsing libraries that pulls in
+
+    python -m benchmarks.imports --repeat 10
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.report import save_results  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries only needed once a document of the matching type is parsed
+HEAVY_MODULES = ['pandas', 'numpy', 'PyPDF2', 'docx', 'openpyxl']
+
+PROBE = """
+import sys, time, json
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'loaded': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def measure(module, work_dir):
+    """
+    Import a module in a fresh interpreter
+
+    Returns:
+        dict: 'seconds' taken by the import and the heavy modules it 'loaded'
+    """
+    env = dict(os.environ,
+               OPENAI_API_KEY='benchmark',
+               LOG_FORMAT='text',
+               UPLOAD_FOLDER=os.path.join(work_dir, 'uploads'),
+               PARSE_CACHE_DIR=os.path.join(work_dir, 'cache', 'parsed'),
+               COMPLETION_CACHE_DIR=os.path.join(work_dir, 'cache', 'completions'),
+               RESULT_DB_PATH=os.path.join(work_dir, 'data', 'results.sqlite3'),
+               BATCH_DB_PATH=os.path.join(work_dir, 'data', 'batch.sqlite3'),
+               RATE_LIMIT_DB_PATH=os.path.join(work_dir, 'data', 'rate_limits.sqlite3'),
+               IMAGE_CACHE_DIR=os.path.join(work_dir, 'cache', 'images'),
+               STATIC_BUILD_DIR=os.path.join(work_dir, 'cache', 'static'),
+               SESSION_FILE_DIR=os.path.join(work_dir, 'flask_session'),
+               GPT_4O_RPM='0',
+               GPT_4O_TPM='0',
+               GPT_4O_MINI_RPM='0',
+               GPT_4O_MINI_TPM='0')
+    output = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--modules', nargs='+', default=['app', 'utils.document_parser'])
+    parser.add_argument('--output', help='path for the JSON results')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='genai-imports-') as work_dir:
+        for module in args.modules:
+            runs = [measure(module, work_dir) for _ in range(args.repeat)]
+            timings = [run['seconds'] for run in runs]
+            results[module] = {
+                'median_seconds': round(statistics.median(timings), 4),
+                'min_seconds': round(min(timings), 4),
+                'heavy_modules_loaded': runs[-1]['loaded'],
+            }
+            print(f"import {module:<24} median {results[module]['median_seconds'] * 1000:7.1f} ms  "
+                  f"heavy modules: {', '.join(runs[-1]['loaded']) or 'none'}")
+
+    print(f"Results saved to {save_results('imports', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+End-to-end load test: concurrent users uploading a document, submitting a
+prompt and fetching the results, against the WSGI app and a mock OpenAI server
+
+    python -m benchmarks.load --users 8 --iterations 10 --size small --stream
+
+Everything runs in this process on temporary storage: the mock server, the
+app under a threaded WSGI server, and the simulated users. Peak RSS therefore
+covers the app and the driver together; document parsing runs in child
+processes and is reported separately.
+"""
+import os
+import re
+import sys
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import requests  # noqa: E402
+
+from benchmarks.generators import generate, SIZES  # noqa: E402
+from benchmarks.report import percentiles, peak_rss_mb, save_results, RESULTS_DIR  # noqa: E402
+from mock_openai_server import make_server as make_mock_server  # noqa: E402
+
+STREAM_URL_PATTERN = re.compile(r'data-stream-url="([^"]+)"')
+REMOVE_URL_PATTERN = re.compile(r'href="([^"]*/remove/[^"]+)"')
+
+
+def start_app(work_dir, mock_url):
+    """
+    Import the app against temporary storage and serve it on a free port
+
+    Returns:
+        str: Base URL of the app, including its subdirectory prefix
+    """
+    os.environ.update({
+        'OPENAI_API_KEY': 'benchmark',
+        'OPENAI_API_URL': mock_url,
+        'UPLOAD_FOLDER': os.path.join(work_dir, 'uploads'),
+        'PARSE_CACHE_DIR': os.path.join(work_dir, 'cache', 'parsed'),
+        'COMPLETION_CACHE_DIR': os.path.join(work_dir, 'cache', 'completions'),
+        'RESULT_DB_PATH': os.path.join(work_dir, 'data', 'results.sqlite3'),
+        'BATCH_DB_PATH': os.path.join(work_dir, 'data', 'batch.sqlite3'),
+        'RATE_LIMIT_DB_PATH': os.path.join(work_dir, 'data', 'rate_limits.sqlite3'),
+        'IMAGE_CACHE_DIR': os.path.join(work_dir, 'cache', 'images'),
+        'STATIC_BUILD_DIR': os.path.join(work_dir, 'cache', 'static'),
+        'SESSION_FILE_DIR': os.path.join(work_dir, 'flask_session'),
+        # Measure the app, not the per-model rate limits (see benchmarks/README.md)
+        'GPT_4O_RPM': '0',
+        'GPT_4O_TPM': '0',
+        'GPT_4O_MINI_RPM': '0',
+        'GPT_4O_MINI_TPM': '0',
+        'LOG_FORMAT': 'text',
+    })
+
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger().setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}{app.config['SUBDIRECTORY_PATH']}"
+
+
+def run_user(base_url, documents, iterations, models, stream, timings, errors):
+    """Simulate one user: upload, submit and read the results, ``iterations`` times"""
+    session = requests.Session()
+    rng = random.Random()
+    for iteration in range(iterations):
+        ext, path = rng.choice(documents)
+        started = time.perf_counter()
+        try:
+            with open(path, 'rb') as file:
+                response = session.post(f"{base_url}/upload", files={'file': (os.path.basename(path), file)},
+                                        allow_redirects=False)
+            response.raise_for_status()
+            uploaded = time.perf_counter()
+
+            form = {'prompt': f"Summarise this document ({iteration}, {rng.random()})", 'modelComparison': models}
+            if stream:
+                form['stream'] = '1'
+            response = session.post(f"{base_url}/submit", data=form, allow_redirects=False)
+            response.raise_for_status()
+            location = response.headers['Location']
+            submitted = time.perf_counter()
+
+            response = session.get(requests.compat.urljoin(base_url + '/', location))
+            response.raise_for_status()
+            for stream_url in STREAM_URL_PATTERN.findall(response.text):
+                body = session.get(requests.compat.urljoin(base_url + '/', stream_url.replace('&amp;', '&')))
+                if 'event: error' in body.text:
+                    raise Exception(f"stream error from {stream_url}")
+            finished = time.perf_counter()
+
+            timings['upload'].append(uploaded - started)
+            timings['submit'].append(submitted - uploaded)
+            timings['results'].append(finished - submitted)
+            timings['total'].append(finished - started)
+            timings[f'total:{ext}'].append(finished - started)
+
+            # Keep the session's upload list short, as a real user would
+            index = session.get(f"{base_url}/")
+            for remove_url in REMOVE_URL_PATTERN.findall(index.text):
+                session.get(requests.compat.urljoin(base_url + '/', remove_url), allow_redirects=False)
+        except Exception as e:
+            errors.append(str(e))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=4, help='concurrent simulated users')
+    parser.add_argument('--iterations', type=int, default=5, help='upload/submit/results cycles per user')
+    parser.add_argument('--size', default='small', choices=list(SIZES))
+    parser.add_argument('--formats', nargs='+', default=['pdf', 'docx', 'xlsx', 'csv', 'html'])
+    parser.add_argument('--models', nargs='+', default=['gpt-4o', 'gpt-4o-mini'])
+    parser.add_argument('--stream', action='store_true', help='stream responses to the results page')
+    parser.add_argument('--latency', type=float, default=0.2, help='mock API latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.05, help='mock API latency variation in seconds')
+    parser.add_argument('--token-delay', type=float, default=0.005, help='mock API delay between streamed chunks')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of mock API requests that fail')
+    parser.add_argument('--data-dir', default=os.path.join(RESULTS_DIR, 'documents'))
+    parser.add_argument('--output', help='path for the JSON results')
+    args = parser.parse_args()
+
+    mock = make_mock_server(port=0, latency=args.latency, token_delay=args.token_delay, jitter=args.jitter,
+                            error_rate=args.error_rate)
+    threading.Thread(target=mock.serve_forever, daemon=True).start()
+
+    work_dir = tempfile.mkdtemp(prefix='genai-load-')
+    try:
+        base_url = start_app(work_dir, f"http://127.0.0.1:{mock.server_port}/v1/chat/completions")
+        documents = sorted(generate(args.data_dir, args.size, args.formats).items())
+
+        timings = {key: [] for key in ('upload', 'submit', 'results', 'total')}
+        timings.update({f'total:{ext}': [] for ext, _ in documents})
+        errors = []
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.users) as executor:
+            for _ in range(args.users):
+                executor.submit(run_user, base_url, documents, args.iterations, args.models, args.stream,
+                                timings, errors)
+        elapsed = time.perf_counter() - started
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    completed = len(timings['total'])
+    results = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('data_dir', 'output')},
+        'completed': completed,
+        'errors': len(errors),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_per_second': round(completed / elapsed, 3) if elapsed else 0,
+        'latency_seconds': {key: {name: round(value, 4) for name, value in percentiles(values).items()}
+                            for key, values in timings.items() if values},
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+    print(f"{completed} cycles in {elapsed:.1f}s ({results['throughput_per_second']}/s), {len(errors)} errors")
+    for key, values in results['latency_seconds'].items():
+        print(f"  {key:<12} " + '  '.join(f"{name} {value * 1000:8.1f} ms" for name, value in values.items()))
+    print(f"  peak RSS: {results['peak_rss_mb']}")
+    if errors:
+        print(f"  first error: {errors[0]}")
+    print(f"Results saved to {save_results('load', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Micro-benchmarks of each document_parser function on synthetic documents
+
+    python -m benchmarks.parsers --sizes small medium --repeat 5
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generators import generate, SIZES  # noqa: E402
+from benchmarks.report import peak_rss_mb, save_results, RESULTS_DIR  # noqa: E402
+
+# The document_parser function that handles each generated format
+PARSERS = {
+    'pdf': 'parse_pdf',
+    'docx': 'parse_docx',
+    'xlsx': 'parse_excel',
+    'csv': 'parse_csv',
+    'html': 'parse_html',
+}
+
+
+def benchmark(function, path, repeat):
+    """
+    Time a parser on one file
+
+    Returns:
+        dict: Timings in seconds plus the file and output sizes
+    """
+    timings = []
+    output = ''
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = function(path)
+        timings.append(time.perf_counter() - started)
+    return {
+        'min': round(min(timings), 6),
+        'median': round(statistics.median(timings), 6),
+        'max': round(max(timings), 6),
+        'input_bytes': os.path.getsize(path),
+        'output_chars': len(output),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['small', 'medium'], choices=list(SIZES))
+    parser.add_argument('--formats', nargs='+', default=list(PARSERS), choices=list(PARSERS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data-dir', default=os.path.join(RESULTS_DIR, 'documents'),
+                        help='where generated documents are kept between runs')
+    parser.add_argument('--output', help='path for the JSON results')
+    args = parser.parse_args()
+
+    from utils import document_parser
+
+    results = {}
+    for size in args.sizes:
+        paths = generate(args.data_dir, size, args.formats)
+        for ext in args.formats:
+            name = PARSERS[ext]
+            result = benchmark(getattr(document_parser, name), paths[ext], args.repeat)
+            results.setdefault(size, {})[f'{ext}:{name}'] = result
+            print(f"{size:<7} {ext:<5} {name:<12} median {result['median'] * 1000:9.1f} ms  "
+                  f"{result['input_bytes'] / 1024:9.0f} KB in  {result['output_chars'] / 1024:9.0f} K chars out")
+
+    results['peak_rss_mb'] = peak_rss_mb()
+    print(f"Results saved to {save_results('parsers', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
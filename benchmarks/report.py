@@ -0,0 +1,126 @@
+"""
+Shared helpers for benchmark results: percentiles, memory use and JSON reports
+
+Compare two saved runs with:
+
+    python -m benchmarks.report results/before.json results/after.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import resource
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """
+    Nearest-rank percentiles of a list of numbers
+
+    Args:
+        values (list): Observations
+        points (tuple): Percentiles to report
+
+    Returns:
+        dict: e.g. {'p50': ..., 'p95': ..., 'p99': ...}, empty if there are no values
+    """
+    if not values:
+        return {}
+    ordered = sorted(values)
+    return {f'p{point}': ordered[min(len(ordered) - 1, max(0, -(-point * len(ordered) // 100) - 1))]
+            for point in points}
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process and of its finished child processes
+
+    Returns:
+        dict: 'self' and 'children' in megabytes
+    """
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {
+        'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def save_results(name, results, path=None):
+    """
+    Save benchmark results as JSON with details of the machine they ran on
+
+    Args:
+        name (str): Benchmark name, used in the default file name
+        results (dict): Results to save
+        path (str): Output path (defaults to benchmarks/results/<name>-<timestamp>.json)
+
+    Returns:
+        str: Path the results were written to
+    """
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    report = {
+        'benchmark': name,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
+    return path
+
+
+def _flatten(value, prefix=''):
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(_flatten(item, f'{prefix}.{key}' if prefix else str(key)))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+
+def compare(before, after):
+    """
+    Compare every numeric result in two reports
+
+    Args:
+        before (dict): Earlier report
+        after (dict): Later report
+
+    Returns:
+        list: (metric, before, after, percentage change) for metrics in both reports
+    """
+    old = _flatten(before['results'])
+    new = _flatten(after['results'])
+    rows = []
+    for key in sorted(old.keys() & new.keys()):
+        change = (new[key] - old[key]) / old[key] * 100 if old[key] else None
+        rows.append((key, old[key], new[key], change))
+    return rows
+
+
+def main():
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+    with open(sys.argv[1]) as file:
+        before = json.load(file)
+    with open(sys.argv[2]) as file:
+        after = json.load(file)
+
+    width = max((len(row[0]) for row in compare(before, after)), default=10)
+    for key, old, new, change in compare(before, after):
+        change_text = f"{change:+.1f}%" if change is not None else 'n/a'
+        print(f"{key:<{width}}  {old:>12.4g}  {new:>12.4g}  {change_text:>8}")
+
+
+if __name__ == '__main__':
+    main()
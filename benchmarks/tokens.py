@@ -0,0 +1,79 @@
+"""
+Speed and accuracy of the offline token estimator on parsed documents
+
+    python -m benchmarks.tokens --sizes small medium --repeat 5
+
+Each generated document is parsed as the app would parse it, then counted
+with utils.tokens.estimate_tokens and with the old characters / 4 rule. If
+tiktoken is installed (and can load o200k_base), both are compared with the
+exact count.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.generators import generate, SIZES  # noqa: E402
+from benchmarks.report import save_results, RESULTS_DIR  # noqa: E402
+from utils.document_parser import extract_text  # noqa: E402
+from utils.tokens import estimate_tokens  # noqa: E402
+
+FORMATS = ['pdf', 'docx', 'xlsx', 'csv', 'html']
+
+
+def load_encoding():
+    """Return tiktoken's o200k_base encoding, or None if it is not available"""
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding('o200k_base')
+    except Exception as e:
+        print(f"Not comparing with exact counts: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['small', 'medium'], choices=list(SIZES))
+    parser.add_argument('--formats', nargs='+', default=FORMATS, choices=FORMATS)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--data-dir', default=os.path.join(RESULTS_DIR, 'documents'),
+                        help='where generated documents are kept between runs')
+    parser.add_argument('--output', help='path for the JSON results')
+    args = parser.parse_args()
+
+    encoding = load_encoding()
+    results = {}
+    for size in args.sizes:
+        paths = generate(args.data_dir, size, args.formats)
+        for fmt in args.formats:
+            text = extract_text(paths[fmt])
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                estimate = estimate_tokens(text)
+                timings.append(time.perf_counter() - started)
+
+            median = statistics.median(timings)
+            result = {'chars': len(text), 'estimate': estimate, 'chars_per_4': len(text) // 4 + 1,
+                      'median': round(median, 6), 'chars_per_second': round(len(text) / median)}
+            line = (f"{size:<7} {fmt:<5} {len(text) / 1024:8.0f} K chars  estimate {estimate:9,}  "
+                    f"{median * 1000:8.1f} ms ({result['chars_per_second'] / 1e6:5.1f} M chars/s)")
+            if encoding is not None:
+                exact = len(encoding.encode(text, disallowed_special=()))
+                result.update(exact=exact, estimate_error=round(estimate / exact - 1, 4),
+                              chars_per_4_error=round(result['chars_per_4'] / exact - 1, 4))
+                line += (f"  exact {exact:9,}  error {result['estimate_error']:+7.1%} "
+                         f"(chars/4 {result['chars_per_4_error']:+7.1%})")
+            results.setdefault(size, {})[fmt] = result
+            print(line)
+
+    print(f"Results saved to {save_results('tokens', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import os
+import json
 from datetime import timedelta
 from dotenv import load_dotenv
 
@@ -9,13 +10,88 @@ class Config:
     # Basic Flask config
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-key-for-testing-only'
 
+    # Logging: 'json' for one JSON object per line, or 'text'
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+
     # Session config
     PERMANENT_SESSION_LIFETIME = timedelta(days=1)
 
     # File upload config
-    UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'uploads')
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB max upload
 
+    # Uploads are stored once per distinct file and swept when unused or over quota
+    UPLOAD_QUOTA_BYTES = int(os.environ.get('UPLOAD_QUOTA_BYTES', 2 * 1024 * 1024 * 1024))  # 2GB
+    UPLOAD_SWEEP_INTERVAL = float(os.environ.get('UPLOAD_SWEEP_INTERVAL', 10 * 60))  # seconds
+    UPLOAD_ORPHAN_GRACE = float(os.environ.get('UPLOAD_ORPHAN_GRACE', 60 * 60))  # seconds
+
+    # Fingerprinted and precompressed copies of the static files, and how long browsers may cache them (seconds)
+    STATIC_BUILD_DIR = os.environ.get('STATIC_BUILD_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'cache', 'static')
+    STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 365 * 24 * 60 * 60))
+
+    # Parsed document text cache
+    PARSE_CACHE_DIR = os.environ.get('PARSE_CACHE_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'cache', 'parsed')
+    PARSE_CACHE_MAX_BYTES = int(os.environ.get('PARSE_CACHE_MAX_BYTES', 512 * 1024 * 1024))  # 512MB
+
+    # Images sent to vision models: downscaled to the resolution the API uses for this
+    # detail level ('low', 'high' or 'auto'), re-encoded and cached by content hash
+    IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'cache', 'images')
+    IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024))  # 256MB
+    IMAGE_DETAIL = os.environ.get('IMAGE_DETAIL', 'auto')
+    IMAGE_JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', 85))
+
+    # Opt-in cache of model responses for repeated identical requests
+    COMPLETION_CACHE_ENABLED = os.environ.get('COMPLETION_CACHE_ENABLED', '').lower() in ('1', 'true', 'yes')
+    COMPLETION_CACHE_DIR = os.environ.get('COMPLETION_CACHE_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'cache', 'completions')
+    COMPLETION_CACHE_MAX_BYTES = int(os.environ.get('COMPLETION_CACHE_MAX_BYTES', 64 * 1024 * 1024))  # 64MB
+    COMPLETION_CACHE_TTL = float(os.environ.get('COMPLETION_CACHE_TTL', 24 * 60 * 60))  # seconds
+
+    # PDF extraction: page cap (0 for no cap) and time budget per document in seconds (0 for none)
+    PDF_MAX_PAGES = int(os.environ.get('PDF_MAX_PAGES', 500))
+    PDF_TIME_BUDGET = float(os.environ.get('PDF_TIME_BUDGET', 60))
+
+    # Spreadsheet and CSV rendering: 'csv' or 'markdown', with row and byte caps per sheet
+    TABULAR_FORMAT = os.environ.get('TABULAR_FORMAT', 'csv')
+    TABULAR_MAX_ROWS = int(os.environ.get('TABULAR_MAX_ROWS', 2000))
+    TABULAR_MAX_BYTES = int(os.environ.get('TABULAR_MAX_BYTES', 256 * 1024))
+
+    # Rows loaded per sheet when a spreadsheet or CSV is sent as a statistical profile
+    PROFILE_MAX_ROWS = int(os.environ.get('PROFILE_MAX_ROWS', 5000000))
+
+    # Server-side session files
+    SESSION_FILE_DIR = os.environ.get('SESSION_FILE_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'flask_session')
+
+    # Result store for prompts and responses, with how long runs are kept (seconds)
+    RESULT_DB_PATH = os.environ.get('RESULT_DB_PATH') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'data', 'results.sqlite3')
+    RESULT_TTL = float(os.environ.get('RESULT_TTL', 7 * 24 * 60 * 60))
+
+    # Seconds a streamed response may go without saving progress before its stream is assumed
+    # dead and a reloaded page starts it again
+    STREAM_CLAIM_TIMEOUT = float(os.environ.get('STREAM_CLAIM_TIMEOUT', 180))
+
+    # Background parsing of uploads
+    PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 2))
+    PARSE_WAIT_TIMEOUT = float(os.environ.get('PARSE_WAIT_TIMEOUT', 120))  # seconds
+
+    # Batch jobs, run by a worker pool in each process
+    BATCH_DB_PATH = os.environ.get('BATCH_DB_PATH') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'data', 'batch.sqlite3')
+    BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 4))  # threads per process
+    BATCH_MODEL_CONCURRENCY = int(os.environ.get('BATCH_MODEL_CONCURRENCY', 4))  # per model, across processes
+    BATCH_MAX_ATTEMPTS = int(os.environ.get('BATCH_MAX_ATTEMPTS', 3))
+    BATCH_MAX_TASKS = int(os.environ.get('BATCH_MAX_TASKS', 5000))
+    # Seconds to keep a job and its results
+    BATCH_TTL = float(os.environ.get('BATCH_TTL', 7 * 24 * 60 * 60))
+    # Seconds a task stays leased to a worker that has stopped renewing it (e.g. it was restarted)
+    BATCH_LEASE_SECONDS = float(os.environ.get('BATCH_LEASE_SECONDS', 180))
+
     # Determine if we're running on Posit Connect
     IS_CONNECT = 'CONNECT_SERVER' in os.environ
 
@@ -30,8 +106,73 @@ class Config:
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
     OPENAI_API_URL = os.environ.get('OPENAI_API_URL', 'https://api.openai.com/v1/chat/completions')
 
-    # Available models
+    # Second endpoint serving the same models (e.g. another region or provider), tried when the
+    # first fails and used for hedged requests; its key defaults to OPENAI_API_KEY
+    OPENAI_FALLBACK_API_URL = os.environ.get('OPENAI_FALLBACK_API_URL', '')
+    OPENAI_FALLBACK_API_KEY = os.environ.get('OPENAI_FALLBACK_API_KEY', '') or OPENAI_API_KEY
+
+    # Latency-aware routing: latencies kept per model and endpoint, how many are needed before
+    # they are trusted, and how long a failed endpoint is tried last (seconds). With HEDGE_REQUESTS
+    # on and a fallback endpoint set, a request still running past its endpoint's p95 latency (and
+    # at least HEDGE_MIN_DELAY) is sent again to the other endpoint. Off by default, since a hedge
+    # is billed and counted against the rate limits like any other request.
+    HEDGE_REQUESTS = os.environ.get('HEDGE_REQUESTS', '').lower() in ('1', 'true', 'yes')
+    LATENCY_WINDOW = int(os.environ.get('LATENCY_WINDOW', 200))
+    HEDGE_MIN_SAMPLES = int(os.environ.get('HEDGE_MIN_SAMPLES', 20))
+    HEDGE_MIN_DELAY = float(os.environ.get('HEDGE_MIN_DELAY', 1.0))
+    ENDPOINT_COOLDOWN = float(os.environ.get('ENDPOINT_COOLDOWN', 30))
+
+    # OpenAI HTTP transport: connection pool, timeouts (seconds) and retries
+    OPENAI_POOL_SIZE = int(os.environ.get('OPENAI_POOL_SIZE', 10))
+    OPENAI_CONNECT_TIMEOUT = float(os.environ.get('OPENAI_CONNECT_TIMEOUT', 5))
+    OPENAI_READ_TIMEOUT = float(os.environ.get('OPENAI_READ_TIMEOUT', 120))
+    OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', 3))
+    OPENAI_BACKOFF_BASE = float(os.environ.get('OPENAI_BACKOFF_BASE', 0.5))
+    OPENAI_BACKOFF_MAX = float(os.environ.get('OPENAI_BACKOFF_MAX', 20))
+
+    # Connections shared by in-flight requests when served by asgi.py
+    OPENAI_ASYNC_POOL_SIZE = int(os.environ.get('OPENAI_ASYNC_POOL_SIZE', 1000))
+
+    # Always hand model calls to the streaming endpoint instead of waiting in /submit;
+    # asgi.py turns this on, since it serves that endpoint without holding a thread
+    ASYNC_COMPLETIONS = os.environ.get('ASYNC_COMPLETIONS', '').lower() in ('1', 'true', 'yes')
+
+    # Model request concurrency and time limits (seconds)
+    MODEL_DISPATCH_WORKERS = int(os.environ.get('MODEL_DISPATCH_WORKERS', 8))
+    MODEL_TIMEOUT = float(os.environ.get('MODEL_TIMEOUT', 60))
+    REQUEST_DEADLINE = float(os.environ.get('REQUEST_DEADLINE', 90))
+
+    # Available models, in display order, with the number of document tokens each may be sent per
+    # request, the account's requests and tokens per minute for each (0, the default, for no limit; a
+    # tokens limit should be well above the document budget, or one request fills the minute), whether
+    # it is selected by default, its context window and its price in US dollars per million input and
+    # output tokens. MODELS_FILE names a JSON file with a list of the same dicts to use instead.
+    MODELS_FILE = os.environ.get('MODELS_FILE', '')
     AVAILABLE_MODELS = [
-        {'id': 'gpt-4o', 'name': 'GPT-4o'},
-        {'id': 'gpt-4o-mini', 'name': 'GPT-4o Mini'}
-    ]
\ No newline at end of file
+        {'id': 'gpt-4o', 'name': 'GPT-4o',
+         'document_token_budget': int(os.environ.get('GPT_4O_DOCUMENT_TOKEN_BUDGET', 30000)),
+         'rpm': int(os.environ.get('GPT_4O_RPM', 0)),
+         'tpm': int(os.environ.get('GPT_4O_TPM', 0)),
+         'context_window': 128000, 'input_cost': 2.50, 'output_cost': 10.00},
+        {'id': 'gpt-4o-mini', 'name': 'GPT-4o Mini',
+         'document_token_budget': int(os.environ.get('GPT_4O_MINI_DOCUMENT_TOKEN_BUDGET', 30000)),
+         'rpm': int(os.environ.get('GPT_4O_MINI_RPM', 0)),
+         'tpm': int(os.environ.get('GPT_4O_MINI_TPM', 0)),
+         'context_window': 128000, 'input_cost': 0.15, 'output_cost': 0.60,
+         'default': True}
+    ]
+    if MODELS_FILE:
+        with open(MODELS_FILE) as models_file:
+            AVAILABLE_MODELS = json.load(models_file)
+
+    # Rate limit queue shared by every worker process, and how long a request may wait in it (seconds)
+    RATE_LIMIT_DB_PATH = os.environ.get('RATE_LIMIT_DB_PATH') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'data', 'rate_limits.sqlite3')
+    RATE_LIMIT_QUEUE_TIMEOUT = float(os.environ.get('RATE_LIMIT_QUEUE_TIMEOUT', 300))
+
+    # Retrieval of relevant document chunks when documents exceed a model's budget
+    RETRIEVAL_CHUNK_TOKENS = int(os.environ.get('RETRIEVAL_CHUNK_TOKENS', 400))
+    DEFAULT_DOCUMENT_TOKEN_BUDGET = int(os.environ.get('DEFAULT_DOCUMENT_TOKEN_BUDGET', 30000))
+
+    # Share of each model's context window kept free, since token counts are estimated before sending
+    CONTEXT_WINDOW_MARGIN = float(os.environ.get('CONTEXT_WINDOW_MARGIN', 0.1))
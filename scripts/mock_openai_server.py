@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Local mock of the OpenAI chat completions endpoint.
+
+Answers both plain and ``stream=True`` requests, so the app can be run and
+tested without an API key or network access. Latency, jitter and a rate of
+429/500 errors can be configured to exercise retries and load behaviour:
+
+    python scripts/mock_openai_server.py --port 8900
+    OPENAI_API_URL=http://127.0.0.1:8900/v1/chat/completions OPENAI_API_KEY=test flask run
+"""
+import argparse
+import json
+import time
+import random
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def mock_reply(payload):
+    """Build a deterministic reply that echoes the size of the prompt"""
+    prompt = payload['messages'][-1]['content']
+    if not isinstance(prompt, str):
+        prompt = json.dumps(prompt)
+    words = [f"Mock reply from {payload.get('model', 'unknown')}"] + \
+            [f"word{i}" for i in range(40)] + [f"(prompt was {len(prompt)} characters)"]
+    return ' '.join(words)
+
+
+def mock_usage(payload, reply):
+    """Approximate token usage at four characters per token"""
+    prompt_tokens = len(json.dumps(payload['messages'])) // 4
+    completion_tokens = len(reply) // 4
+    return {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens}
+
+
+class MockCompletionsHandler(BaseHTTPRequestHandler):
+    """Request handler that mimics POST /v1/chat/completions"""
+
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    jitter = 0.0
+    token_delay = 0.02
+    error_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        if self.error_rate and random.random() < self.error_rate:
+            self._error(random.choice([429, 500]))
+            return
+
+        reply = mock_reply(payload)
+        if payload.get('stream'):
+            self._stream(payload, reply)
+        else:
+            self._respond(payload, reply)
+
+    def _respond(self, payload, reply):
+        body = json.dumps({
+            'id': 'chatcmpl-mock',
+            'object': 'chat.completion',
+            'model': payload.get('model'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}],
+            'usage': mock_usage(payload, reply)
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status):
+        message = 'Rate limit reached' if status == 429 else 'The server had an error'
+        body = json.dumps({'error': {'message': f"Mock {message.lower()}", 'type': 'mock_error'}}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, payload, reply):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        for i, word in enumerate(reply.split(' ')):
+            chunk = {
+                'id': 'chatcmpl-mock',
+                'object': 'chat.completion.chunk',
+                'model': payload.get('model'),
+                'choices': [{'index': 0, 'delta': {'content': word if i == 0 else ' ' + word}, 'finish_reason': None}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(self.token_delay)
+
+        if (payload.get('stream_options') or {}).get('include_usage'):
+            chunk = {'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk', 'model': payload.get('model'),
+                     'choices': [], 'usage': mock_usage(payload, reply)}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class MockServer(ThreadingHTTPServer):
+    """Threaded server with a listen backlog deep enough for concurrency benchmarks"""
+
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def make_server(host='127.0.0.1', port=8900, latency=0.0, token_delay=0.02, jitter=0.0, error_rate=0.0):
+    """
+    Create a mock completions server
+
+    Args:
+        host (str): Interface to bind to
+        port (int): Port to listen on (0 picks a free port)
+        latency (float): Seconds to wait before answering each request
+        token_delay (float): Seconds between streamed chunks
+        jitter (float): Latency varies uniformly by up to this many seconds either way
+        error_rate (float): Fraction of requests answered with a 429 or 500 error
+
+    Returns:
+        MockServer: The server, not yet started
+    """
+    handler = type('ConfiguredHandler', (MockCompletionsHandler,),
+                   {'latency': latency, 'token_delay': token_delay, 'jitter': jitter, 'error_rate': error_rate})
+    return MockServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before each response starts')
+    parser.add_argument('--token-delay', type=float, default=0.02, help='seconds between streamed chunks')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random latency variation in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail with 429/500')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.token_delay, args.jitter, args.error_rate)
+    print(f"Mock OpenAI server listening on http://{args.host}:{server.server_port}/v1/chat/completions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -31,12 +31,134 @@
     });
   }
 
+  // Poll the parse status of uploads that are still being processed
+  const uploadList = document.querySelector('[data-upload-status-url]');
+  if (uploadList && uploadList.querySelector('[data-upload-status="Parsing"]')) {
+    const statusUrl = uploadList.getAttribute('data-upload-status-url');
+    const tagClasses = {
+      'Parsing': 'govuk-tag--blue',
+      'Failed': 'govuk-tag--red'
+    };
+
+    const pollStatus = function() {
+      fetch(statusUrl, { credentials: 'same-origin' })
+        .then(function(response) { return response.json(); })
+        .then(function(data) {
+          data.uploads.forEach(function(upload) {
+            const tag = uploadList.querySelector(`[data-upload-id="${upload.id}"]`);
+            if (tag && tag.getAttribute('data-upload-status') !== upload.status) {
+              tag.setAttribute('data-upload-status', upload.status);
+              tag.textContent = upload.status;
+              tag.className = 'govuk-tag ' + (tagClasses[upload.status] || 'govuk-tag--green');
+            }
+            const reduction = uploadList.querySelector(`[data-upload-reduction="${upload.id}"]`);
+            if (reduction && upload.reduction) {
+              reduction.textContent = upload.reduction;
+            }
+            const tokens = uploadList.querySelector(`[data-upload-tokens="${upload.id}"]`);
+            if (tokens && upload.tokens !== null) {
+              tokens.textContent = `About ${upload.tokens.toLocaleString('en-GB')} tokens`;
+            }
+          });
+
+          // Running totals now that more of the uploads have been counted
+          const total = document.querySelector('[data-token-total]');
+          if (total) {
+            total.textContent = data.estimates.documents.toLocaleString('en-GB');
+          }
+          data.estimates.models.forEach(function(model) {
+            const estimate = document.querySelector(`[data-model-estimate="${model.id}"]`);
+            if (estimate) {
+              estimate.textContent = model.description;
+            }
+          });
+
+          if (data.pending) {
+            setTimeout(pollStatus, 1000);
+          }
+        })
+        .catch(function(error) {
+          console.log(`Could not fetch upload status: ${error}`);
+        });
+    };
+
+    setTimeout(pollStatus, 1000);
+  }
+
+  // Stream model responses into their panels as tokens arrive
+  document.querySelectorAll('[data-stream-url]').forEach(function(panel) {
+    const source = new EventSource(panel.getAttribute('data-stream-url'));
+    const finish = function() {
+      source.close();
+      panel.setAttribute('aria-busy', 'false');
+      // The conversation can continue once the model has answered
+      const conversation = panel.closest('.conversation');
+      if (conversation) {
+        conversation.querySelector('.followup-form').hidden = false;
+      }
+    };
+
+    // While the model's rate limit queue is full, show the place in the queue until text arrives
+    let queued = false;
+    source.addEventListener('queue', function(e) {
+      const state = JSON.parse(e.data);
+      queued = true;
+      panel.textContent = `Waiting for capacity: position ${state.position} in the queue` +
+        (state.wait_seconds > 0 ? ` (next request in about ${Math.ceil(state.wait_seconds)}s)` : '');
+    });
+    source.onmessage = function(e) {
+      if (queued) {
+        panel.textContent = '';
+        queued = false;
+      }
+      panel.textContent += JSON.parse(e.data).delta;
+    };
+    source.addEventListener('done', finish);
+    source.addEventListener('error', function(e) {
+      // Server-sent errors carry a message; connection errors do not
+      if (e.data) {
+        panel.textContent += JSON.parse(e.data).error;
+      } else if (panel.textContent === '') {
+        panel.textContent = 'Error: the connection to the server was lost';
+      }
+      finish();
+    });
+  });
+
+  // Reload a batch job's page when it finishes, showing progress meanwhile
+  const batchStatus = document.querySelector('[data-batch-status-url]');
+  if (batchStatus && batchStatus.getAttribute('data-batch-finished') === 'false') {
+    const progress = batchStatus.querySelector('[data-batch-progress]');
+
+    const pollBatch = function() {
+      fetch(batchStatus.getAttribute('data-batch-status-url'), { credentials: 'same-origin' })
+        .then(function(response) { return response.json(); })
+        .then(function(job) {
+          if (job.finished) {
+            window.location.reload();
+            return;
+          }
+          progress.textContent = `${job.done + job.failed} of ${job.total} requests finished`;
+          setTimeout(pollBatch, 2000);
+        })
+        .catch(function(error) {
+          console.log(`Could not fetch batch job status: ${error}`);
+        });
+    };
+
+    setTimeout(pollBatch, 2000);
+  }
+
   // Handle form submission
   const form = document.querySelector('form');
   if (form) {
     form.addEventListener('submit', function(e) {
       // Validation could be added here
       const promptTextarea = document.getElementById('prompt');
+      const batchMode = form.querySelector('input[name="mode"]:checked');
+      if (batchMode && batchMode.value === 'prompt_list') {
+        return;
+      }
       if (promptTextarea && promptTextarea.value.trim() === '') {
         e.preventDefault();
         alert('Please enter a prompt before submitting.');
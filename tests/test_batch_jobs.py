@@ -0,0 +1,112 @@
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+from utils.batch_jobs import BatchQueue, BatchWorker, MODE_PROMPT_LIST, TASK_DONE, TASK_FAILED, TASK_QUEUED
+from utils.openai_client import OpenAIClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+from mock_openai_server import make_server  # noqa: E402
+
+
+@pytest.fixture
+def mock_url():
+    servers = []
+
+    def start(error_rate=0.0):
+        server = make_server(port=0, token_delay=0.0, error_rate=error_rate)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def make_worker(queue, url):
+    client = OpenAIClient(api_key='test', api_url=url, max_retries=0)
+    return BatchWorker(queue, client, threads=0, model_limits={}, default_limit=2, timeout=10)
+
+
+def queue_job(queue, prompts):
+    tasks = [{'label': prompt, 'model': 'gpt-4o-mini', 'prompt': prompt} for prompt in prompts]
+    return queue.create_job('owner', 'test job', MODE_PROMPT_LIST, tasks)
+
+
+def test_tasks_are_claimed_in_order_and_completed(tmp_path, mock_url):
+    queue = BatchQueue(str(tmp_path / 'batch.sqlite3'))
+    job_id = queue_job(queue, ['first', 'second'])
+    worker = make_worker(queue, mock_url())
+
+    assert worker.run_one('w1')
+    assert worker.run_one('w1')
+    assert not worker.run_one('w1')
+
+    tasks = queue.get_tasks(job_id)
+    assert [task['status'] for task in tasks] == [TASK_DONE, TASK_DONE]
+    assert all(task['response'].startswith('Mock reply from gpt-4o-mini') for task in tasks)
+    assert queue.get_job(job_id)['finished']
+
+
+def test_failed_attempts_are_retried_then_marked_failed(tmp_path, mock_url):
+    queue = BatchQueue(str(tmp_path / 'batch.sqlite3'), max_attempts=2)
+    failing = make_worker(queue, mock_url(error_rate=1.0))
+
+    # A failed attempt goes back to the queue and can succeed next time
+    job_id = queue_job(queue, ['flaky'])
+    failing.run_one('w1')
+    assert [(task['status'], task['attempts']) for task in queue.get_tasks(job_id)] == [(TASK_QUEUED, 1)]
+    make_worker(queue, mock_url()).run_one('w2')
+    assert [(task['status'], task['attempts']) for task in queue.get_tasks(job_id)] == [(TASK_DONE, 2)]
+
+    # Once its attempts are used up the task fails with the error as its response
+    job_id = queue_job(queue, ['broken'])
+    failing.run_one('w1')
+    failing.run_one('w1')
+    [task] = queue.get_tasks(job_id)
+    assert (task['status'], task['attempts']) == (TASK_FAILED, 2)
+    assert task['response'].startswith('Error:')
+    assert not failing.run_one('w1')
+
+
+def test_expired_lease_is_reclaimed_and_the_old_worker_ignored(tmp_path):
+    queue = BatchQueue(str(tmp_path / 'batch.sqlite3'), lease_seconds=0.2)
+    job_id = queue_job(queue, ['only'])
+
+    task = queue.claim('dead', {})
+    assert queue.claim('other', {}) is None
+
+    time.sleep(0.3)
+    reclaimed = queue.claim('other', {})
+    assert (reclaimed['task_id'], reclaimed['attempts']) == (task['task_id'], 2)
+
+    queue.complete(task['task_id'], 'dead', 'stale')
+    queue.complete(task['task_id'], 'other', 'fresh')
+    assert queue.get_tasks(job_id)[0]['response'] == 'fresh'
+
+
+def test_renewed_lease_is_not_reclaimed(tmp_path):
+    queue = BatchQueue(str(tmp_path / 'batch.sqlite3'), lease_seconds=0.3)
+    queue_job(queue, ['slow'])
+
+    task = queue.claim('busy', {})
+    for _ in range(3):
+        time.sleep(0.15)
+        queue.renew([(task['task_id'], 'busy')])
+        assert queue.claim('other', {}) is None
+
+
+def test_expired_jobs_are_cleaned_up(tmp_path):
+    queue = BatchQueue(str(tmp_path / 'batch.sqlite3'), ttl=60)
+    job_id = queue_job(queue, ['old'])
+
+    assert queue.cleanup() == 0
+    queue.ttl = 0
+    assert queue.cleanup() == 1
+    assert queue.get_job(job_id) is None
+    assert queue.get_tasks(job_id) == []
@@ -0,0 +1,39 @@
+import io
+import os
+
+from utils.blob_store import BlobStore
+
+
+def test_identical_uploads_share_one_blob_and_survive_until_unreferenced(tmp_path):
+    store = BlobStore(str(tmp_path), quota_bytes=10 ** 6, session_ttl=60, orphan_grace=0)
+
+    first_hash, path = store.save(io.BytesIO(b'a,b\n1,2\n'), '.csv', 'alice', 'u1')
+    second_hash, second_path = store.save(io.BytesIO(b'a,b\n1,2\n'), '.csv', 'bob', 'u2')
+    assert (first_hash, path) == (second_hash, second_path)
+    assert store.usage()['blobs'] == 1
+
+    store.remove_ref('alice', 'u1')
+    assert store.sweep()['orphans'] == 0
+    store.remove_ref('bob', 'u2')
+    assert store.sweep()['orphans'] == 1
+    assert not os.path.exists(path)
+
+    # Uploading it again after the sweep stores it afresh
+    _, path = store.save(io.BytesIO(b'a,b\n1,2\n'), '.csv', 'alice', 'u3')
+    assert os.path.exists(path)
+
+
+def test_quota_eviction_spares_blobs_of_live_sessions(tmp_path):
+    store = BlobStore(str(tmp_path), quota_bytes=10, session_ttl=60)
+
+    _, kept = store.save(io.BytesIO(b'x' * 8), '.txt', 'alice', 'u1')
+    _, removed = store.save(io.BytesIO(b'y' * 8), '.txt', 'bob', 'u2')
+    store.remove_ref('bob', 'u2')
+    _, live = store.save(io.BytesIO(b'z' * 8), '.txt', 'carol', 'u3')
+
+    assert store.sweep()['evicted'] == 1
+    assert os.path.exists(kept) and os.path.exists(live)
+    assert not os.path.exists(removed)
+    # Still over quota, but nothing left that no live session uses
+    assert store.sweep()['evicted'] == 0
+    assert store.usage()['blobs'] == 2
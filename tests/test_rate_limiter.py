@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+from utils.rate_limiter import RateLimiter, RateLimitTimeout
+
+
+def make_limiter(tmp_path, rpm=100, tpm=0):
+    return RateLimiter(str(tmp_path / 'rate_limits.sqlite3'), {'gpt-4o': {'rpm': rpm, 'tpm': tpm}},
+                       poll_interval=0.05)
+
+
+def test_queued_requests_are_admitted_in_arrival_order(tmp_path):
+    limiter = make_limiter(tmp_path)
+    limiter.pause('gpt-4o', 0.2)
+    first = limiter.enqueue('gpt-4o', 10)
+    second = limiter.enqueue('gpt-4o', 10)
+
+    assert limiter.poll(second) == {'admitted': False, 'position': 2, 'wait_seconds': pytest.approx(0.2, abs=0.1)}
+    time.sleep(0.25)
+    # The limits have room again, but the request ahead has not been admitted yet
+    assert not limiter.poll(second)['admitted']
+    assert limiter.poll(first)['admitted']
+    assert limiter.poll(second)['admitted']
+
+
+def test_wait_turn_reports_position_then_times_out_and_leaves_the_queue(tmp_path):
+    limiter = make_limiter(tmp_path)
+    limiter.pause('gpt-4o', 5)
+    ahead = limiter.enqueue('gpt-4o', 10)
+
+    states = []
+    with pytest.raises(RateLimitTimeout):
+        for state in limiter.wait_turn('gpt-4o', 10, timeout=0.2):
+            states.append(state)
+
+    assert [state['position'] for state in states] == [2]
+    assert limiter.status()['gpt-4o']['queued'] == 1
+    limiter.cancel(ahead)
+    assert limiter.status()['gpt-4o']['queued'] == 0
+
+
+def test_tokens_per_minute_hold_back_the_next_request(tmp_path):
+    limiter = make_limiter(tmp_path, rpm=0, tpm=1000)
+
+    assert list(limiter.wait_turn('gpt-4o', 800, timeout=1)) == []
+    with pytest.raises(RateLimitTimeout):
+        list(limiter.wait_turn('gpt-4o', 800, timeout=0.1))
+    assert limiter.status()['gpt-4o']['tokens'] == 800
+
+
+def test_try_acquire_never_queues(tmp_path):
+    limiter = make_limiter(tmp_path, rpm=1)
+
+    assert limiter.try_acquire('gpt-4o', 10)
+    assert not limiter.try_acquire('gpt-4o', 10)
+    assert limiter.status()['gpt-4o'] == {'rpm': 1, 'tpm': 0, 'queued': 0, 'requests': 1, 'tokens': 10}
+
+
+def test_models_without_limits_are_not_queued(tmp_path):
+    limiter = make_limiter(tmp_path)
+
+    assert list(limiter.wait_turn('gpt-4o-mini', 10 ** 6, timeout=0)) == []
+    assert limiter.try_acquire('gpt-4o-mini', 10 ** 6)
+    assert 'gpt-4o-mini' not in limiter.status()
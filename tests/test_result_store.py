@@ -0,0 +1,44 @@
+from utils.result_store import ResultStore
+
+
+def create_pending_run(store):
+    return store.create_run('owner', 'prompt', [{'model': 'gpt-4o', 'pending_prompt': 'prompt'},
+                                                {'model': 'gpt-4o-mini', 'response': 'cached', 'cached': True}])
+
+
+def test_second_claim_follows_the_first_stream(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.sqlite3'), ttl=60)
+    run_id = create_pending_run(store)
+
+    first = store.claim_pending(run_id, 'gpt-4o')
+    second = store.claim_pending(run_id, 'gpt-4o')
+
+    assert (first['claimed'], first['turn'], first['pending_prompt']) == (True, 0, 'prompt')
+    assert (second['claimed'], second['turn']) == (False, 0)
+    assert store.claim_pending(run_id, 'gpt-4o-mini') is None
+
+
+def test_released_or_stale_claims_can_be_taken_again(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.sqlite3'), ttl=60)
+    run_id = create_pending_run(store)
+
+    store.claim_pending(run_id, 'gpt-4o')
+    store.release(run_id, 'gpt-4o', 0)
+    assert store.claim_pending(run_id, 'gpt-4o')['claimed']
+
+    # A stream that stopped saving progress is assumed dead
+    assert store.claim_pending(run_id, 'gpt-4o', stale_after=-1)['claimed']
+
+
+def test_completed_response_is_not_claimed(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.sqlite3'), ttl=60)
+    run_id = create_pending_run(store)
+
+    store.claim_pending(run_id, 'gpt-4o')
+    store.complete_response(run_id, 'gpt-4o', 'answer', 0)
+
+    assert store.claim_pending(run_id, 'gpt-4o') is None
+    # A late release from the stream that finished it does not reopen the response
+    store.release(run_id, 'gpt-4o', 0)
+    assert store.claim_pending(run_id, 'gpt-4o') is None
+    assert [response['response'] for response in store.get_run(run_id)['responses']] == ['answer', 'cached']
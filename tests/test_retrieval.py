@@ -0,0 +1,48 @@
+from utils.document_parser import extract_text
+from utils.retrieval import chunk_text
+
+
+def write_csv(path, rows):
+    lines = ['id,name,city,score'] + [f'{i},Customer {i},"Leeds, UK",{i * 7}' for i in range(rows)]
+    path.write_text('\n'.join(lines) + '\n')
+    return path
+
+
+def test_csv_chunks_keep_rows_whole_and_repeat_the_header(tmp_path):
+    text = extract_text(str(write_csv(tmp_path / 'customers.csv', 400)))
+
+    chunks = chunk_text(text, chunk_tokens=100)
+
+    assert len(chunks) > 1
+    rows = []
+    for chunk in chunks:
+        header, *body = chunk.split('\n')
+        assert header == 'id,name,city,score'
+        assert len(chunk) <= 100 * 4
+        rows.extend(body)
+    assert rows == [f'{i},Customer {i},"Leeds, UK",{i * 7}' for i in range(400)]
+
+
+def test_markdown_table_repeats_sheet_title_and_separator():
+    text = 'Sheet: Data\n| a | b |\n|---|---|\n' + '\n'.join(f'| {i} | x |' for i in range(200))
+
+    chunks = chunk_text(text, chunk_tokens=50)
+
+    assert len(chunks) > 1
+    assert all(chunk.startswith('Sheet: Data\n| a | b |\n|---|---|\n| ') for chunk in chunks)
+
+
+def test_long_lines_split_on_line_breaks_before_spaces():
+    text = '\n'.join(f'Line {i} of the report, which carries on for a while.' for i in range(100))
+
+    chunks = chunk_text(text, chunk_tokens=100)
+
+    assert all(line.startswith('Line ') and line.endswith('.') for chunk in chunks for line in chunk.split('\n'))
+
+
+def test_single_overlong_line_falls_back_to_spaces():
+    chunks = chunk_text('word ' * 1000, chunk_tokens=100)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 100 * 4 for chunk in chunks)
+    assert ' '.join(chunks).split() == ['word'] * 1000
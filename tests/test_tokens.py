@@ -0,0 +1,33 @@
+from utils.tokens import estimate_tokens, truncate_to_tokens, trim_to_fit
+
+
+def test_estimates_follow_the_kind_of_text():
+    assert estimate_tokens('') == 1
+    assert estimate_tokens('The quick brown fox jumps over the lazy dog.') == 8
+    # Long words, CJK and emoji cost more tokens per character than short English words
+    assert estimate_tokens('internationalization') > estimate_tokens('the cat')
+    assert estimate_tokens('日本語のテキスト') > estimate_tokens('abcdefgh')
+    assert estimate_tokens('🙂🙂🙂') > estimate_tokens('abc')
+
+
+def test_estimates_add_up_over_repeated_text():
+    paragraph = 'Revenue grew 12% in 2023, driven by subscriptions.\n'
+
+    assert abs(estimate_tokens(paragraph * 100) - 100 * estimate_tokens(paragraph)) <= 100 * 0.05 * 12
+
+
+def test_truncate_keeps_text_that_fits_and_cuts_at_a_boundary():
+    text = ' '.join(f'word{i}' for i in range(1000))
+
+    assert truncate_to_tokens('short text', 100) == 'short text'
+    cut = truncate_to_tokens(text, 100, marker=' [cut]')
+    assert cut.endswith(' [cut]')
+    assert estimate_tokens(cut) <= 100
+    assert text.startswith(cut[:-len(' [cut]')] + ' ')
+
+
+def test_trim_to_fit_shortens_the_largest_documents_first():
+    assert trim_to_fit([100, 200, 1000], 0) == [100, 200, 1000]
+    assert trim_to_fit([100, 200, 1000], 600) == [100, 200, 400]
+    assert trim_to_fit([100, 200, 1000], 1000) == [100, 100, 100]
+    assert trim_to_fit([100, 200], 500) == [0, 0]
@@ -0,0 +1,317 @@
+"""
+Asyncio client for the OpenAI chat completions API, used by the ASGI entry point
+"""
+import json
+import time
+import asyncio
+import logging
+import httpx
+from utils.openai_client import (OpenAIClient, RETRY_STATUS_CODES, DEFAULT_MAX_TOKENS, DEFAULT_TEMPERATURE,
+                                 estimate_request_tokens)
+from utils.metrics import UPSTREAM_SECONDS, UPSTREAM_TTFB_SECONDS, HEDGED_REQUESTS, record_usage
+from utils.routing import KIND_TOTAL, KIND_TTFB, endpoint_host
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncOpenAIClient(OpenAIClient):
+    """
+    Async counterpart of OpenAIClient.
+
+    Requests share one httpx.AsyncClient connection pool, so thousands of
+    in-flight completions wait on a single event loop instead of each
+    holding a worker thread. Request building, retry delays, endpoint
+    fallback and error messages are inherited from OpenAIClient; a hedged
+    request's losing copy is cancelled outright rather than left to finish.
+    """
+
+    def __init__(self, api_key=None, api_url=None, pool_size=1000, connect_timeout=5, read_timeout=120,
+                 max_retries=3, backoff_base=0.5, backoff_max=20, rate_limiter=None, queue_timeout=300,
+                 fallback_api_url=None, fallback_api_key=None, models=None, routing=None):
+        """
+        Initialize the async client
+
+        Args:
+            api_key (str): OpenAI API key
+            api_url (str): Chat completions endpoint
+            pool_size (int): Maximum number of open connections to the API
+            connect_timeout (float): Seconds to wait for a connection
+            read_timeout (float): Seconds to wait for data once connected
+            max_retries (int): Number of retries for 429/5xx responses and connection errors
+            backoff_base (float): Base delay in seconds for exponential backoff
+            backoff_max (float): Longest delay in seconds between retries
+            rate_limiter (RateLimiter): Shared per-model limits that get_completion queues for (None for none)
+            queue_timeout (float): Seconds get_completion may wait in the rate limiter's queue
+            fallback_api_url (str): Second chat completions endpoint serving the same models (None for none)
+            fallback_api_key (str): API key for the fallback endpoint (defaults to api_key)
+            models (ModelRegistry): Models requests may ask for (None to let the API decide)
+            routing (RoutingPolicy): Latency tracking shared by the app's clients (defaults to one without hedging)
+        """
+        super().__init__(api_key=api_key, api_url=api_url, pool_size=pool_size, connect_timeout=connect_timeout,
+                         read_timeout=read_timeout, max_retries=max_retries, backoff_base=backoff_base,
+                         backoff_max=backoff_max, rate_limiter=rate_limiter, queue_timeout=queue_timeout,
+                         fallback_api_url=fallback_api_url, fallback_api_key=fallback_api_key, models=models,
+                         routing=routing)
+
+    def _init_transport(self):
+        # Requests go through an httpx.AsyncClient instead of a requests session and hedging threads
+        self._client = None
+
+    def _get_client(self):
+        # Created on first use so it belongs to the running event loop
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            self._client = httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(self.read_timeout,
+                                                                                  connect=self.connect_timeout))
+        return self._client
+
+    async def aclose(self):
+        """Close the connection pool"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _post(self, headers, payload, timeout=None, stream=False, endpoints=None):
+        """
+        POST to the API on the shared pool, retrying transient failures at the next endpoint
+
+        Args:
+            headers (dict): Request headers
+            payload (dict): JSON body
+            timeout (float): Read timeout for this call (defaults to the client's read timeout)
+            stream (bool): Whether to stream the response body
+            endpoints (list): Endpoints to try, in order (defaults to the configured order)
+
+        Returns:
+            tuple: The final httpx.Response, which may still be an error status, and the endpoint it came from
+        """
+        client = self._get_client()
+        endpoints = endpoints or self.endpoints
+        timeouts = httpx.Timeout(timeout or self.read_timeout, connect=self.connect_timeout)
+
+        for attempt in range(self.max_retries + 1):
+            endpoint = endpoints[attempt % len(endpoints)]
+            request = client.build_request('POST', endpoint, headers=self._endpoint_headers(headers, endpoint),
+                                           json=payload, timeout=timeouts)
+            try:
+                response = await client.send(request, stream=stream)
+            except httpx.ConnectError as e:
+                # Read timeouts are not retried: the request may already be running upstream
+                self.routing.record_failure(endpoint)
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self._next_attempt(attempt, endpoints, payload['model'],
+                                                       f"Connection to OpenAI API failed ({str(e)})"))
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES:
+                self.routing.record_failure(endpoint)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                return response, endpoint
+
+            delay = self._next_attempt(attempt, endpoints, payload['model'],
+                                       f"OpenAI API returned {response.status_code}", response)
+            if delay:
+                await asyncio.to_thread(self._pause_on_rate_limit, response.status_code, payload, delay)
+            await response.aclose()
+            await asyncio.sleep(delay)
+
+    async def _stream_pieces(self, model, lines):
+        async for line in lines:
+            contents = self._chunk_contents(model, line)
+            if contents is None:
+                return
+            for content in contents:
+                yield content
+
+    async def _hedged(self, model, kind, attempt, tokens=None, discard=None):
+        """
+        Make a request, sending a second copy if the first runs past its endpoint's p95 latency
+
+        Whichever copy succeeds first is used and the other is cancelled.
+        Only requests with a second endpoint to go to are hedged.
+
+        Args:
+            model (str): Model ID
+            kind (str): 'total' or 'ttfb', the latency the request is judged on
+            attempt (callable): Coroutine function making the request, given the endpoints to try in order
+            tokens (int): Estimated tokens, to admit the copy through the rate limiter (None never to hedge)
+            discard (callable): Coroutine function releasing the result of a copy that also succeeded
+
+        Returns:
+            object: The result of whichever copy succeeded first
+        """
+        endpoints = self.routing.order(model, self.endpoints, kind)
+        delay = self._hedge_delay(model, endpoints, kind, tokens)
+        if delay is None:
+            return await attempt(endpoints)
+
+        tasks = {asyncio.ensure_future(attempt(endpoints)): 'primary'}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not await asyncio.to_thread(self._can_hedge, model, tokens):
+                return await next(iter(tasks))
+
+            hedge_endpoints = endpoints[1:] + endpoints[:1]
+            logger.info(f"No answer from {model} after {delay:.1f}s, hedging at {endpoint_host(hedge_endpoints[0])}")
+            tasks[asyncio.ensure_future(attempt(hedge_endpoints))] = 'hedge'
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winners = [task for task in done if task.exception() is None]
+                if not winners:
+                    error = next(iter(done)).exception()
+                    continue
+                for task in pending:
+                    task.cancel()
+                if discard is not None:
+                    for task in winners[1:]:
+                        await discard(task.result())
+                HEDGED_REQUESTS.inc(model=model, winner=tasks[winners[0]])
+                return winners[0].result()
+            raise error
+        finally:
+            # Also reached if the caller is cancelled while waiting
+            for task in tasks:
+                task.cancel()
+
+    async def _complete(self, headers, payload, timeout, endpoints):
+        """
+        Make a non-streamed request, with retries and fallback, and decode the response
+
+        Returns:
+            dict: The API's JSON response
+        """
+        response = None
+        started = time.perf_counter()
+        try:
+            response, endpoint = await self._post(headers, payload, timeout=timeout, endpoints=endpoints)
+            response.raise_for_status()
+            result = response.json()
+        except httpx.HTTPError as e:
+            raise Exception(self._error_message(e, response))
+        self.routing.record(payload['model'], endpoint, KIND_TOTAL, time.perf_counter() - started)
+        return result
+
+    async def _open_stream(self, headers, payload, timeout, endpoints):
+        """
+        Start a streamed request and read it as far as the first piece of text
+
+        Returns:
+            tuple: The response, an async iterator over the rest of its text and the first piece
+                (None if there is none)
+        """
+        model = payload['model']
+        response = None
+        started = time.perf_counter()
+        try:
+            response, endpoint = await self._post(headers, payload, timeout=timeout, stream=True, endpoints=endpoints)
+            if response.is_error:
+                await response.aread()
+            response.raise_for_status()
+            pieces = self._stream_pieces(model, response.aiter_lines())
+            first = await anext(pieces, None)
+        except httpx.HTTPError as e:
+            if response is not None:
+                await response.aclose()
+            raise Exception(self._error_message(e, response))
+        except BaseException:
+            # Including cancellation, when the other copy of a hedged request won
+            if response is not None:
+                await response.aclose()
+            raise
+        self.routing.record(model, endpoint, KIND_TTFB, time.perf_counter() - started)
+        return response, pieces, first
+
+    async def get_completion(self, prompt, model="gpt-4o", max_tokens=DEFAULT_MAX_TOKENS,
+                             temperature=DEFAULT_TEMPERATURE, timeout=None, queue_timeout=None, images=None,
+                             history=None, hedge=True):
+        """
+        Get a completion from the OpenAI API, first queueing for the model's rate limit
+
+        Args:
+            prompt (str): The prompt to send to the API
+            model (str): A model ID from the registry
+            max_tokens (int): Maximum number of tokens to generate
+            temperature (float): Sampling temperature (0.0 to 1.0)
+            timeout (float): Seconds to wait for the API before giving up (defaults to the client's read timeout)
+            queue_timeout (float): Seconds to wait in the rate limiter's queue (defaults to the client's)
+            images (list): Prepared images from ImageCache.prepare to send with the prompt
+            history (list): Earlier messages of the conversation, as 'role'/'content' dicts
+            hedge (bool): Whether a slow request may be sent a second time
+
+        Returns:
+            str: The generated text
+        """
+        headers, payload = self._build_request(prompt, model, max_tokens, temperature, images=images, history=history)
+        tokens = estimate_request_tokens(prompt, max_tokens, images, history)
+        if self.rate_limiter is not None:
+            async for _ in self.rate_limiter.wait_turn_async(model, tokens,
+                                                             timeout=queue_timeout or self.queue_timeout):
+                pass
+
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = await self._hedged(model, KIND_TOTAL, lambda endpoints: self._complete(headers, payload, timeout,
+                                                                                           endpoints),
+                                        tokens if hedge else None)
+            record_usage(model, result.get("usage"))
+
+            if "choices" in result and len(result["choices"]) > 0:
+                outcome = 'ok'
+                return result["choices"][0]["message"]["content"]
+            else:
+                raise Exception("No response generated")
+        finally:
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, model=model, outcome=outcome)
+
+    async def stream_completion(self, prompt, model="gpt-4o", max_tokens=DEFAULT_MAX_TOKENS,
+                                temperature=DEFAULT_TEMPERATURE, timeout=None, images=None, history=None, hedge=True):
+        """
+        Stream a completion from the OpenAI API as it is generated
+
+        Args:
+            prompt (str): The prompt to send to the API
+            model (str): A model ID from the registry
+            max_tokens (int): Maximum number of tokens to generate
+            temperature (float): Sampling temperature (0.0 to 1.0)
+            timeout (float): Seconds to wait between chunks before giving up (defaults to the client's read timeout)
+            images (list): Prepared images from ImageCache.prepare to send with the prompt
+            history (list): Earlier messages of the conversation, as 'role'/'content' dicts
+            hedge (bool): Whether a request still waiting for its first token past the usual time may be sent again
+
+        Yields:
+            str: Pieces of generated text, in order
+        """
+        # As in OpenAIClient, queueing for the rate limiter is left to the caller
+        headers, payload = self._build_request(prompt, model, max_tokens, temperature, stream=True, images=images,
+                                               history=history)
+        tokens = estimate_request_tokens(prompt, max_tokens, images, history)
+
+        async def discard(opened):
+            await opened[0].aclose()
+
+        started = time.perf_counter()
+        try:
+            response, pieces, first = await self._hedged(
+                model, KIND_TTFB, lambda endpoints: self._open_stream(headers, payload, timeout, endpoints),
+                tokens if hedge else None, discard=discard)
+        except Exception:
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, model=model, outcome='error')
+            raise
+
+        outcome = 'error'
+        try:
+            if first is not None:
+                UPSTREAM_TTFB_SECONDS.observe(time.perf_counter() - started, model=model)
+                yield first
+                async for content in pieces:
+                    yield content
+            outcome = 'ok'
+        except httpx.HTTPError as e:
+            raise Exception(f"API stream interrupted: {str(e)}")
+        finally:
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, model=model, outcome=outcome)
+            await response.aclose()
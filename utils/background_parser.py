@@ -0,0 +1,200 @@
+"""
+Background document parsing started at upload time
+"""
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+from utils.parse_cache import ParsedTextCache
+from utils.document_parser import REPRESENTATION_FULL
+from utils.metrics import SPAN_SECONDS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STATUS_UPLOADED = 'Uploaded'
+STATUS_PARSING = 'Parsing'
+STATUS_PARSED = 'Parsed'
+STATUS_FAILED = 'Failed'
+
+
+def _parse_into_cache(file_path, content_hash, representation, cache_dir, cache_max_bytes):
+    """
+    Parse a document in a worker process and store its text in the shared cache.
+    Only the length is sent back, so large documents are not pickled between processes.
+    """
+    cache = ParsedTextCache(cache_dir, cache_max_bytes)
+    try:
+        return len(cache.parse(file_path, content_hash, representation))
+    except Exception as e:
+        # Leave a marker so every worker process can report the failure
+        cache.record_failure(file_path, content_hash, str(e), representation)
+        raise
+
+
+def _exit_with_parent(parent_pid, interval=2.0):
+    """
+    Run in each worker process: exit once the process that started it is gone.
+
+    A server stopped by a signal never shuts its pool down, and the idle
+    workers would otherwise wait on the task queue forever.
+    """
+    def watch():
+        while os.getppid() == parent_pid:
+            time.sleep(interval)
+        os._exit(0)
+
+    threading.Thread(target=watch, name='parent-watch', daemon=True).start()
+
+
+def _ready():
+    """Does nothing; submitted once so the worker processes start straight away"""
+    return True
+
+
+class BackgroundParser:
+    """
+    Parses uploads on a pool of worker processes as soon as they are saved.
+
+    PDF and Excel extraction is CPU-bound, so processes are used rather than
+    threads. Parsed text goes into the shared ParsedTextCache, which lets any
+    gunicorn worker pick it up when the prompt is submitted.
+    """
+
+    def __init__(self, parse_cache, max_workers=2):
+        """
+        Initialize the background parser
+
+        Args:
+            parse_cache (ParsedTextCache): Cache the workers write parsed text into
+            max_workers (int): Number of worker processes
+        """
+        self.parse_cache = parse_cache
+        self.max_workers = max_workers
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the worker processes now rather than on the first upload
+
+        Call this before starting any threads: the workers are forked from
+        this process, and a fork made while other threads are running copies
+        them mid-flight, along with any locks they hold.
+        """
+        with self._lock:
+            self._get_executor().submit(_ready).result()
+
+    def _get_executor(self):
+        if self._executor is None:
+            try:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_exit_with_parent,
+                                                     initargs=(os.getpid(),))
+            except (OSError, NotImplementedError) as e:
+                # Some hosts do not allow worker processes; parse on threads instead
+                logger.warning(f"Could not start parser processes ({str(e)}), using threads")
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='document-parser')
+        return self._executor
+
+    def submit(self, upload_id, file_path, content_hash=None, representation=REPRESENTATION_FULL):
+        """
+        Start parsing an uploaded file in the background
+
+        Args:
+            upload_id (str): Unique ID of the upload
+            file_path (str): Path to the saved file
+            content_hash (str): SHA-256 of the file, if already known
+            representation (str): 'full' or 'profile' (only affects spreadsheets and CSVs)
+        """
+        cache = self.parse_cache.cache
+        with self._lock:
+            future = self._get_executor().submit(_parse_into_cache, file_path, content_hash,
+                                                 representation, cache.directory, cache.max_bytes)
+            self._jobs[upload_id] = future
+        logger.info(f"Started background parse of {file_path} ({upload_id})")
+        future.add_done_callback(lambda done: self._finished(upload_id, done, file_path, content_hash,
+                                                              representation))
+
+        # Time the whole job, including queueing, since the parse itself runs in another process
+        started = time.perf_counter()
+        file_type = os.path.splitext(file_path)[1].lower().lstrip('.')
+        future.add_done_callback(lambda _: SPAN_SECONDS.observe(time.perf_counter() - started,
+                                                                span='background_parse', kind=file_type))
+
+    def _finished(self, upload_id, future, file_path, content_hash, representation):
+        """
+        Stop tracking a finished parse once the shared cache can answer for it
+
+        Text too large to cache keeps its future, since nothing else records that it was parsed.
+        """
+        if not (self.parse_cache.contains(file_path, content_hash, representation)
+                or self.parse_cache.failed(file_path, content_hash, representation)):
+            return
+        with self._lock:
+            # The upload may have been resubmitted with another representation since
+            if self._jobs.get(upload_id) is future:
+                del self._jobs[upload_id]
+
+    def status(self, upload):
+        """
+        Work out the parse status of an upload
+
+        Jobs started by another worker process are not visible here, so for
+        those the shared cache is checked for parsed text or a failure marker.
+
+        Args:
+            upload (dict): Upload record from the session
+
+        Returns:
+            str: One of Uploaded, Parsing, Parsed or Failed
+        """
+        future = self._jobs.get(upload.get('id'))
+        if future is not None:
+            if not future.done():
+                return STATUS_PARSING
+            return STATUS_FAILED if future.exception() is not None else STATUS_PARSED
+
+        if upload.get('status') != STATUS_PARSING:
+            return upload.get('status', STATUS_UPLOADED)
+        representation = upload.get('representation', REPRESENTATION_FULL)
+        if self.parse_cache.contains(upload['path'], upload.get('hash'), representation):
+            return STATUS_PARSED
+        if self.parse_cache.failed(upload['path'], upload.get('hash'), representation):
+            return STATUS_FAILED
+        return STATUS_PARSING
+
+    def wait(self, upload_id, timeout=None):
+        """
+        Wait for an in-flight parse to finish
+
+        Args:
+            upload_id (str): Unique ID of the upload
+            timeout (float): Seconds to wait before giving up
+        """
+        future = self._jobs.get(upload_id)
+        if future is None or future.done():
+            return
+
+        logger.info(f"Waiting for background parse of {upload_id}")
+        try:
+            future.result(timeout=timeout)
+        except TimeoutError:
+            logger.warning(f"Background parse of {upload_id} still running after {timeout}s")
+        except Exception as e:
+            logger.error(f"Background parse of {upload_id} failed: {str(e)}")
+
+    def forget(self, upload_id):
+        """
+        Stop tracking an upload, cancelling its parse if it has not started
+
+        Args:
+            upload_id (str): Unique ID of the upload
+        """
+        with self._lock:
+            future = self._jobs.pop(upload_id, None)
+        if future is not None:
+            future.cancel()
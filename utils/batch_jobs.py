@@ -0,0 +1,476 @@
+"""
+Persistent batch jobs: many prompts sent to models by a background worker pool
+"""
+import os
+import io
+import csv
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from utils.rate_limiter import RateLimitTimeout
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TASK_QUEUED = 'queued'
+TASK_RUNNING = 'running'
+TASK_DONE = 'done'
+TASK_FAILED = 'failed'
+
+MODE_EACH_DOCUMENT = 'each_document'
+MODE_PROMPT_LIST = 'prompt_list'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    name TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, created_at);
+
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL REFERENCES jobs (job_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    status TEXT NOT NULL,
+    response TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    worker TEXT,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_job ON tasks (job_id, position);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (status, task_id);
+"""
+
+
+class BatchQueue:
+    """
+    Job and task queue stored in SQLite.
+
+    Workers claim a task by taking a lease on it inside a write transaction,
+    which is also where the per-model concurrency limit is checked, so the
+    limit holds across every thread and process sharing the database. A
+    task whose lease runs out (its worker died or was restarted) goes back
+    to the queue, which is how jobs resume after a restart. Workers renew
+    the leases of tasks they are still running, however long the API takes.
+    """
+
+    def __init__(self, db_path, lease_seconds=180, max_attempts=3, ttl=None, cleanup_interval=600):
+        """
+        Initialize the queue, creating the database if needed
+
+        Args:
+            db_path (str): Path to the SQLite database file
+            lease_seconds (float): Seconds a task is held without its lease being renewed before it is requeued
+            max_attempts (int): Attempts per task before it is marked as failed
+            ttl (float): Seconds to keep a job and its results before it is cleaned up (None keeps them)
+            cleanup_interval (float): Minimum seconds between cleanups in this process
+        """
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = 0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(SCHEMA)
+
+    def _connection(self):
+        """Return this thread's connection to the database"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('PRAGMA foreign_keys=ON')
+            self._local.connection = connection
+        return connection
+
+    def create_job(self, owner, name, mode, tasks):
+        """
+        Queue a new job
+
+        Args:
+            owner (str): ID of the session that submitted the job
+            name (str): Short description shown in job lists
+            mode (str): MODE_EACH_DOCUMENT or MODE_PROMPT_LIST
+            tasks (list): Dicts with 'label', 'model' and 'prompt', in output order
+
+        Returns:
+            str: The new job ID
+        """
+        self.maybe_cleanup()
+        job_id = uuid.uuid4().hex
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN')
+            connection.execute('INSERT INTO jobs (job_id, owner, name, mode, created_at) VALUES (?, ?, ?, ?, ?)',
+                               (job_id, owner, name, mode, time.time()))
+            connection.executemany(
+                'INSERT INTO tasks (job_id, position, label, model, prompt, status) VALUES (?, ?, ?, ?, ?, ?)',
+                [(job_id, position, task['label'], task['model'], task['prompt'], TASK_QUEUED)
+                 for position, task in enumerate(tasks)])
+        logger.info(f"Queued batch job {job_id} with {len(tasks)} tasks")
+        return job_id
+
+    def claim(self, worker, model_limits, default_limit=1):
+        """
+        Lease the oldest queued task whose model is below its concurrency limit
+
+        Args:
+            worker (str): Identifies the claiming worker
+            model_limits (dict): Maximum concurrent tasks per model ID
+            default_limit (int): Limit for models not in model_limits
+
+        Returns:
+            dict: The task ('task_id', 'model', 'prompt', 'attempts'), or None if nothing can run now
+        """
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            # The write lock is held from here until commit, so limits cannot be overshot
+            connection.execute('BEGIN IMMEDIATE')
+            running = dict(connection.execute(
+                'SELECT model, COUNT(*) FROM tasks WHERE status = ? AND lease_until >= ? GROUP BY model',
+                (TASK_RUNNING, now)).fetchall())
+            full = [model for model, count in running.items() if count >= model_limits.get(model, default_limit)]
+
+            placeholders = ','.join('?' * len(full))
+            model_filter = f'AND model NOT IN ({placeholders}) ' if full else ''
+            task = connection.execute(
+                'SELECT task_id, model, prompt, attempts FROM tasks '
+                'WHERE (status = ? OR (status = ? AND lease_until < ?)) ' + model_filter +
+                'ORDER BY task_id LIMIT 1',
+                (TASK_QUEUED, TASK_RUNNING, now, *full)).fetchone()
+            if task is None:
+                return None
+
+            connection.execute(
+                'UPDATE tasks SET status = ?, lease_until = ?, worker = ?, attempts = attempts + 1, '
+                'started_at = ? WHERE task_id = ?',
+                (TASK_RUNNING, now + self.lease_seconds, worker, now, task['task_id']))
+        return dict(task, attempts=task['attempts'] + 1)
+
+    def renew(self, leases):
+        """
+        Extend the leases of tasks that are still being worked on
+
+        Args:
+            leases (list): (task_id, worker) pairs
+        """
+        if not leases:
+            return
+        connection = self._connection()
+        with connection:
+            # A lease that has already been reclaimed by another worker is left alone
+            connection.executemany(
+                'UPDATE tasks SET lease_until = ? WHERE task_id = ? AND worker = ? AND status = ?',
+                [(time.time() + self.lease_seconds, task_id, worker, TASK_RUNNING) for task_id, worker in leases])
+
+    def complete(self, task_id, worker, response):
+        """
+        Store a task's response
+
+        Args:
+            task_id (int): Task ID
+            worker (str): The worker holding the lease
+            response (str): Response text
+        """
+        self._finish(task_id, worker, TASK_DONE, response)
+
+    def fail(self, task_id, worker, attempts, error):
+        """
+        Record a failed attempt, requeueing the task unless it has used all its attempts
+
+        Args:
+            task_id (int): Task ID
+            worker (str): The worker holding the lease
+            attempts (int): Attempts made so far, including this one
+            error (str): Error message
+        """
+        if attempts < self.max_attempts:
+            connection = self._connection()
+            with connection:
+                connection.execute(
+                    'UPDATE tasks SET status = ?, lease_until = NULL, worker = NULL '
+                    'WHERE task_id = ? AND worker = ?',
+                    (TASK_QUEUED, task_id, worker))
+        else:
+            self._finish(task_id, worker, TASK_FAILED, f"Error: {error}")
+
+    def release(self, task_id, worker):
+        """
+        Put a task back in the queue without counting the attempt, e.g. when it never reached the API
+
+        Args:
+            task_id (int): Task ID
+            worker (str): The worker holding the lease
+        """
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'UPDATE tasks SET status = ?, lease_until = NULL, worker = NULL, attempts = attempts - 1 '
+                'WHERE task_id = ? AND worker = ?',
+                (TASK_QUEUED, task_id, worker))
+
+    def _finish(self, task_id, worker, status, response):
+        connection = self._connection()
+        with connection:
+            # A worker whose lease expired and was reclaimed no longer owns the task
+            connection.execute(
+                'UPDATE tasks SET status = ?, response = ?, lease_until = NULL, finished_at = ? '
+                'WHERE task_id = ? AND worker = ?',
+                (status, response, time.time(), task_id, worker))
+
+    def get_job(self, job_id):
+        """
+        Load a job with progress counts
+
+        Args:
+            job_id (str): Job ID
+
+        Returns:
+            dict: The job with 'total', 'done', 'failed', 'running', 'queued' and 'finished', or None
+        """
+        connection = self._connection()
+        job = connection.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        if job is None:
+            return None
+
+        counts = dict(connection.execute(
+            'SELECT status, COUNT(*) FROM tasks WHERE job_id = ? GROUP BY status', (job_id,)).fetchall())
+        result = dict(job)
+        for status in (TASK_QUEUED, TASK_RUNNING, TASK_DONE, TASK_FAILED):
+            result[status] = counts.get(status, 0)
+        result['total'] = sum(counts.values())
+        result['finished'] = result[TASK_DONE] + result[TASK_FAILED] == result['total']
+        return result
+
+    def get_tasks(self, job_id, limit=None, offset=0):
+        """
+        List a job's tasks in output order
+
+        Args:
+            job_id (str): Job ID
+            limit (int): Maximum number of tasks (None for all)
+            offset (int): Number of tasks to skip
+
+        Returns:
+            list: Dicts with position, label, model, status, response and attempts
+        """
+        return [dict(row) for row in self._connection().execute(
+            'SELECT position, label, model, status, response, attempts FROM tasks WHERE job_id = ? '
+            'ORDER BY position LIMIT ? OFFSET ?', (job_id, -1 if limit is None else limit, offset))]
+
+    def list_jobs(self, owner, limit=50):
+        """
+        List an owner's jobs with progress, newest first
+
+        Args:
+            owner (str): Session owner ID
+            limit (int): Maximum number of jobs
+
+        Returns:
+            list: Job dicts as returned by get_job
+        """
+        rows = self._connection().execute(
+            'SELECT job_id FROM jobs WHERE owner = ? ORDER BY created_at DESC LIMIT ?', (owner, limit)).fetchall()
+        return [self.get_job(row['job_id']) for row in rows]
+
+    def maybe_cleanup(self):
+        """Delete expired jobs, at most once per cleanup interval in this process"""
+        now = time.time()
+        if self.ttl is None or now - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = now
+        self.cleanup()
+
+    def cleanup(self):
+        """
+        Delete jobs older than the TTL, along with their tasks
+
+        Returns:
+            int: Number of jobs deleted
+        """
+        connection = self._connection()
+        with connection:
+            deleted = connection.execute('DELETE FROM jobs WHERE created_at < ?',
+                                         (time.time() - self.ttl,)).rowcount
+        if deleted:
+            logger.info(f"Deleted {deleted} expired batch jobs")
+        return deleted
+
+
+def export_tasks(tasks, fmt):
+    """
+    Serialise a job's results for download
+
+    Args:
+        tasks (list): Task dicts from BatchQueue.get_tasks
+        fmt (str): 'csv' or 'jsonl'
+
+    Returns:
+        str: The serialised results
+    """
+    fields = ['position', 'label', 'model', 'status', 'response']
+    if fmt == 'jsonl':
+        return ''.join(json.dumps({field: task[field] for field in fields}) + '\n' for task in tasks)
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(tasks)
+    return buffer.getvalue()
+
+
+def read_prompt_list(data):
+    """
+    Read prompts from an uploaded CSV or plain text file
+
+    A CSV with a 'prompt' column uses that column, otherwise the first
+    column of each row is used. Blank prompts are skipped.
+
+    Args:
+        data (bytes): Uploaded file contents
+
+    Returns:
+        list: Prompt strings
+    """
+    text = data.decode('utf-8-sig', errors='replace')
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        return []
+
+    header = [cell.strip().lower() for cell in rows[0]]
+    if 'prompt' in header:
+        column = header.index('prompt')
+        rows = rows[1:]
+    else:
+        column = 0
+    return [row[column].strip() for row in rows if len(row) > column and row[column].strip()]
+
+
+class BatchWorker:
+    """
+    Pool of threads that run queued batch tasks.
+
+    Each gunicorn worker process runs its own pool; they coordinate only
+    through the queue's database, so concurrency limits are shared.
+    """
+
+    def __init__(self, queue, client, threads, model_limits, default_limit=1, timeout=60, poll_interval=1.0):
+        """
+        Initialize the worker pool
+
+        Args:
+            queue (BatchQueue): Queue to take tasks from
+            client (OpenAIClient): Client used to request completions
+            threads (int): Number of worker threads in this process
+            model_limits (dict): Maximum concurrent tasks per model ID across all processes
+            default_limit (int): Limit for models not in model_limits
+            timeout (float): Seconds allowed for each completion
+            poll_interval (float): Seconds to wait when there is nothing to claim
+        """
+        self.queue = queue
+        self.client = client
+        self.threads = threads
+        self.model_limits = model_limits
+        self.default_limit = default_limit
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self._stop = threading.Event()
+        self._threads = []
+        # Task each worker thread is running, so its lease can be renewed
+        self._leases = {}
+        self._leases_lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads, and one to renew the leases of the tasks they are running"""
+        if self._threads or not self.threads:
+            return
+        for number in range(self.threads):
+            thread = threading.Thread(target=self._run, args=(f"{self.worker_id}-{number}",),
+                                      name=f'batch-worker-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._keep_leases, name='batch-leases', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        """Ask the worker threads to finish their current task and exit"""
+        self._stop.set()
+
+    def run_one(self, worker):
+        """
+        Claim and run a single task
+
+        Args:
+            worker (str): Identifies this worker thread
+
+        Returns:
+            bool: Whether a task was run
+        """
+        task = self.queue.claim(worker, self.model_limits, self.default_limit)
+        if task is None:
+            return False
+
+        with self._leases_lock:
+            self._leases[worker] = task['task_id']
+        try:
+            # Queue for the rate limit only briefly: a task that times out there goes back to the queue
+            # without using up an attempt. Batch tasks are not urgent, so slow ones are not worth paying to hedge
+            response = self.client.get_completion(task['prompt'], task['model'], timeout=self.timeout,
+                                                  queue_timeout=self.timeout, hedge=False)
+            self.queue.complete(task['task_id'], worker, response)
+        except RateLimitTimeout as e:
+            logger.info(f"Batch task {task['task_id']} requeued: {str(e)}")
+            self.queue.release(task['task_id'], worker)
+        except Exception as e:
+            logger.warning(f"Batch task {task['task_id']} attempt {task['attempts']} failed: {str(e)}")
+            self.queue.fail(task['task_id'], worker, task['attempts'], str(e))
+        finally:
+            with self._leases_lock:
+                self._leases.pop(worker, None)
+        return True
+
+    def renew_leases(self):
+        """Extend the leases of the tasks this process's threads are running"""
+        with self._leases_lock:
+            leases = [(task_id, worker) for worker, task_id in self._leases.items()]
+        self.queue.renew(leases)
+
+    def _keep_leases(self):
+        # Renew well before expiry, so one slow write does not let a lease lapse
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            try:
+                self.renew_leases()
+            except Exception as e:
+                logger.error(f"Could not renew batch task leases: {str(e)}")
+
+    def _run(self, worker):
+        while not self._stop.is_set():
+            try:
+                ran = self.run_one(worker)
+            except Exception as e:
+                logger.error(f"Batch worker error: {str(e)}")
+                ran = False
+            if not ran:
+                self._stop.wait(self.poll_interval)
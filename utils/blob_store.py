@@ -0,0 +1,276 @@
+"""
+Content-addressed storage for uploaded files
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (hash, ext)
+);
+
+CREATE TABLE IF NOT EXISTS refs (
+    owner TEXT NOT NULL,
+    upload_id TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    PRIMARY KEY (owner, upload_id)
+);
+CREATE INDEX IF NOT EXISTS refs_blob ON refs (hash, ext);
+
+CREATE TABLE IF NOT EXISTS owners (
+    owner TEXT PRIMARY KEY,
+    last_seen REAL NOT NULL
+);
+"""
+
+
+class BlobStore:
+    """
+    Stores each distinct uploaded file once, named by its SHA-256.
+
+    Sessions hold references to blobs rather than files of their own, so
+    two users uploading the same file share one copy and uploads with the
+    same name no longer overwrite each other. A sweeper drops references
+    from expired sessions, deletes blobs nobody references and evicts the
+    least recently used unreferenced blobs when the store is over its disk
+    quota. Saving a blob and sweeping both hold the database's write lock
+    while they touch the files, so a sweep cannot delete a blob between an
+    upload finding it already stored and referencing it.
+    """
+
+    def __init__(self, root, quota_bytes, session_ttl, orphan_grace=3600):
+        """
+        Initialize the store
+
+        Args:
+            root (str): Directory to store blobs and the index database in
+            quota_bytes (int): Total size of stored blobs before LRU eviction
+            session_ttl (float): Seconds after a session was last seen before its references expire
+            orphan_grace (float): Seconds an unreferenced blob is kept before deletion
+        """
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.session_ttl = session_ttl
+        self.orphan_grace = orphan_grace
+        self.db_path = os.path.join(root, 'index.sqlite3')
+        self._local = threading.local()
+        self._sweeper = None
+        os.makedirs(os.path.join(root, 'tmp'), exist_ok=True)
+
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(SCHEMA)
+
+    def _connection(self):
+        """Return this thread's connection to the index database"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def path_for(self, content_hash, ext):
+        """
+        Return where a blob is stored. The extension is kept so parsers can tell the file type.
+
+        Args:
+            content_hash (str): SHA-256 of the file
+            ext (str): File extension including the dot
+
+        Returns:
+            str: Path to the blob
+        """
+        return os.path.join(self.root, content_hash[:2], content_hash + ext)
+
+    def save(self, stream, ext, owner, upload_id):
+        """
+        Save an uploaded file, hashing it as it is written, and record that a session's upload uses it
+
+        Args:
+            stream (file-like): Readable binary stream of the upload
+            ext (str): File extension including the dot
+            owner (str): Session owner ID
+            upload_id (str): ID of the upload in the session
+
+        Returns:
+            tuple: (content hash, path to the blob)
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    file.write(chunk)
+                    size += len(chunk)
+
+            content_hash = digest.hexdigest()
+            path = self.path_for(content_hash, ext)
+            now = time.time()
+            connection = self._connection()
+            with connection:
+                # Held until commit, so the sweeper cannot delete the blob before it is referenced
+                connection.execute('BEGIN IMMEDIATE')
+                if os.path.exists(path):
+                    logger.info(f"Upload {content_hash[:12]} already stored, reusing it")
+                    os.remove(tmp_path)
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(tmp_path, path)
+                connection.execute(
+                    'INSERT INTO blobs (hash, ext, size, created_at, last_access) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (hash, ext) DO UPDATE SET last_access = excluded.last_access',
+                    (content_hash, ext, size, now, now))
+                connection.execute('INSERT OR REPLACE INTO refs (owner, upload_id, hash, ext) VALUES (?, ?, ?, ?)',
+                                   (owner, upload_id, content_hash, ext))
+                connection.execute('INSERT OR REPLACE INTO owners (owner, last_seen) VALUES (?, ?)', (owner, now))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return content_hash, path
+
+    def remove_ref(self, owner, upload_id):
+        """
+        Drop a session's reference to a blob. The blob itself is removed by the sweeper once unreferenced.
+
+        Args:
+            owner (str): Session owner ID
+            upload_id (str): ID of the upload in the session
+        """
+        connection = self._connection()
+        with connection:
+            connection.execute('DELETE FROM refs WHERE owner = ? AND upload_id = ?', (owner, upload_id))
+
+    def touch(self, owner, content_hashes=()):
+        """
+        Mark a session as active and its blobs as recently used
+
+        Args:
+            owner (str): Session owner ID
+            content_hashes (iterable): Hashes of blobs the session is using
+        """
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.execute('INSERT OR REPLACE INTO owners (owner, last_seen) VALUES (?, ?)', (owner, now))
+            connection.executemany('UPDATE blobs SET last_access = ? WHERE hash = ?',
+                                   [(now, content_hash) for content_hash in content_hashes])
+
+    def _delete_blob(self, connection, content_hash, ext):
+        try:
+            os.remove(self.path_for(content_hash, ext))
+        except FileNotFoundError:
+            pass
+        connection.execute('DELETE FROM blobs WHERE hash = ? AND ext = ?', (content_hash, ext))
+
+    def sweep(self):
+        """
+        Expire references from old sessions, delete orphaned blobs and enforce the disk quota
+
+        Returns:
+            dict: Number of expired sessions, deleted orphans and evicted blobs
+        """
+        now = time.time()
+        connection = self._connection()
+        stats = {'expired_sessions': 0, 'orphans': 0, 'evicted': 0}
+
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            expired = [row[0] for row in connection.execute(
+                'SELECT owner FROM owners WHERE last_seen < ?', (now - self.session_ttl,))]
+            for owner in expired:
+                connection.execute('DELETE FROM refs WHERE owner = ?', (owner,))
+                connection.execute('DELETE FROM owners WHERE owner = ?', (owner,))
+            stats['expired_sessions'] = len(expired)
+
+            orphans = connection.execute(
+                'SELECT b.hash, b.ext FROM blobs b WHERE b.last_access < ? AND NOT EXISTS '
+                '(SELECT 1 FROM refs r WHERE r.hash = b.hash AND r.ext = b.ext)',
+                (now - self.orphan_grace,)).fetchall()
+            for content_hash, ext in orphans:
+                self._delete_blob(connection, content_hash, ext)
+            stats['orphans'] = len(orphans)
+
+            total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+            if total > self.quota_bytes:
+                # Blobs a live session still uses are never evicted, the rest go least recently used first
+                candidates = connection.execute(
+                    'SELECT b.hash, b.ext, b.size FROM blobs b WHERE NOT EXISTS '
+                    '(SELECT 1 FROM refs r JOIN owners o ON o.owner = r.owner '
+                    'WHERE r.hash = b.hash AND r.ext = b.ext AND o.last_seen >= ?) ORDER BY b.last_access',
+                    (now - self.session_ttl,)).fetchall()
+                for content_hash, ext, size in candidates:
+                    if total <= self.quota_bytes:
+                        break
+                    connection.execute('DELETE FROM refs WHERE hash = ? AND ext = ?', (content_hash, ext))
+                    self._delete_blob(connection, content_hash, ext)
+                    total -= size
+                    stats['evicted'] += 1
+                if total > self.quota_bytes:
+                    logger.warning(f"Uploads in active sessions use {total} bytes, "
+                                   f"over the {self.quota_bytes} byte quota")
+
+        # Temporary files left behind by interrupted uploads
+        tmp_dir = os.path.join(self.root, 'tmp')
+        for name in os.listdir(tmp_dir):
+            path = os.path.join(tmp_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.orphan_grace:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        if any(stats.values()):
+            logger.info(f"Upload sweep: {stats}")
+        return stats
+
+    def usage(self):
+        """
+        Summarise disk usage
+
+        Returns:
+            dict: Number of blobs, bytes stored and the quota
+        """
+        count, total = self._connection().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs').fetchone()
+        return {'blobs': count, 'bytes': total, 'quota_bytes': self.quota_bytes}
+
+    def start_sweeper(self, interval):
+        """
+        Run sweep() periodically on a daemon thread
+
+        Args:
+            interval (float): Seconds between sweeps
+        """
+        if self._sweeper is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"Upload sweep failed: {str(e)}")
+
+        self._sweeper = threading.Thread(target=run, name='upload-sweeper', daemon=True)
+        self._sweeper.start()
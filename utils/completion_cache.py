@@ -0,0 +1,90 @@
+"""
+On-disk cache of model completions for repeated identical requests
+"""
+import json
+import hashlib
+import logging
+from utils.disk_cache import DiskCache
+from utils.metrics import record_cache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class CompletionCache:
+    """
+    Cache of model responses keyed on everything that shapes the request.
+
+    Entries expire after a TTL and the cache is size-bounded with LRU
+    eviction. It lives on disk, so every gunicorn worker shares it.
+    """
+
+    def __init__(self, directory, max_bytes, ttl):
+        """
+        Initialize the cache
+
+        Args:
+            directory (str): Directory to store cached responses in
+            max_bytes (int): Total size of cached responses before LRU eviction
+            ttl (float): Seconds a cached response stays valid
+        """
+        self.cache = DiskCache(directory, max_bytes, ttl=ttl, suffix='.json')
+
+    @staticmethod
+    def key(model, temperature, max_tokens, system_prompt, prompt, document_hashes):
+        """
+        Build the cache key for a completion request
+
+        Args:
+            model (str): Model ID
+            temperature (float): Sampling temperature
+            max_tokens (int): Maximum number of tokens to generate
+            system_prompt (str): System message sent with the request
+            prompt (str): The user's prompt
+            document_hashes (list): Content hashes of the attached documents, in prompt order
+
+        Returns:
+            str: Hex digest identifying the request
+        """
+        request = json.dumps({
+            'model': model,
+            'temperature': temperature,
+            'max_tokens': max_tokens,
+            'system_prompt': system_prompt,
+            'prompt': prompt,
+            'documents': list(document_hashes)
+        }, sort_keys=True)
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Look up a cached response
+
+        Args:
+            key (str): Key from CompletionCache.key
+
+        Returns:
+            str: The cached response text, or None on a miss
+        """
+        value = self.cache.get(key)
+        record_cache('completion', value is not None)
+        if value is None:
+            return None
+        return json.loads(value)['response']
+
+    def set(self, key, response):
+        """
+        Store a response. Error messages are never cached.
+
+        Args:
+            key (str): Key from CompletionCache.key
+            response (str): Response text from the model
+        """
+        if not response or response.startswith('Error:'):
+            return
+        self.cache.set(key, json.dumps({'response': response}).encode('utf-8'))
+
+    def stats(self):
+        """Return hit/miss counters and size of the cache"""
+        return self.cache.stats()
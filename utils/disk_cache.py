@@ -0,0 +1,218 @@
+"""
+Size-bounded on-disk cache shared between worker processes
+"""
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Eviction frees space down to this share of max_bytes, so a full cache is not walked on every write
+EVICT_TO = 0.9
+
+
+def file_sha256(file_path):
+    """
+    Compute the SHA-256 hash of a file's contents
+
+    Args:
+        file_path (str): Path to the file
+
+    Returns:
+        str: Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Key/value cache stored as one file per entry.
+
+    Entries are written atomically, so several gunicorn workers can share
+    one cache directory. The access time of each entry is its last-use
+    time: reads touch it explicitly, and eviction removes the least
+    recently used entries once the total size goes over ``max_bytes``.
+    The modification time records when an entry was written and is used
+    for the optional TTL.
+
+    Each process keeps a running total of the cache's size rather than
+    walking the directory on every write. Writes from other processes are
+    not in it, so the directory is only walked, and the total corrected,
+    once this process's total goes over ``max_bytes``.
+    """
+
+    def __init__(self, directory, max_bytes, ttl=None, suffix='.bin'):
+        """
+        Initialize the cache
+
+        Args:
+            directory (str): Directory to store cache entries in
+            max_bytes (int): Total size the cache may grow to before eviction
+            ttl (float): Seconds an entry stays valid (None keeps entries until evicted)
+            suffix (str): File extension used for entries
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + self.suffix)
+
+    def get(self, key, record=True):
+        """
+        Look up an entry
+
+        Args:
+            key (str): Cache key (hex digest or similar filesystem-safe string)
+            record (bool): Count the lookup as a hit or miss; off for lookups the cache makes for itself
+
+        Returns:
+            bytes: The cached value, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+            if self.ttl is not None and time.time() - stat.st_mtime > self.ttl:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, 'rb') as file:
+                value = file.read()
+            # Mark as recently used for LRU eviction, keeping the write time
+            os.utime(path, (time.time(), stat.st_mtime))
+        except FileNotFoundError:
+            if record:
+                with self._lock:
+                    self.misses += 1
+            return None
+
+        if record:
+            with self._lock:
+                self.hits += 1
+        return value
+
+    def contains(self, key):
+        """
+        Check whether an entry exists, without counting a hit or miss
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            bool: True if the entry is present and not expired
+        """
+        try:
+            stat = os.stat(self._path(key))
+        except FileNotFoundError:
+            return False
+        return self.ttl is None or time.time() - stat.st_mtime <= self.ttl
+
+    def set(self, key, value):
+        """
+        Store an entry, evicting old entries if the cache is over its size limit
+
+        Args:
+            key (str): Cache key
+            value (bytes): Value to store
+        """
+        if len(value) > self.max_bytes:
+            logger.info(f"Not caching {key}: {len(value)} bytes exceeds cache size")
+            return
+
+        path = self._path(key)
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(value)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            if self._size is not None:
+                self._size += len(value) - replaced
+            over = self._size is None or self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def delete(self, key):
+        """Remove an entry if it exists"""
+        path = self._path(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size -= size
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(self.suffix):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_atime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries once the cache is over max_bytes, leaving some room to grow"""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+            logger.info(f"Evicted cache entries in {self.directory}, now {total} bytes")
+        with self._lock:
+            self._size = total
+
+    def stats(self):
+        """
+        Summarise the cache
+
+        Returns:
+            dict: Hit/miss counters for this process and the on-disk size of the cache
+        """
+        entries = self._entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes
+        }
@@ -0,0 +1,103 @@
+"""
+Concurrent dispatch of a prompt to several models
+"""
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(max_workers):
+    """
+    Return the shared, bounded thread pool used for model requests
+
+    Args:
+        max_workers (int): Maximum number of concurrent model requests per process
+
+    Returns:
+        ThreadPoolExecutor: The shared executor
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='model-dispatch')
+        return _executor
+
+
+def fan_out_completions(client, prompts, model_timeout=60, deadline=90, max_workers=8, images=None, histories=None):
+    """
+    Send prompts to several models concurrently
+
+    Each model gets its own timeout, and the whole call is bounded by an
+    overall deadline. A failure or timeout for one model never affects the
+    others; it is recorded as an ``Error: ...`` string in its slot.
+
+    Args:
+        client (OpenAIClient): Client used to request completions
+        prompts (dict): Mapping of model ID to the prompt to send that model
+        model_timeout (float): Seconds allowed for each model
+        deadline (float): Seconds allowed for the whole fan-out
+        max_workers (int): Size of the shared thread pool
+        images (list): Prepared images sent to every model with its prompt
+        histories (dict): Mapping of model ID to the messages sent before its prompt
+
+    Returns:
+        dict: Mapping of model ID to response text (or error message)
+    """
+    models = list(prompts)
+    executor = get_executor(max_workers)
+    started_at = time.monotonic()
+    end_at = started_at + deadline
+    start_times = {}
+
+    def run(model):
+        start_times[model] = time.monotonic()
+        # Waiting for a rate limit counts against the model's timeout too
+        return client.get_completion(prompts[model], model, timeout=model_timeout, queue_timeout=model_timeout,
+                                     images=images, history=(histories or {}).get(model))
+
+    futures = {executor.submit(run, model): model for model in models}
+    responses = {}
+    pending = set(futures)
+
+    while pending:
+        now = time.monotonic()
+        if now >= end_at:
+            break
+
+        done, pending = wait(pending, timeout=min(end_at - now, 0.25), return_when=FIRST_COMPLETED)
+
+        for future in done:
+            model = futures[future]
+            try:
+                responses[model] = future.result()
+                logger.info(f"Got response from {model} in {time.monotonic() - start_times[model]:.2f}s")
+            except Exception as e:
+                logger.error(f"Error from OpenAI API ({model}): {str(e)}")
+                responses[model] = f"Error: {str(e)}"
+
+        # Give up on any model that has run past its own timeout
+        now = time.monotonic()
+        for future in list(pending):
+            model = futures[future]
+            if model in start_times and now - start_times[model] > model_timeout:
+                future.cancel()
+                pending.discard(future)
+                logger.error(f"Timed out waiting for {model} after {model_timeout:g}s")
+                responses[model] = f"Error: {model} did not respond within {model_timeout:g} seconds"
+
+    for future in pending:
+        model = futures[future]
+        future.cancel()
+        logger.error(f"Request deadline reached before {model} responded")
+        responses[model] = f"Error: no response from {model} within the {deadline:g} second request deadline"
+
+    # Keep responses in the order the models were selected
+    return {model: responses[model] for model in models}
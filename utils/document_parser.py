@@ -1,157 +1,301 @@
 """
 Document parsing utilities for handling various file formats
+
+Parsers are registered per file extension. Each imports its heavy library
+(PyPDF2, pandas, openpyxl) the first time it is used, so importing this
+module stays cheap for workers that never see those files.
 """
 import os
-import PyPDF2
-import pandas as pd
-from docx import Document
-import openpyxl
 import traceback
 import logging
+from config import Config
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def parse_document(file_path):
+# Bump whenever extraction output changes so cached text is re-parsed
+PARSER_VERSION = '5'
+
+# How tabular files are presented to the model: every row (up to the caps) or a statistical profile
+REPRESENTATION_FULL = 'full'
+REPRESENTATION_PROFILE = 'profile'
+REPRESENTATIONS = [REPRESENTATION_FULL, REPRESENTATION_PROFILE]
+
+# Images can be uploaded but are not parsed into text
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png']
+
+
+class ParserPlugin:
+    """A parser for one family of file types, optionally with a statistical profile for tabular data"""
+
+    def __init__(self, name, extensions, parse, profile=None):
+        """
+        Args:
+            name (str): Short name of the parser
+            extensions (list): File extensions it handles, with the dot
+            parse (callable): Function taking a file path and returning text
+            profile (callable): Function returning a statistical profile instead (tabular files only)
+        """
+        self.name = name
+        self.extensions = extensions
+        self.parse = parse
+        self.profile = profile
+
+
+_registry = {}
+
+
+def register_parser(name, extensions, profile=None):
+    """
+    Decorator that registers a parse function for some file extensions
+
+    Args:
+        name (str): Short name of the parser
+        extensions (list): File extensions it handles, with the dot
+        profile (callable): Optional function returning a statistical profile of tabular data
+
+    Returns:
+        callable: The decorator
+    """
+    def decorator(parse):
+        plugin = ParserPlugin(name, extensions, parse, profile)
+        for ext in extensions:
+            _registry[ext.lower()] = plugin
+        return parse
+    return decorator
+
+
+def get_parser(ext):
+    """
+    Look up the parser for a file extension
+
+    Args:
+        ext (str): File extension with the dot
+
+    Returns:
+        ParserPlugin: The registered parser, or None
+    """
+    return _registry.get(ext.lower())
+
+
+def supported_extensions():
+    """
+    List the file extensions that can be uploaded
+
+    Returns:
+        list: Extensions with parsers, plus images
+    """
+    return sorted(_registry) + IMAGE_EXTENSIONS
+
+
+class IncompleteText(str):
+    """
+    Extracted text that was cut short by a time budget rather than by the
+    document itself. It is used like any other text, but a later parse of
+    the same file, on a less busy machine, may get further.
+    """
+
+
+def parser_fingerprint():
+    """
+    Identify the parser output for cache keys: the parser version plus any
+    settings that change what is extracted
+
+    Returns:
+        str: Short filesystem-safe fingerprint
+    """
+    return (f"{PARSER_VERSION}p{Config.PDF_MAX_PAGES or 0}"
+            f"t{Config.TABULAR_FORMAT[0]}{Config.TABULAR_MAX_ROWS}x{Config.TABULAR_MAX_BYTES}")
+
+
+def parse_document(file_path, representation=REPRESENTATION_FULL):
     """
     Parse a document based on its file extension
 
     Args:
         file_path (str): Path to the document
+        representation (str): 'full' or 'profile' (only affects spreadsheets and CSVs)
 
     Returns:
         str: Extracted text content from the document
     """
-    _, ext = os.path.splitext(file_path)
-    ext = ext.lower()
-
     try:
-        if ext == '.pdf':
-            return parse_pdf(file_path)
-        elif ext == '.docx':
-            return parse_docx(file_path)
-        elif ext == '.xlsx' or ext == '.xls':
-            return parse_excel(file_path)
-        elif ext == '.csv':
-            return parse_csv(file_path)
-        elif ext in ['.txt', '.md', '.html', '.htm']:
-            return parse_text(file_path)
-        else:
-            # Default to treating as text
-            try:
-                return parse_text(file_path)
-            except:
-                return f"Could not parse file with extension {ext}. Supported formats are PDF, DOCX, XLSX, XLS, CSV, and text files."
+        return extract_text(file_path, representation)
     except Exception as e:
         logger.error(f"Error parsing document {file_path}: {str(e)}")
         logger.error(traceback.format_exc())
         return f"Error parsing document: {str(e)}"
 
 
+def extract_text(file_path, representation=REPRESENTATION_FULL):
+    """
+    Extract text from a document based on its file extension.
+    Unlike parse_document, parsing errors are raised rather than returned.
+
+    Args:
+        file_path (str): Path to the document
+        representation (str): 'full' or 'profile' (only affects spreadsheets and CSVs)
+
+    Returns:
+        str: Extracted text content from the document
+    """
+    _, ext = os.path.splitext(file_path)
+    plugin = get_parser(ext)
+    if plugin is None:
+        # Default to treating as text
+        try:
+            return parse_text(file_path)
+        except:
+            return f"Could not parse file with extension {ext}. Supported formats are PDF, DOCX, XLSX, XLS, CSV, and text files."
+
+    if representation == REPRESENTATION_PROFILE and plugin.profile is not None:
+        return plugin.profile(file_path)
+    return plugin.parse(file_path)
+
+
+def profile_spreadsheet(file_path):
+    """Statistical profile of each sheet in a workbook"""
+    from utils.tabular import profile_excel
+    return profile_excel(file_path, fmt=Config.TABULAR_FORMAT, max_rows=Config.PROFILE_MAX_ROWS)
+
+
+def profile_delimited(file_path):
+    """Statistical profile of a CSV file"""
+    from utils.tabular import profile_csv
+    return profile_csv(file_path, fmt=Config.TABULAR_FORMAT, max_rows=Config.PROFILE_MAX_ROWS)
+
+
+@register_parser('pdf', ['.pdf'])
 def parse_pdf(file_path):
     """
     Extract text from a PDF file
 
+    Pages that cannot be extracted are skipped and noted in the output. Text
+    cut short by PDF_TIME_BUDGET is returned as IncompleteText.
+
     Args:
         file_path (str): Path to the PDF file
 
     Returns:
         str: Extracted text content
     """
-    content = ""
-    with open(file_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        num_pages = len(reader.pages)
+    from utils.pdf_engine import extract_pdf
 
-        for page_num in range(num_pages):
-            page = reader.pages[page_num]
-            content += page.extract_text() + "\n\n"
-
-    return content
+    extraction = extract_pdf(file_path,
+                             max_pages=Config.PDF_MAX_PAGES or None,
+                             time_budget=Config.PDF_TIME_BUDGET or None)
+    if extraction.timed_out:
+        return IncompleteText(extraction.text)
+    return extraction.text
 
 
+@register_parser('docx', ['.docx'])
 def parse_docx(file_path):
     """
     Extract text from a Word document
 
+    The XML is streamed straight from the file, and tables, headers,
+    footers, footnotes and endnotes are included as well as paragraphs.
+
     Args:
         file_path (str): Path to the DOCX file
 
     Returns:
         str: Extracted text content
     """
-    document = Document(file_path)
-    content = []
+    from utils.docx_engine import extract_docx
 
-    for para in document.paragraphs:
-        content.append(para.text)
-
-    return '\n'.join(content)
+    return extract_docx(file_path)
 
 
+@register_parser('excel', ['.xlsx', '.xls'], profile=profile_spreadsheet)
 def parse_excel(file_path):
     """
     Extract data from an Excel document
 
+    Rows are streamed sheet by sheet and each sheet is capped, so very large
+    workbooks are never held in memory or sent to the model whole.
+
     Args:
         file_path (str): Path to the Excel file
 
     Returns:
         str: Extracted data as formatted text
     """
-    try:
-        # Try using pandas first
-        excel_data = pd.read_excel(file_path, sheet_name=None)
-        content = []
-
-        for sheet_name, df in excel_data.items():
-            content.append(f"Sheet: {sheet_name}")
-            content.append(df.to_string(index=False))
-            content.append("\n")
-
-        return '\n'.join(content)
-    except Exception as e:
-        logger.warning(f"Could not parse Excel with pandas: {str(e)}. Trying with openpyxl...")
-
-        # Fallback to openpyxl
-        content = []
-        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
-
-        for sheet_name in workbook.sheetnames:
-            sheet = workbook[sheet_name]
-            content.append(f"Sheet: {sheet_name}")
-
-            for row in sheet.iter_rows(values_only=True):
-                row_values = [str(val) if val is not None else "" for val in row]
-                content.append('\t'.join(row_values))
+    from utils.tabular import render_excel
 
-            content.append("\n")
-
-        return '\n'.join(content)
+    return render_excel(file_path, fmt=Config.TABULAR_FORMAT,
+                        max_rows=Config.TABULAR_MAX_ROWS, max_bytes=Config.TABULAR_MAX_BYTES)
 
 
+@register_parser('csv', ['.csv'], profile=profile_delimited)
 def parse_csv(file_path):
     """
     Extract data from a CSV file
 
+    The file is read in chunks and rendering stops at the row/byte cap.
+
     Args:
         file_path (str): Path to the CSV file
 
     Returns:
         str: Extracted data as formatted text
     """
+    from utils.tabular import render_csv
+
     try:
-        df = pd.read_csv(file_path)
-        return df.to_string(index=False)
+        return render_csv(file_path, fmt=Config.TABULAR_FORMAT,
+                          max_rows=Config.TABULAR_MAX_ROWS, max_bytes=Config.TABULAR_MAX_BYTES)
     except Exception as e:
         logger.error(f"Error parsing CSV: {str(e)}")
 
-        # Fallback to basic text parsing
-        return parse_text(file_path)
+        # Fallback to basic text parsing, within the same size cap
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
+            return file.read(Config.TABULAR_MAX_BYTES)
 
 
+@register_parser('html', ['.html', '.htm'])
+def parse_html(file_path):
+    """
+    Extract the readable text of a web page
+
+    Scripts, styles, navigation and attributes are dropped; headings, lists
+    and tables are kept as lightweight markdown.
+
+    Args:
+        file_path (str): Path to the HTML file
+
+    Returns:
+        str: Extracted text content
+    """
+    from utils.html_text import html_to_text
+
+    text = html_to_text(file_path)
+    log_reduction(file_path, text)
+    return text
+
+
+@register_parser('markdown', ['.md'])
+def parse_markdown(file_path):
+    """
+    Extract content from a markdown file, without HTML comments, scripts or styles
+
+    Args:
+        file_path (str): Path to the markdown file
+
+    Returns:
+        str: Extracted text content
+    """
+    from utils.html_text import clean_markdown
+
+    text = clean_markdown(parse_text(file_path))
+    log_reduction(file_path, text)
+    return text
+
+
+@register_parser('text', ['.txt'])
 def parse_text(file_path):
     """
     Extract content from a text file
@@ -163,4 +307,33 @@ def parse_text(file_path):
         str: Extracted text content
     """
     with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
-        return file.read()
\ No newline at end of file
+        return file.read()
+
+
+def log_reduction(file_path, text):
+    """Log how much smaller the text sent to the model is than the uploaded markup"""
+    size = os.path.getsize(file_path)
+    logger.info(f"Extracted {len(text)} characters from {size} bytes of markup "
+                f"({reduction_ratio(size, len(text)):.1f}x smaller)",
+                extra={'input_bytes': size, 'output_characters': len(text)})
+
+
+def reduction_ratio(input_bytes, output_characters):
+    """
+    How many times smaller the extracted text is than the file
+
+    Args:
+        input_bytes (int): Size of the uploaded file
+        output_characters (int): Length of the extracted text
+
+    Returns:
+        float: The ratio (the file size itself if no text was extracted)
+    """
+    return input_bytes / max(output_characters, 1)
+
+
+# Extensions whose uploads can be sent as rows or as a statistical profile
+TABULAR_EXTENSIONS = sorted(ext for ext, plugin in _registry.items() if plugin.profile is not None)
+
+# Extensions whose markup is stripped, making the text sent much smaller than the file
+MARKUP_EXTENSIONS = sorted(ext for ext, plugin in _registry.items() if plugin.name in ('html', 'markdown'))
@@ -0,0 +1,220 @@
+"""
+Streaming text extraction from Word documents
+
+A .docx file is a zip of XML parts. Rather than building python-docx's
+object model for the whole document, each part is read straight from the
+zip with iterparse and discarded paragraph by paragraph, so memory stays
+flat however long the document is. Unlike ``Document.paragraphs``, this
+also covers tables, headers, footers, footnotes and endnotes.
+"""
+import re
+import logging
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# WordprocessingML, in the usual transitional form and the ISO strict form
+W_NAMESPACES = {'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
+                'http://purl.oclc.org/ooxml/wordprocessingml/main'}
+MC_NAMESPACE = 'http://schemas.openxmlformats.org/markup-compatibility/2006'
+RELS_NAMESPACE = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+DEFAULT_MAIN_PART = 'word/document.xml'
+
+# Related parts extracted after the body, in output order, with their section titles
+RELATED_PARTS = [('header', 'Header'), ('footnotes', 'Footnotes'), ('endnotes', 'Endnotes'), ('footer', 'Footer')]
+
+# Run elements that stand for characters
+RUN_CHARACTERS = {'tab': '\t', 'br': '\n', 'cr': '\n', 'noBreakHyphen': '-'}
+
+
+def _split_tag(tag):
+    if not tag.startswith('{'):
+        return '', tag
+    namespace, _, name = tag[1:].partition('}')
+    return namespace, name
+
+
+def _attribute(element, name):
+    for key, value in element.attrib.items():
+        if _split_tag(key)[1] == name:
+            return value
+    return None
+
+
+def _natural_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+def _relationships(archive, part):
+    """
+    Read the relationships of a part
+
+    Args:
+        archive (zipfile.ZipFile): The open document
+        part (str): Part name, e.g. 'word/document.xml' ('' for the package itself)
+
+    Returns:
+        list: (relationship type, target part name) tuples for internal targets
+    """
+    directory, name = posixpath.split(part)
+    rels_name = posixpath.join(directory, '_rels', f"{name}.rels")
+    try:
+        root = ET.fromstring(archive.read(rels_name))
+    except KeyError:
+        return []
+
+    relationships = []
+    for relationship in root.iter(f"{{{RELS_NAMESPACE}}}Relationship"):
+        if relationship.get('TargetMode') == 'External':
+            continue
+        target = relationship.get('Target', '')
+        if target.startswith('/'):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join(directory, target))
+        relationships.append((relationship.get('Type', '').rsplit('/', 1)[-1], target))
+    return relationships
+
+
+def extract_part(stream, note_tag=None):
+    """
+    Extract the text of one WordprocessingML part
+
+    Paragraphs become lines. Each table row becomes one line with its cells
+    separated by " | ", and a table nested in a cell is flattened into that
+    cell as "a, b; c, d". Text deleted with tracked changes, and the fallback
+    copy Word keeps of each text box, are left out.
+
+    Args:
+        stream (file): The part's XML
+        note_tag (str): 'footnote' or 'endnote' to number each note's text
+
+    Returns:
+        list: Lines of text
+    """
+    lines = []
+    paragraphs = []   # Text of each open paragraph; text boxes nest paragraphs
+    tables = []       # Each open table: its rows, each a list of cell texts
+    cells = []        # Paragraph texts of each open table cell
+    elements = []     # Open elements, to drop each block once it has been read
+    runs = 0
+    fallback = 0
+    note_start = None
+
+    def emit(text):
+        if cells:
+            cells[-1].append(text)
+        else:
+            lines.append(text)
+
+    for event, element in ET.iterparse(stream, events=('start', 'end')):
+        namespace, name = _split_tag(element.tag)
+        if event == 'start':
+            elements.append(element)
+            if namespace == MC_NAMESPACE and name == 'Fallback':
+                fallback += 1
+            elif namespace not in W_NAMESPACES or fallback:
+                continue
+            elif name == 'p':
+                paragraphs.append([])
+            elif name == 'r':
+                runs += 1
+            elif name == 'tbl':
+                tables.append([])
+            elif name == 'tr' and tables:
+                tables[-1].append([])
+            elif name == 'tc':
+                cells.append([])
+            elif name == note_tag:
+                note_start = len(lines)
+            continue
+
+        elements.pop()
+        if namespace == MC_NAMESPACE and name == 'Fallback':
+            fallback -= 1
+            continue
+        if namespace not in W_NAMESPACES or fallback:
+            continue
+
+        if name == 't':
+            if paragraphs and element.text:
+                paragraphs[-1].append(element.text)
+        elif name in RUN_CHARACTERS:
+            # Tab stops in paragraph properties are also called 'tab'; only count those in runs
+            if paragraphs and runs:
+                paragraphs[-1].append(RUN_CHARACTERS[name])
+        elif name == 'r':
+            runs -= 1
+        elif name == 'p' and paragraphs:
+            emit(''.join(paragraphs.pop()))
+        elif name == 'tc' and cells:
+            text = ' '.join(part.strip() for part in cells.pop() if part.strip())
+            if tables and tables[-1]:
+                tables[-1][-1].append(text)
+        elif name == 'tbl' and tables:
+            rows = [row for row in tables.pop() if any(row)]
+            if cells:
+                cells[-1].append('; '.join(', '.join(cell for cell in row if cell) for row in rows))
+            else:
+                lines.extend(' | '.join(row) for row in rows)
+        elif name == note_tag and note_start is not None:
+            text = ' '.join(line.strip() for line in lines[note_start:] if line.strip())
+            del lines[note_start:]
+            # Separator notes have a type and no text of their own
+            if text and not _attribute(element, 'type'):
+                lines.append(f"[{_attribute(element, 'id')}] {text}")
+            note_start = None
+
+        # Drop each finished top-level block so the tree never grows
+        if name in ('p', 'tbl', note_tag) and not paragraphs and not tables and elements:
+            del elements[-1][:]
+
+    return lines
+
+
+def extract_docx(file_path):
+    """
+    Extract the text of a Word document: headers, body, footnotes, endnotes and footers
+
+    Args:
+        file_path (str): Path to the DOCX file
+
+    Returns:
+        str: Extracted text, with a titled section for each kind of related part that has text
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        main_part = next((target for kind, target in _relationships(archive, '')
+                          if kind == 'officeDocument'), DEFAULT_MAIN_PART)
+        related = _relationships(archive, main_part)
+
+        with archive.open(main_part) as stream:
+            body = extract_part(stream)
+
+        sections = {}
+        for kind, _ in RELATED_PARTS:
+            note_tag = kind[:-1] if kind in ('footnotes', 'endnotes') else None
+            seen = set()
+            for target in sorted((target for rel_kind, target in related if rel_kind == kind), key=_natural_key):
+                try:
+                    with archive.open(target) as stream:
+                        text = '\n'.join(line for line in extract_part(stream, note_tag) if line.strip())
+                except KeyError:
+                    logger.warning(f"{file_path} refers to a missing part: {target}")
+                    continue
+                # Sections often repeat the same header or footer
+                if text and text not in seen:
+                    seen.add(text)
+                    sections.setdefault(kind, []).append(text)
+
+    content = []
+    for kind, title in RELATED_PARTS:
+        if kind == 'footnotes':
+            content.append('\n'.join(body))
+        if kind in sections:
+            content.append(f"{title}:\n" + '\n'.join(sections[kind]))
+    return '\n\n'.join(content)
@@ -0,0 +1,284 @@
+"""
+Readable text from HTML and markdown, with the markup the model does not need removed
+
+HTML is parsed incrementally, with lxml if it is installed and the standard
+library's html.parser otherwise. Scripts, styles, navigation and other
+non-content elements are dropped along with every attribute; headings,
+lists, tables and preformatted blocks come out as lightweight markdown.
+"""
+import re
+import codecs
+import logging
+from html.parser import HTMLParser
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Size of each piece of the file fed to the parser
+CHUNK_SIZE = 64 * 1024
+
+# Elements whose contents are never text for the reader
+SKIP_TAGS = {'script', 'style', 'noscript', 'template', 'title', 'svg', 'math', 'canvas', 'iframe', 'object',
+             'nav', 'select', 'button', 'datalist'}
+
+# Elements that start a new line (headings, lists, tables and pre are handled separately)
+BLOCK_TAGS = {'p', 'div', 'section', 'article', 'main', 'header', 'footer', 'aside', 'blockquote', 'figure',
+              'figcaption', 'address', 'dl', 'dt', 'dd', 'form', 'fieldset', 'legend', 'details', 'summary',
+              'hr', 'caption'}
+
+HEADING_TAGS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+
+# Elements with no end tag; the standard library parser never reports one
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+WHITESPACE = re.compile(r'\s+')
+BLANK_LINES = re.compile(r'\n{3,}')
+HTML_COMMENT = re.compile(r'<!--.*?-->', re.DOTALL)
+MARKDOWN_RAW_BLOCKS = re.compile(r'<(script|style)\b.*?</\1\s*>', re.DOTALL | re.IGNORECASE)
+
+
+class MarkdownWriter:
+    """
+    Turns parser events into lightweight markdown.
+
+    Implements the parser target interface lxml expects (start, end, data,
+    close); the standard library parser is adapted to call the same methods.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.parts = []      # Text of the line being built
+        self.prefix = ''     # Heading or list marker for that line
+        self.skipping = []   # Open elements being dropped
+        self.lists = []      # Open lists: None for bullets or the last number used
+        self.tables = []     # Open tables: {'rows', 'row', 'cell'}
+        self.pre = None      # Raw text of an open <pre> block
+
+    def _break(self, blank=False):
+        text = ''.join(self.parts).strip()
+        if text:
+            self.lines.append(self.prefix + text)
+        self.parts = []
+        self.prefix = ''
+        if blank and self.lines and self.lines[-1]:
+            self.lines.append('')
+
+    def _close_cell(self, table):
+        if table['cell'] is not None:
+            if table['row'] is None:
+                table['row'] = []
+            table['row'].append(WHITESPACE.sub(' ', ''.join(table['cell'])).strip().replace('|', '\\|'))
+            table['cell'] = None
+
+    def _close_row(self, table):
+        self._close_cell(table)
+        if table['row'] and any(table['row']):
+            table['rows'].append(table['row'])
+        table['row'] = None
+
+    def start(self, tag, attrib=None):
+        tag = tag.lower()
+        if self.skipping or tag in SKIP_TAGS:
+            if tag not in VOID_TAGS:
+                self.skipping.append(tag)
+            return
+
+        if self.pre is not None:
+            if tag == 'br':
+                self.pre.append('\n')
+            return
+
+        table = self.tables[-1] if self.tables else None
+        if tag in ('td', 'th') and table is not None:
+            # Cells and rows often have no end tag
+            self._close_cell(table)
+            table['cell'] = []
+        elif tag == 'tr' and table is not None:
+            self._close_row(table)
+            table['row'] = []
+        elif table is not None and table['cell'] is not None:
+            # Anything else inside a cell stays on the cell's line
+            if tag == 'table':
+                self.tables.append({'rows': [], 'row': None, 'cell': None})
+            elif tag in BLOCK_TAGS or tag in ('br', 'li'):
+                table['cell'].append(' ')
+            elif tag == 'img' and attrib and attrib.get('alt'):
+                table['cell'].append(f" {attrib['alt']} ")
+        elif tag == 'table':
+            self._break(blank=True)
+            self.tables.append({'rows': [], 'row': None, 'cell': None})
+        elif tag in HEADING_TAGS:
+            self._break(blank=True)
+            self.prefix = '#' * HEADING_TAGS[tag] + ' '
+        elif tag in ('ul', 'ol'):
+            self._break()
+            self.lists.append(0 if tag == 'ol' else None)
+        elif tag == 'li':
+            self._break()
+            depth = max(len(self.lists), 1)
+            marker = '-'
+            if self.lists and self.lists[-1] is not None:
+                self.lists[-1] += 1
+                marker = f"{self.lists[-1]}."
+            self.prefix = '  ' * (depth - 1) + marker + ' '
+        elif tag == 'pre':
+            self._break(blank=True)
+            self.pre = []
+        elif tag == 'br':
+            self._break()
+        elif tag in BLOCK_TAGS:
+            self._break(blank=tag != 'div')
+        elif tag == 'img' and attrib and attrib.get('alt'):
+            self.parts.append(f" [Image: {attrib['alt']}] ")
+
+    def end(self, tag):
+        tag = tag.lower()
+        if tag in VOID_TAGS:
+            return
+        if self.skipping:
+            if tag in self.skipping:
+                # Also close any dropped elements left open inside it
+                del self.skipping[len(self.skipping) - 1 - self.skipping[::-1].index(tag):]
+            return
+
+        if tag == 'pre' and self.pre is not None:
+            text = ''.join(self.pre).strip('\n')
+            self.pre = None
+            if text.strip():
+                self.lines.extend(['```'] + text.split('\n') + ['```', ''])
+            return
+        if self.pre is not None:
+            return
+
+        table = self.tables[-1] if self.tables else None
+        if tag in ('td', 'th') and table is not None:
+            self._close_cell(table)
+        elif tag == 'tr' and table is not None:
+            self._close_row(table)
+        elif tag == 'table' and table is not None:
+            self._close_row(table)
+            self.tables.pop()
+            rows = table['rows']
+            if self.tables and self.tables[-1]['cell'] is not None:
+                # A nested table is flattened into its cell
+                self.tables[-1]['cell'].append(' ' + '; '.join(', '.join(cell for cell in row if cell)
+                                                               for row in rows) + ' ')
+            elif rows:
+                width = max(len(row) for row in rows)
+                rows = [row + [''] * (width - len(row)) for row in rows]
+                self.lines.append('| ' + ' | '.join(rows[0]) + ' |')
+                self.lines.append('|' + ' --- |' * width)
+                self.lines.extend('| ' + ' | '.join(row) + ' |' for row in rows[1:])
+                self.lines.append('')
+        elif table is not None and table['cell'] is not None:
+            if tag in BLOCK_TAGS or tag == 'li':
+                table['cell'].append(' ')
+        elif tag in HEADING_TAGS:
+            self._break(blank=True)
+        elif tag in ('ul', 'ol'):
+            self._break(blank=len(self.lists) == 1)
+            if self.lists:
+                self.lists.pop()
+        elif tag == 'li':
+            self._break()
+        elif tag in BLOCK_TAGS:
+            self._break(blank=tag != 'div')
+
+    def data(self, text):
+        if self.skipping:
+            return
+        if self.pre is not None:
+            self.pre.append(text)
+        elif self.tables and self.tables[-1]['cell'] is not None:
+            self.tables[-1]['cell'].append(text)
+        else:
+            text = WHITESPACE.sub(' ', text)
+            if not self.parts or self.parts[-1].endswith(' '):
+                text = text.lstrip()
+            if text:
+                self.parts.append(text)
+
+    def close(self):
+        self._break()
+        return BLANK_LINES.sub('\n\n', '\n'.join(line.rstrip() for line in self.lines)).strip()
+
+
+class _StandardLibraryParser(HTMLParser):
+    """html.parser front end for MarkdownWriter"""
+
+    def __init__(self, target):
+        super().__init__(convert_charrefs=True)
+        self.target = target
+
+    def handle_starttag(self, tag, attrs):
+        self.target.start(tag, dict(attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        self.target.start(tag, dict(attrs))
+        self.target.end(tag)
+
+    def handle_endtag(self, tag):
+        self.target.end(tag)
+
+    def handle_data(self, data):
+        self.target.data(data)
+
+    def close(self):
+        super().close()
+        return self.target.close()
+
+
+def make_parser(backend=None):
+    """
+    Create an incremental HTML-to-markdown parser
+
+    Args:
+        backend (str): 'lxml' or 'stdlib' (defaults to lxml when it is installed)
+
+    Returns:
+        object: A parser with feed(str) and close(), which returns the text
+    """
+    if backend in (None, 'lxml'):
+        try:
+            from lxml import etree
+            return etree.HTMLParser(target=MarkdownWriter(), remove_comments=True, remove_pis=True)
+        except ImportError:
+            if backend == 'lxml':
+                raise
+    return _StandardLibraryParser(MarkdownWriter())
+
+
+def html_to_text(file_path, backend=None):
+    """
+    Extract the readable text of an HTML file as lightweight markdown
+
+    Args:
+        file_path (str): Path to the HTML file
+        backend (str): 'lxml' or 'stdlib' (defaults to lxml when it is installed)
+
+    Returns:
+        str: Extracted text
+    """
+    parser = make_parser(backend)
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            parser.feed(decoder.decode(chunk))
+    parser.feed(decoder.decode(b'', final=True))
+    return parser.close() or ''
+
+
+def clean_markdown(text):
+    """
+    Lightly tidy markdown: drop HTML comments and embedded scripts and styles, trailing
+    whitespace and runs of blank lines. Everything else, including indentation, is kept.
+
+    Args:
+        text (str): Markdown source
+
+    Returns:
+        str: Tidied markdown
+    """
+    text = MARKDOWN_RAW_BLOCKS.sub('', HTML_COMMENT.sub('', text))
+    return BLANK_LINES.sub('\n\n', '\n'.join(line.rstrip() for line in text.split('\n'))).strip()
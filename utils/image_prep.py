@@ -0,0 +1,201 @@
+"""
+Downscaled, re-encoded copies of uploaded images for vision requests
+"""
+import io
+import os
+import json
+import math
+import base64
+import logging
+from utils.disk_cache import DiskCache, file_sha256
+from utils.metrics import record_cache, span
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The API fits 'high' detail images within 2048x2048 and then scales the
+# shortest side down to 768, while 'low' detail images are one 512x512 tile.
+# Anything larger than that is uploaded only to be thrown away.
+DETAIL_SIZES = {'low': (512, 512), 'high': (2048, 768), 'auto': (2048, 768)}
+
+MIME_TYPES = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png'}
+
+# Bump when the preprocessing changes so old cache entries are not reused
+PREP_VERSION = 1
+
+
+def image_tokens(width, height, detail='auto'):
+    """
+    Estimate the prompt tokens an image costs
+
+    Args:
+        width (int): Width in pixels (None if unknown)
+        height (int): Height in pixels (None if unknown)
+        detail (str): 'low', 'high' or 'auto'
+
+    Returns:
+        int: 85 per image plus 170 for each 512px tile at the model's resolution
+    """
+    if detail == 'low':
+        return 85
+    if not width or not height:
+        # The most tiles an image can have once scaled to 2048x768
+        return 85 + 170 * 8
+
+    max_side, short_side = DETAIL_SIZES['high']
+    scale = min(1, max_side / max(width, height))
+    scale *= min(1, short_side / (min(width, height) * scale))
+    return 85 + 170 * math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+
+
+def _fit(size, max_side, short_side):
+    width, height = size
+    scale = min(1, max_side / max(width, height), short_side / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def downscale(data, max_side, short_side, quality=85):
+    """
+    Shrink an image to the resolution the model uses and re-encode it
+
+    EXIF orientation is applied and metadata dropped. Images with transparency
+    stay PNG; everything else becomes a JPEG.
+
+    Args:
+        data (bytes): Original image file
+        max_side (int): Longest side allowed
+        short_side (int): Shortest side allowed
+        quality (int): JPEG quality
+
+    Returns:
+        tuple: (encoded bytes, MIME type, width, height)
+    """
+    from PIL import Image, ImageOps
+
+    image = Image.open(io.BytesIO(data))
+
+    # JPEGs can be decoded straight at a reduced size, much faster than decoding in full.
+    # Rotation does not change the scale needed, so this can come before EXIF orientation
+    image.draft('RGB', _fit(image.size, max_side, short_side))
+    image = ImageOps.exif_transpose(image)
+    target = _fit(image.size, max_side, short_side)
+    if target != image.size:
+        image = image.resize(target, Image.LANCZOS, reducing_gap=3.0)
+
+    output = io.BytesIO()
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image.save(output, format='PNG', optimize=True)
+        mime = 'image/png'
+    else:
+        image.convert('RGB').save(output, format='JPEG', quality=quality, optimize=True)
+        mime = 'image/jpeg'
+    return output.getvalue(), mime, image.size[0], image.size[1]
+
+
+def image_part(image):
+    """
+    Build the chat message content part for a prepared image
+
+    Args:
+        image (dict): Prepared image from ImageCache.prepare
+
+    Returns:
+        dict: An 'image_url' content part with the image inlined as a data URL
+    """
+    encoded = base64.b64encode(image['data']).decode('ascii')
+    return {'type': 'image_url', 'image_url': {'url': f"data:{image['mime']};base64,{encoded}",
+                                               'detail': image['detail']}}
+
+
+class ImageCache:
+    """
+    Cache of images prepared for the model, keyed by content hash and settings.
+
+    Each upload is downscaled once, however many prompts it is sent with
+    or sessions upload it. Without Pillow, images small enough to send
+    as they are pass through unchanged; larger ones are rejected.
+    """
+
+    def __init__(self, directory, max_bytes, detail='auto', quality=85, passthrough_bytes=4 * 1024 * 1024):
+        """
+        Initialize the cache
+
+        Args:
+            directory (str): Directory to store prepared images in
+            max_bytes (int): Total size of cached images before LRU eviction
+            detail (str): Detail level requested from the API: 'low', 'high' or 'auto'
+            quality (int): JPEG quality for re-encoded images
+            passthrough_bytes (int): Largest image sent unchanged when Pillow is not installed
+        """
+        self.cache = DiskCache(directory, max_bytes, suffix='.img')
+        self.detail = detail if detail in DETAIL_SIZES else 'auto'
+        self.quality = quality
+        self.passthrough_bytes = passthrough_bytes
+
+    def key_for(self, content_hash):
+        """Build the cache key for an image's content hash under the current settings"""
+        max_side, short_side = DETAIL_SIZES[self.detail]
+        return f"{content_hash}-{max_side}x{short_side}-q{self.quality}-v{PREP_VERSION}"
+
+    def prepare(self, file_path, content_hash=None):
+        """
+        Get an image ready to send to the model, downscaling it on first use
+
+        Args:
+            file_path (str): Path to the uploaded image
+            content_hash (str): SHA-256 of the file, if already known
+
+        Returns:
+            dict: 'data' (bytes), 'mime', 'width', 'height' (None if unknown) and 'detail'
+        """
+        _, ext = os.path.splitext(file_path)
+        content_hash = content_hash or file_sha256(file_path)
+        key = self.key_for(content_hash)
+
+        cached = self.cache.get(key)
+        record_cache('image', cached is not None)
+        if cached is not None:
+            header, data = cached.split(b'\n', 1)
+            return dict(json.loads(header), data=data, detail=self.detail)
+
+        with open(file_path, 'rb') as file:
+            original = file.read()
+
+        with span('image_prep', ext.lower().lstrip('.')):
+            try:
+                data, mime, width, height = downscale(original, *DETAIL_SIZES[self.detail], quality=self.quality)
+            except ImportError:
+                if len(original) > self.passthrough_bytes:
+                    raise ValueError(f"Image is {len(original) // 1024} KB; install Pillow to send images larger "
+                                     f"than {self.passthrough_bytes // 1024} KB")
+                return {'data': original, 'mime': MIME_TYPES.get(ext.lower(), 'image/jpeg'), 'width': None,
+                        'height': None, 'detail': self.detail}
+
+        logger.info(f"Prepared image {content_hash[:12]}: {len(original)} -> {len(data)} bytes, {width}x{height}")
+        header = json.dumps({'mime': mime, 'width': width, 'height': height}).encode('utf-8')
+        self.cache.set(key, header + b'\n' + data)
+        return {'data': data, 'mime': mime, 'width': width, 'height': height, 'detail': self.detail}
+
+    def tokens(self, file_path):
+        """
+        Estimate the prompt tokens an uploaded image will cost, reading only its header
+
+        Args:
+            file_path (str): Path to the uploaded image
+
+        Returns:
+            int: Estimated tokens, assuming the most tiles if the size cannot be read
+        """
+        try:
+            from PIL import Image
+
+            with Image.open(file_path) as image:
+                width, height = image.size
+        except Exception:
+            width = height = None
+        return image_tokens(width, height, self.detail)
+
+    def stats(self):
+        """Return cache statistics for the debug page"""
+        return self.cache.stats()
@@ -0,0 +1,279 @@
+"""
+Prometheus metrics, timing spans and structured JSON logging
+"""
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Request ID of the request being handled, included in every log line
+request_id_var = contextvars.ContextVar('request_id', default='-')
+
+# Histogram buckets in seconds, from cache lookups up to slow model responses
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Metric:
+    """Base class for a metric family with a fixed set of label names"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        """Return the metric in Prometheus text exposition format"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """A value that only goes up, such as a number of requests"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """
+        Increase the counter
+
+        Args:
+            amount (float): Amount to add
+            **labels: Label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Return the current value for a set of labels"""
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    """Distribution of observed values, such as durations, in cumulative buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """
+        Record an observation
+
+        Args:
+            value (float): Observed value
+            **labels: Label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def _samples(self):
+        samples = []
+        for key, state in self._values.items():
+            for bound, bucket_count in zip(self.buckets, state['buckets']):
+                samples.append(f"{self.name}_bucket"
+                               f"{_format_labels(self.labelnames, key, [('le', bound)])} {bucket_count}")
+            samples.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} "
+                           f"{state['count']}")
+            samples.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state['sum']}")
+            samples.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state['count']}")
+        return samples
+
+
+class Registry:
+    """Collection of metrics rendered together by the /metrics endpoint"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name, documentation, labelnames=()):
+        """Return the named counter, creating it on first use"""
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Return the named histogram, creating it on first use"""
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        """
+        Render every metric
+
+        Returns:
+            str: Prometheus text exposition format
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    'genai_http_request_seconds', 'Time to handle an HTTP request', ('endpoint', 'method', 'status'))
+SPAN_SECONDS = registry.histogram(
+    'genai_span_seconds', 'Time spent in each stage of handling a request', ('span', 'kind'))
+UPSTREAM_SECONDS = registry.histogram(
+    'genai_upstream_request_seconds', 'Time for the OpenAI API to return a full response', ('model', 'outcome'))
+UPSTREAM_TTFB_SECONDS = registry.histogram(
+    'genai_upstream_ttfb_seconds', 'Time until the OpenAI API sends the first token of a streamed response',
+    ('model',))
+TOKENS = registry.counter(
+    'genai_tokens_total', 'Tokens reported by the OpenAI API', ('model', 'type'))
+CACHE_REQUESTS = registry.counter(
+    'genai_cache_requests_total', 'Cache lookups by cache and result', ('cache', 'result'))
+HEDGED_REQUESTS = registry.counter(
+    'genai_hedged_requests_total', 'Slow model requests sent a second time, by which copy answered first',
+    ('model', 'winner'))
+ENDPOINT_FALLBACKS = registry.counter(
+    'genai_endpoint_fallbacks_total', 'Model requests moved to another API endpoint after a failure', ('model',))
+
+
+@contextmanager
+def span(name, kind=''):
+    """
+    Time a stage of request handling
+
+    Args:
+        name (str): Stage name, e.g. 'parse' or 'prompt_assembly'
+        kind (str): Sub-type, e.g. the file type or model
+
+    Yields:
+        None
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        SPAN_SECONDS.observe(elapsed, span=name, kind=kind)
+        logger.debug('span', extra={'span': name, 'kind': kind, 'seconds': round(elapsed, 6)})
+
+
+def record_cache(cache, hit):
+    """
+    Count a cache lookup
+
+    Args:
+        cache (str): Cache name
+        hit (bool): Whether the lookup was a hit
+    """
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def cache_hit_rates():
+    """
+    Summarise cache lookups in this process
+
+    Returns:
+        dict: For each cache, its hits, misses and hit rate (None before any lookups)
+    """
+    rates = {}
+    with CACHE_REQUESTS._lock:
+        values = dict(CACHE_REQUESTS._values)
+    for cache in sorted({cache for cache, _ in values}):
+        hits = values.get((cache, 'hit'), 0)
+        misses = values.get((cache, 'miss'), 0)
+        rates[cache] = {'hits': hits, 'misses': misses, 'hit_rate': round(hits / (hits + misses), 4)}
+    return rates
+
+
+def record_usage(model, usage):
+    """
+    Count the tokens an API response reports using
+
+    Args:
+        model (str): Model ID
+        usage (dict): The response's 'usage' object
+    """
+    if not usage:
+        return
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        if usage.get(kind):
+            TOKENS.inc(usage[kind], model=model, type=kind.replace('_tokens', ''))
+
+
+# Attributes every LogRecord has, so anything else was passed through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats log records as one JSON object per line, including the request ID"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': request_id_var.get(),
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(fmt='json', level=logging.INFO):
+    """
+    Send all logging to stderr, as JSON lines or plain text
+
+    Args:
+        fmt (str): 'json' or 'text'
+        level (int): Minimum level to log
+    """
+    handler = logging.StreamHandler()
+    if fmt == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'))
+        handler.addFilter(_add_request_id)
+    logging.basicConfig(level=level, handlers=[handler], force=True)
+
+
+def _add_request_id(record):
+    record.request_id = request_id_var.get()
+    return True
@@ -0,0 +1,105 @@
+"""
+The models users can choose from, defined once in configuration
+"""
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Settings a model definition may leave out
+MODEL_DEFAULTS = {'document_token_budget': 30000, 'rpm': 0, 'tpm': 0, 'default': False, 'context_window': 128000,
+                  'input_cost': 0, 'output_cost': 0}
+
+
+class ModelRegistry:
+    """
+    Models offered by the app, in display order, with each one's display name,
+    document token budget, rate limits, whether it is selected by default,
+    context window and price per million tokens.
+
+    Built from Config.AVAILABLE_MODELS (or the JSON file named by MODELS_FILE),
+    so offering another model is a configuration change. The client, the
+    rate limiter and every page read the models from here.
+    """
+
+    def __init__(self, models):
+        """
+        Initialize the registry
+
+        Args:
+            models (list): One dict per model with an 'id' and optionally 'name',
+                'document_token_budget', 'rpm', 'tpm', 'default', 'context_window',
+                'input_cost' and 'output_cost' (US dollars per million tokens)
+        """
+        self._models = {}
+        for model in models:
+            if model['id'] in self._models:
+                logger.warning(f"Model {model['id']} is defined more than once, using the last definition")
+            self._models[model['id']] = {**MODEL_DEFAULTS, 'name': model['id'], **model}
+
+        for model in self._models.values():
+            if model['tpm'] and model['tpm'] < 2 * model['document_token_budget']:
+                # The rate limiter admits a request this large only into an empty minute
+                logger.warning(f"{model['id']} allows {model['tpm']} tokens per minute, but one request may send "
+                               f"{model['document_token_budget']} tokens of documents, so a single request can use "
+                               f"most of the minute's tokens")
+
+    def __contains__(self, model_id):
+        return model_id in self._models
+
+    def __iter__(self):
+        return iter(self._models.values())
+
+    def __len__(self):
+        return len(self._models)
+
+    def ids(self):
+        """Return the model IDs in display order"""
+        return list(self._models)
+
+    def get(self, model_id):
+        """
+        Look up a model's definition
+
+        Args:
+            model_id (str): Model ID
+
+        Returns:
+            dict: The model's settings, or None if it is not offered
+        """
+        return self._models.get(model_id)
+
+    def name(self, model_id):
+        """Return a model's display name, or its ID if it is not offered"""
+        model = self._models.get(model_id)
+        return model['name'] if model else model_id
+
+    def budget(self, model_id, default):
+        """Return the document tokens a model may be sent per request"""
+        model = self._models.get(model_id)
+        return model['document_token_budget'] if model else default
+
+    def context_window(self, model_id):
+        """Return the most tokens a model's request and response may add up to"""
+        model = self._models.get(model_id)
+        return model['context_window'] if model else MODEL_DEFAULTS['context_window']
+
+    def cost(self, model_id, input_tokens, output_tokens=0):
+        """
+        Price a request
+
+        Args:
+            model_id (str): Model ID
+            input_tokens (int): Prompt tokens
+            output_tokens (int): Completion tokens
+
+        Returns:
+            float: Cost in US dollars, 0 if the model has no prices configured
+        """
+        model = self._models.get(model_id) or MODEL_DEFAULTS
+        return (input_tokens * model['input_cost'] + output_tokens * model['output_cost']) / 1_000_000
+
+    def limits(self):
+        """Return each model's requests and tokens per minute, for the rate limiter"""
+        return {model['id']: {'rpm': model['rpm'], 'tpm': model['tpm']} for model in self}
@@ -1,70 +1,517 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import os
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
+from utils.metrics import UPSTREAM_SECONDS, UPSTREAM_TTFB_SECONDS, HEDGED_REQUESTS, ENDPOINT_FALLBACKS, record_usage
+from utils.routing import RoutingPolicy, KIND_TOTAL, KIND_TTFB, endpoint_host
+from utils.tokens import estimate_tokens
+from utils.image_prep import image_part, image_tokens
+
+logger = logging.getLogger(__name__)
+
+# Request defaults, shared with the completion cache key
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant."
+DEFAULT_MAX_TOKENS = 2000
+DEFAULT_TEMPERATURE = 0.7
+
+# Responses worth retrying: rate limiting and transient upstream failures
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def estimate_request_tokens(prompt, max_tokens=DEFAULT_MAX_TOKENS, images=None, history=None):
+    """
+    Estimate the tokens a request counts against a tokens-per-minute limit
+
+    The API counts the completion's max_tokens up front, not the tokens it
+    ends up generating, so they are included in full.
+
+    Args:
+        prompt (str): The prompt to send
+        max_tokens (int): Maximum number of tokens to generate
+        images (list): Prepared images sent with the prompt
+        history (list): Earlier chat messages sent before the prompt
+
+    Returns:
+        int: Approximate token count
+    """
+    return (estimate_tokens(DEFAULT_SYSTEM_PROMPT) + estimate_tokens(prompt) + max_tokens +
+            sum(estimate_tokens(message['content']) for message in history or []) +
+            sum(image_tokens(image['width'], image['height'], image['detail']) for image in images or []))
+
+
+def _discard_loser(discard, future):
+    """Release the result of a hedged copy that finished after the other had won"""
+    if not future.cancelled() and future.exception() is None:
+        discard(future.result())
 
 
 class OpenAIClient:
     """Client for interacting with OpenAI API"""
 
-    def __init__(self, api_key=None, api_url=None):
-        """Initialize the OpenAI client with API credentials"""
+    def __init__(self, api_key=None, api_url=None, pool_size=10, connect_timeout=5, read_timeout=120,
+                 max_retries=3, backoff_base=0.5, backoff_max=20, rate_limiter=None, queue_timeout=300,
+                 fallback_api_url=None, fallback_api_key=None, models=None, routing=None):
+        """
+        Initialize the OpenAI client with API credentials
+
+        Requests share a pooled keep-alive session, so repeated calls reuse
+        open TCP/TLS connections instead of handshaking every time.
+
+        With a fallback endpoint, a failed attempt is retried there straight
+        away, and ``routing`` decides which endpoint goes first and when a
+        slow request is hedged with a second copy.
+
+        Args:
+            api_key (str): OpenAI API key
+            api_url (str): Chat completions endpoint
+            pool_size (int): Maximum number of pooled connections to the API
+            connect_timeout (float): Seconds to wait for a connection
+            read_timeout (float): Seconds to wait for data once connected
+            max_retries (int): Number of retries for 429/5xx responses and connection errors
+            backoff_base (float): Base delay in seconds for exponential backoff
+            backoff_max (float): Longest delay in seconds between retries
+            rate_limiter (RateLimiter): Shared per-model limits that get_completion queues for (None for none)
+            queue_timeout (float): Seconds get_completion may wait in the rate limiter's queue
+            fallback_api_url (str): Second chat completions endpoint serving the same models (None for none)
+            fallback_api_key (str): API key for the fallback endpoint (defaults to api_key)
+            models (ModelRegistry): Models requests may ask for (None to let the API decide)
+            routing (RoutingPolicy): Latency tracking shared by the app's clients (defaults to one without hedging)
+        """
         self.api_key = api_key or os.environ.get('OPENAI_API_KEY', '')
         self.api_url = api_url or os.environ.get('OPENAI_API_URL', 'https://api.openai.com/v1/chat/completions')
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter
+        self.queue_timeout = queue_timeout
+        self._configure_endpoints(fallback_api_url, fallback_api_key, models, routing)
+        self._init_transport()
+
+    def _init_transport(self):
+        """Set up the pooled session requests are sent on, and the threads hedged requests run on"""
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._request_pool = None
+        self._hedge_pool = None
+        self._hedge_lock = threading.Lock()
 
+    def _configure_endpoints(self, fallback_api_url, fallback_api_key, models, routing):
+        """Set up the endpoints to try, each with its own key, and the models and routing policy"""
         if not self.api_key:
             raise ValueError("OpenAI API key is required. Set it in the environment or pass it to the constructor.")
 
-    def get_completion(self, prompt, model="gpt-4o", max_tokens=2000, temperature=0.7):
+        self.endpoints = [self.api_url]
+        self.api_keys = {self.api_url: self.api_key}
+        if fallback_api_url and fallback_api_url != self.api_url:
+            self.endpoints.append(fallback_api_url)
+            self.api_keys[fallback_api_url] = fallback_api_key or self.api_key
+        self.models = models
+        self.routing = routing or RoutingPolicy(hedging=False)
+
+    def _retry_delay(self, attempt, response=None):
+        """Seconds to wait before the next attempt, honouring Retry-After if the API sent one"""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None:
+                return min(max(delay, 0), self.backoff_max)
+
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _post(self, headers, payload, timeout=None, stream=False, endpoints=None):
         """
-        Get a completion from the OpenAI API
+        POST to the API on the pooled session, retrying transient failures
+
+        Each retry goes to the next endpoint straight away; only once every
+        endpoint has failed in turn does the client back off before another round.
 
         Args:
-            prompt (str): The prompt to send to the API
-            model (str): The model to use (gpt-4o or gpt-4o-mini)
-            max_tokens (int): Maximum number of tokens to generate
-            temperature (float): Sampling temperature (0.0 to 1.0)
+            headers (dict): Request headers
+            payload (dict): JSON body
+            timeout (float): Read timeout for this call (defaults to the client's read timeout)
+            stream (bool): Whether to stream the response body
+            endpoints (list): Endpoints to try, in order (defaults to the configured order)
 
         Returns:
-            str: The generated text
+            tuple: The final requests.Response, which may still be an error status, and the endpoint it came from
+        """
+        endpoints = endpoints or self.endpoints
+        timeouts = (self.connect_timeout, timeout or self.read_timeout)
+
+        for attempt in range(self.max_retries + 1):
+            endpoint = endpoints[attempt % len(endpoints)]
+            try:
+                response = self.session.post(endpoint, headers=self._endpoint_headers(headers, endpoint),
+                                             json=payload, timeout=timeouts, stream=stream)
+            except requests.exceptions.ConnectionError as e:
+                # Read timeouts are not retried: the request may already be running upstream
+                self.routing.record_failure(endpoint)
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._next_attempt(attempt, endpoints, payload['model'],
+                                              f"Connection to OpenAI API failed ({str(e)})"))
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES:
+                self.routing.record_failure(endpoint)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                return response, endpoint
+
+            delay = self._next_attempt(attempt, endpoints, payload['model'],
+                                       f"OpenAI API returned {response.status_code}", response)
+            if delay:
+                self._pause_on_rate_limit(response.status_code, payload, delay)
+            response.close()
+            time.sleep(delay)
+
+    def _endpoint_headers(self, headers, endpoint):
+        return dict(headers, Authorization=f"Bearer {self.api_keys[endpoint]}")
+
+    def _next_attempt(self, attempt, endpoints, model, problem, response=None):
+        """
+        Log a failed attempt and decide how long to wait before the next one
+
+        Args:
+            attempt (int): Number of the attempt that failed, from 0
+            endpoints (list): Endpoints being tried, in order
+            model (str): Model ID
+            problem (str): What went wrong
+            response (Response): The failed response, for its Retry-After header
+
+        Returns:
+            float: Seconds to wait: none while another endpoint is left to try this round
         """
-        if model not in ["gpt-4o", "gpt-4o-mini"]:
-            raise ValueError("Model must be 'gpt-4o' or 'gpt-4o-mini'")
+        if (attempt + 1) % len(endpoints):
+            ENDPOINT_FALLBACKS.inc(model=model)
+            logger.warning(f"{problem} at {endpoint_host(endpoints[attempt % len(endpoints)])}, "
+                           f"trying {endpoint_host(endpoints[(attempt + 1) % len(endpoints)])}")
+            return 0
+
+        delay = self._retry_delay(attempt // len(endpoints), response)
+        logger.warning(f"{problem}, retrying in {delay:.1f}s")
+        return delay
+
+    def _pause_on_rate_limit(self, status_code, payload, delay):
+        """Hold back every process's requests to a model the API has just rate limited"""
+        if status_code == 429 and self.rate_limiter is not None:
+            self.rate_limiter.pause(payload['model'], delay)
+
+    def _build_request(self, prompt, model, max_tokens, temperature, stream=False, images=None, history=None):
+        """
+        Build the headers and JSON payload for a chat completion request
+
+        The messages are the system prompt, then ``history``, then the prompt.
+        Images are attached as content parts to the first user message, so in
+        a conversation they stay with the document context rather than moving
+        to the latest prompt, and the start of the request is identical on
+        every turn. The Authorization header is added per endpoint by _post.
+        """
+        if self.models is not None and model not in self.models:
+            raise ValueError(f"Unknown model: {model}")
 
         headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
+            "Content-Type": "application/json"
         }
 
+        messages = [{"role": "system", "content": DEFAULT_SYSTEM_PROMPT}]
+        messages += [{"role": message["role"], "content": message["content"]} for message in history or []]
+        messages.append({"role": "user", "content": prompt})
+        if images:
+            first = next(message for message in messages if message["role"] == "user")
+            first["content"] = [{"type": "text", "text": first["content"]}] + [image_part(image) for image in images]
+
         payload = {
             "model": model,
-            "messages": [
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ],
+            "messages": messages,
             "max_tokens": max_tokens,
             "temperature": temperature
         }
+        if stream:
+            payload["stream"] = True
+            # Ask for a final chunk with token usage
+            payload["stream_options"] = {"include_usage": True}
+
+        return headers, payload
+
+    @staticmethod
+    def _error_message(error, response):
+        """Turn a failed request into a readable error message"""
+        error_message = f"API request failed: {str(error)}"
+        if response is not None and hasattr(response, 'text'):
+            try:
+                error_data = json.loads(response.text)
+                if 'error' in error_data and 'message' in error_data['error']:
+                    error_message = f"API error: {error_data['error']['message']}"
+            except:
+                error_message = f"API error: {response.text}"
+        return error_message
+
+    @staticmethod
+    def _chunk_contents(model, line):
+        """
+        Decode one line of a streamed response's Server-Sent Events
+
+        Args:
+            model (str): Model ID, for token usage
+            line (str): The line
+
+        Returns:
+            list: Pieces of generated text in the line, or None once the stream is done
+        """
+        if not line or not line.startswith('data:'):
+            return []
+
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            return None
+
+        chunk = json.loads(data)
+        if 'error' in chunk:
+            raise Exception(f"API error: {chunk['error'].get('message', chunk['error'])}")
+        record_usage(model, chunk.get('usage'))
+        return [choice['delta']['content'] for choice in chunk.get('choices') or []
+                if (choice.get('delta') or {}).get('content')]
+
+    def _stream_pieces(self, model, lines):
+        for line in lines:
+            contents = self._chunk_contents(model, line)
+            if contents is None:
+                return
+            yield from contents
+
+    def _can_hedge(self, model, tokens):
+        """A hedged copy is only sent if the rate limits have room for it right now"""
+        return self.rate_limiter is None or self.rate_limiter.try_acquire(model, tokens)
+
+    def _hedge_delay(self, model, endpoints, kind, tokens):
+        """Seconds to wait before hedging a request, or None if it is not hedged"""
+        # A copy sent to the same endpoint would only double its load
+        if tokens is None or len(endpoints) < 2:
+            return None
+        return self.routing.hedge_delay(model, endpoints[0], kind)
 
+    def _hedge_executors(self):
+        """
+        Threads for the first copy of hedgeable requests, and separate threads for their hedges,
+        so a burst of slow requests cannot leave their hedges queued behind them (or the reverse)
+        """
+        with self._hedge_lock:
+            if self._hedge_pool is None:
+                self._request_pool = ThreadPoolExecutor(max_workers=self.pool_size,
+                                                        thread_name_prefix='model-request')
+                self._hedge_pool = ThreadPoolExecutor(max_workers=max(1, self.pool_size // 2),
+                                                      thread_name_prefix='model-hedge')
+            return self._request_pool, self._hedge_pool
+
+    def _hedged(self, model, kind, attempt, tokens=None, discard=None):
+        """
+        Make a request, sending a second copy if the first runs past its endpoint's p95 latency
+
+        The copy starts at the next endpoint in order, and whichever answers
+        first is used. The other is cancelled if it has not started; otherwise
+        ``discard`` releases its result once it arrives, since a blocking
+        request cannot be interrupted from another thread. Only requests with
+        a second endpoint to go to are hedged, and the delay is counted from
+        when the first copy starts, not from when it was queued.
+
+        Args:
+            model (str): Model ID
+            kind (str): 'total' or 'ttfb', the latency the request is judged on
+            attempt (callable): Makes the request, given the endpoints to try in order
+            tokens (int): Estimated tokens, to admit the copy through the rate limiter (None never to hedge)
+            discard (callable): Releases the result of the copy that lost
+
+        Returns:
+            object: The result of whichever copy succeeded first
+        """
+        endpoints = self.routing.order(model, self.endpoints, kind)
+        delay = self._hedge_delay(model, endpoints, kind, tokens)
+        if delay is None:
+            return attempt(endpoints)
+
+        request_pool, hedge_pool = self._hedge_executors()
+        started = threading.Event()
+
+        def first_copy():
+            started.set()
+            return attempt(endpoints)
+
+        primary = request_pool.submit(first_copy)
+        started.wait()
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._can_hedge(model, tokens):
+            return primary.result()
+
+        hedge_endpoints = endpoints[1:] + endpoints[:1]
+        logger.info(f"No answer from {model} after {delay:.1f}s, hedging at {endpoint_host(hedge_endpoints[0])}")
+        roles = {primary: 'primary', hedge_pool.submit(attempt, hedge_endpoints): 'hedge'}
+        pending = set(roles)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winners = [future for future in done if future.exception() is None]
+            if not winners:
+                error = next(iter(done)).exception()
+                continue
+            for loser in list(pending) + winners[1:]:
+                loser.cancel()
+                if discard is not None:
+                    loser.add_done_callback(lambda future: _discard_loser(discard, future))
+            HEDGED_REQUESTS.inc(model=model, winner=roles[winners[0]])
+            return winners[0].result()
+        raise error
+
+    def _complete(self, headers, payload, timeout, endpoints):
+        """
+        Make a non-streamed request, with retries and fallback, and decode the response
+
+        Returns:
+            dict: The API's JSON response
+        """
+        response = None
+        started = time.perf_counter()
         try:
-            response = requests.post(self.api_url, headers=headers, json=payload)
+            response, endpoint = self._post(headers, payload, timeout=timeout, endpoints=endpoints)
             response.raise_for_status()  # Raise an exception for 4XX/5XX responses
-
             result = response.json()
+        except requests.exceptions.RequestException as e:
+            # Handle connection errors or API errors
+            raise Exception(self._error_message(e, response))
+        self.routing.record(payload['model'], endpoint, KIND_TOTAL, time.perf_counter() - started)
+        return result
+
+    def _open_stream(self, headers, payload, timeout, endpoints):
+        """
+        Start a streamed request and read it as far as the first piece of text
+
+        Returns:
+            tuple: The response, an iterator over the rest of its text and the first piece (None if there is none)
+        """
+        model = payload['model']
+        response = None
+        started = time.perf_counter()
+        try:
+            response, endpoint = self._post(headers, payload, timeout=timeout, stream=True, endpoints=endpoints)
+            response.raise_for_status()
+            # SSE responses rarely declare a charset, and requests would otherwise assume Latin-1
+            response.encoding = 'utf-8'
+            pieces = self._stream_pieces(model, response.iter_lines(decode_unicode=True))
+            first = next(pieces, None)
+        except requests.exceptions.RequestException as e:
+            if response is not None:
+                response.close()
+            raise Exception(self._error_message(e, response))
+        except Exception:
+            if response is not None:
+                response.close()
+            raise
+        self.routing.record(model, endpoint, KIND_TTFB, time.perf_counter() - started)
+        return response, pieces, first
+
+    def get_completion(self, prompt, model="gpt-4o", max_tokens=DEFAULT_MAX_TOKENS, temperature=DEFAULT_TEMPERATURE,
+                       timeout=None, queue_timeout=None, images=None, history=None, hedge=True):
+        """
+        Get a completion from the OpenAI API, first queueing for the model's rate limit
+
+        Args:
+            prompt (str): The prompt to send to the API
+            model (str): A model ID from the registry
+            max_tokens (int): Maximum number of tokens to generate
+            temperature (float): Sampling temperature (0.0 to 1.0)
+            timeout (float): Seconds to wait for the API before giving up (defaults to the client's read timeout)
+            queue_timeout (float): Seconds to wait in the rate limiter's queue (defaults to the client's)
+            images (list): Prepared images from ImageCache.prepare to send with the prompt
+            history (list): Earlier messages of the conversation, as 'role'/'content' dicts
+            hedge (bool): Whether a slow request may be sent a second time
+
+        Returns:
+            str: The generated text
+        """
+        headers, payload = self._build_request(prompt, model, max_tokens, temperature, images=images, history=history)
+        tokens = estimate_request_tokens(prompt, max_tokens, images, history)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(model, tokens, timeout=queue_timeout or self.queue_timeout)
+
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = self._hedged(model, KIND_TOTAL, lambda endpoints: self._complete(headers, payload, timeout,
+                                                                                     endpoints),
+                                  tokens if hedge else None)
+            record_usage(model, result.get("usage"))
 
             if "choices" in result and len(result["choices"]) > 0:
+                outcome = 'ok'
                 return result["choices"][0]["message"]["content"]
             else:
                 raise Exception("No response generated")
+        finally:
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, model=model, outcome=outcome)
 
-        except requests.exceptions.RequestException as e:
-            # Handle connection errors or API errors
-            error_message = f"API request failed: {str(e)}"
-            if response and hasattr(response, 'text'):
-                try:
-                    error_data = json.loads(response.text)
-                    if 'error' in error_data and 'message' in error_data['error']:
-                        error_message = f"API error: {error_data['error']['message']}"
-                except:
-                    error_message = f"API error: {response.text}"
+    def stream_completion(self, prompt, model="gpt-4o", max_tokens=DEFAULT_MAX_TOKENS, temperature=DEFAULT_TEMPERATURE,
+                          timeout=None, images=None, history=None, hedge=True):
+        """
+        Stream a completion from the OpenAI API as it is generated
+
+        The API is called with ``stream=True`` and its Server-Sent Events are
+        decoded as they arrive, so the caller sees the first tokens long before
+        the whole completion is finished. Queueing for the rate limiter is left
+        to the caller, so it can report the queue position while it waits.
+        A request still waiting for its first token past the usual time is hedged.
+
+        Args:
+            prompt (str): The prompt to send to the API
+            model (str): A model ID from the registry
+            max_tokens (int): Maximum number of tokens to generate
+            temperature (float): Sampling temperature (0.0 to 1.0)
+            timeout (float): Seconds to wait between chunks before giving up (defaults to the client's read timeout)
+            images (list): Prepared images from ImageCache.prepare to send with the prompt
+            history (list): Earlier messages of the conversation, as 'role'/'content' dicts
+            hedge (bool): Whether a slow request may be sent a second time
+
+        Yields:
+            str: Pieces of generated text, in order
+        """
+        headers, payload = self._build_request(prompt, model, max_tokens, temperature, stream=True, images=images,
+                                               history=history)
+        tokens = estimate_request_tokens(prompt, max_tokens, images, history)
 
-            raise Exception(error_message)
\ No newline at end of file
+        started = time.perf_counter()
+        try:
+            response, pieces, first = self._hedged(
+                model, KIND_TTFB, lambda endpoints: self._open_stream(headers, payload, timeout, endpoints),
+                tokens if hedge else None, discard=lambda opened: opened[0].close())
+        except Exception:
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, model=model, outcome='error')
+            raise
+
+        outcome = 'error'
+        try:
+            if first is not None:
+                UPSTREAM_TTFB_SECONDS.observe(time.perf_counter() - started, model=model)
+                yield first
+                yield from pieces
+            outcome = 'ok'
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"API stream interrupted: {str(e)}")
+        finally:
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, model=model, outcome=outcome)
+            response.close()
@@ -0,0 +1,203 @@
+"""
+Content-addressed cache of extracted document text
+"""
+import os
+import logging
+import traceback
+from utils.disk_cache import DiskCache, file_sha256
+from utils.document_parser import extract_text, parser_fingerprint, IncompleteText, REPRESENTATION_FULL
+from utils.metrics import record_cache, span
+from utils.tokens import estimate_tokens, ESTIMATOR_VERSION
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds text cut short by a parse time budget is kept, so the next upload of the file tries again
+INCOMPLETE_TTL = 10 * 60
+
+
+class ParsedTextCache:
+    """
+    Cache of parsed document text keyed by file content hash and parser fingerprint.
+
+    Identical files share one entry no matter what they were called or who
+    uploaded them, so re-submitting a prompt against the same documents
+    skips parsing entirely. Text cut short by a time budget depends on how
+    busy the machine was, so it goes in a separate cache that keeps it only
+    for INCOMPLETE_TTL seconds.
+    """
+
+    def __init__(self, directory, max_bytes):
+        """
+        Initialize the cache
+
+        Args:
+            directory (str): Directory to store extracted text sidecars in
+            max_bytes (int): Total size of cached text before LRU eviction
+        """
+        self.cache = DiskCache(directory, max_bytes, suffix='.txt')
+        self.incomplete = DiskCache(f"{directory.rstrip(os.sep)}-incomplete", max_bytes // 4,
+                                    ttl=INCOMPLETE_TTL, suffix='.txt')
+
+    def key_for(self, file_path, content_hash=None, representation=REPRESENTATION_FULL):
+        """
+        Build the cache key for a file
+
+        Args:
+            file_path (str): Path to the document
+            content_hash (str): SHA-256 of the file, if already known
+            representation (str): 'full' or 'profile' (only affects spreadsheets and CSVs)
+
+        Returns:
+            str: Cache key
+        """
+        _, ext = os.path.splitext(file_path)
+        content_hash = content_hash or file_sha256(file_path)
+        return f"{content_hash}-{ext.lower().lstrip('.')}-{representation}-v{parser_fingerprint()}"
+
+    def get(self, file_path, content_hash=None, representation=REPRESENTATION_FULL):
+        """
+        Look up the cached text for a file without parsing it
+
+        Args:
+            file_path (str): Path to the document
+            content_hash (str): SHA-256 of the file, if already known
+            representation (str): 'full' or 'profile' (only affects spreadsheets and CSVs)
+
+        Returns:
+            str: The cached text, or None if the file has not been parsed yet
+        """
+        value = self._lookup(self.key_for(file_path, content_hash, representation))
+        return value.decode('utf-8') if value is not None else None
+
+    def _lookup(self, key):
+        """Cached text for a key, complete or not, without counting the lookup"""
+        value = self.cache.get(key, record=False)
+        return value if value is not None else self.incomplete.get(key, record=False)
+
+    def contains(self, file_path, content_hash=None, representation=REPRESENTATION_FULL):
+        """
+        Check whether a file's text is already cached, without reading it
+
+        Args:
+            file_path (str): Path to the document
+            content_hash (str): SHA-256 of the file, if already known
+            representation (str): 'full' or 'profile' (only affects spreadsheets and CSVs)
+
+        Returns:
+            bool: True if the parsed text is cached
+        """
+        key = self.key_for(file_path, content_hash, representation)
+        return self.cache.contains(key) or self.incomplete.contains(key)
+
+    def record_failure(self, file_path, content_hash, message, representation=REPRESENTATION_FULL):
+        """
+        Remember that a file could not be parsed
+
+        Args:
+            file_path (str): Path to the document
+            content_hash (str): SHA-256 of the file, if already known
+            message (str): Description of the error
+            representation (str): 'full' or 'profile' (only affects spreadsheets and CSVs)
+        """
+        self.cache.set(self.key_for(file_path, content_hash, representation) + '-failed', message.encode('utf-8'))
+
+    def failed(self, file_path, content_hash=None, representation=REPRESENTATION_FULL):
+        """
+        Check whether a previous attempt to parse a file failed
+
+        Args:
+            file_path (str): Path to the document
+            content_hash (str): SHA-256 of the file, if already known
+            representation (str): 'full' or 'profile' (only affects spreadsheets and CSVs)
+
+        Returns:
+            bool: True if a failure has been recorded
+        """
+        return self.cache.contains(self.key_for(file_path, content_hash, representation) + '-failed')
+
+    def parse(self, file_path, content_hash=None, representation=REPRESENTATION_FULL):
+        """
+        Return the text of a document, parsing and caching it on a miss.
+        Parsing errors are raised and nothing is cached.
+
+        Args:
+            file_path (str): Path to the document
+            content_hash (str): SHA-256 of the file, if already known
+            representation (str): 'full' or 'profile' (only affects spreadsheets and CSVs)
+
+        Returns:
+            str: Extracted text content from the document
+        """
+        key = self.key_for(file_path, content_hash, representation)
+        value = self._lookup(key)
+        record_cache('parse', value is not None)
+        if value is not None:
+            return value.decode('utf-8')
+
+        with span('extract', os.path.splitext(file_path)[1].lower().lstrip('.')):
+            content = extract_text(file_path, representation)
+        cache = self.incomplete if isinstance(content, IncompleteText) else self.cache
+        if cache is self.incomplete:
+            logger.warning(f"Parse of {file_path} ran out of time, caching its text for {INCOMPLETE_TTL}s only")
+        cache.set(key, content.encode('utf-8'))
+        # Counted while the text is at hand, so the upload page never has to re-read it
+        cache.set(self._tokens_key(key), str(estimate_tokens(content)).encode('ascii'))
+        return content
+
+    @staticmethod
+    def _tokens_key(key):
+        return f"{key}-tokens-v{ESTIMATOR_VERSION}"
+
+    def tokens(self, file_path, content_hash=None, representation=REPRESENTATION_FULL):
+        """
+        Look up the estimated token count of a file's parsed text without parsing it
+
+        Counts are stored when a file is parsed. Text cached without one (for
+        example by an older version) is counted now and the count stored.
+
+        Args:
+            file_path (str): Path to the document
+            content_hash (str): SHA-256 of the file, if already known
+            representation (str): 'full' or 'profile' (only affects spreadsheets and CSVs)
+
+        Returns:
+            int: Estimated tokens, or None if the file has not been parsed yet
+        """
+        key = self.key_for(file_path, content_hash, representation)
+        for cache in (self.cache, self.incomplete):
+            value = cache.get(self._tokens_key(key), record=False)
+            if value is not None:
+                return int(value)
+
+            text = cache.get(key, record=False)
+            if text is not None:
+                tokens = estimate_tokens(text.decode('utf-8'))
+                cache.set(self._tokens_key(key), str(tokens).encode('ascii'))
+                return tokens
+        return None
+
+    def get_or_parse(self, file_path, content_hash=None, representation=REPRESENTATION_FULL):
+        """
+        Return the text of a document, parsing and caching it on a miss.
+        Parse failures are returned as an error message and never cached.
+
+        Args:
+            file_path (str): Path to the document
+            content_hash (str): SHA-256 of the file, if already known
+            representation (str): 'full' or 'profile' (only affects spreadsheets and CSVs)
+
+        Returns:
+            str: Extracted text content from the document
+        """
+        try:
+            return self.parse(file_path, content_hash, representation)
+        except Exception as e:
+            logger.error(f"Error parsing document {file_path}: {str(e)}")
+            logger.error(traceback.format_exc())
+            return f"Error parsing document: {str(e)}"
+
+    def stats(self):
+        """Return hit/miss counters and size of the cache"""
+        return self.cache.stats()
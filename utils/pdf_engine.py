@@ -0,0 +1,126 @@
+"""
+PDF text extraction with page limits and a time budget
+
+Documents are parsed on the background parser's process pool, so several
+uploads are extracted in parallel; each document's pages are read in order
+within one worker.
+"""
+import time
+import logging
+import PyPDF2
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Reason recorded for pages not reached before the time budget ran out
+TIME_BUDGET_EXCEEDED = 'time budget exceeded'
+
+
+def parse_page_ranges(ranges, num_pages):
+    """
+    Turn a page range string into zero-based page indexes
+
+    Args:
+        ranges (str): One-based pages and ranges, e.g. "1-5, 8, 10-"
+        num_pages (int): Number of pages in the document
+
+    Returns:
+        list: Sorted, de-duplicated page indexes within the document
+    """
+    pages = set()
+    for part in ranges.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, _, stop = part.partition('-')
+            start = int(start) if start.strip() else 1
+            stop = int(stop) if stop.strip() else num_pages
+        else:
+            start = stop = int(part)
+        pages.update(range(max(start, 1) - 1, min(stop, num_pages)))
+    return sorted(pages)
+
+
+def _extract_pages(file_path, page_numbers, deadline):
+    """
+    Extract text from some pages of a PDF
+
+    Returns:
+        tuple: (list of (page, text), list of (page, reason) for pages that were skipped)
+    """
+    extracted = []
+    skipped = []
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for index, page_number in enumerate(page_numbers):
+            if deadline is not None and time.time() > deadline:
+                skipped.extend((page, TIME_BUDGET_EXCEEDED) for page in page_numbers[index:])
+                break
+            try:
+                extracted.append((page_number, reader.pages[page_number].extract_text() or ''))
+            except Exception as e:
+                skipped.append((page_number, str(e) or type(e).__name__))
+    return extracted, skipped
+
+
+class PdfExtraction:
+    """Result of extracting a PDF: the text plus which pages were left out"""
+
+    def __init__(self, pages, skipped, num_pages):
+        self.pages = sorted(pages)
+        self.skipped = sorted(skipped)
+        self.num_pages = num_pages
+
+    @property
+    def timed_out(self):
+        """Whether pages were left out because the time budget ran out, so another attempt may get further"""
+        return any(reason == TIME_BUDGET_EXCEEDED for _, reason in self.skipped)
+
+    @property
+    def text(self):
+        """Extracted text with a note on any pages that were not included"""
+        parts = [text for _, text in self.pages]
+        if self.skipped:
+            reasons = {}
+            for page, reason in self.skipped:
+                reasons.setdefault(reason, []).append(str(page + 1))
+            notes = '; '.join(f"pages {', '.join(pages)} ({reason})" for reason, pages in reasons.items())
+            parts.append(f"[Some pages were not extracted: {notes}]")
+        return '\n\n'.join(parts) + '\n\n'
+
+
+def extract_pdf(file_path, pages=None, max_pages=None, time_budget=None):
+    """
+    Extract text from a PDF, a page at a time
+
+    Pages that fail to extract, or are not reached within the time budget,
+    are skipped and listed at the end of the text rather than failing the
+    whole document.
+
+    Args:
+        file_path (str): Path to the PDF file
+        pages (str): One-based page ranges to extract, e.g. "1-10, 15" (None extracts all)
+        max_pages (int): Maximum number of pages to extract (None for no limit)
+        time_budget (float): Seconds allowed for the whole document (None for no limit)
+
+    Returns:
+        PdfExtraction: Extracted pages and skipped pages
+    """
+    deadline = time.time() + time_budget if time_budget else None
+
+    with open(file_path, 'rb') as file:
+        num_pages = len(PyPDF2.PdfReader(file).pages)
+
+    page_numbers = parse_page_ranges(pages, num_pages) if pages else list(range(num_pages))
+    skipped = []
+    if max_pages and len(page_numbers) > max_pages:
+        skipped.extend((page, f"over the {max_pages} page limit") for page in page_numbers[max_pages:])
+        page_numbers = page_numbers[:max_pages]
+
+    extracted, failed = _extract_pages(file_path, page_numbers, deadline)
+    skipped.extend(failed)
+    if skipped:
+        logger.warning(f"Skipped {len(skipped)} of {num_pages} pages in {file_path}")
+    return PdfExtraction(extracted, skipped, num_pages)
@@ -0,0 +1,360 @@
+"""
+Requests-per-minute and tokens-per-minute limits for each model, shared between processes
+"""
+import os
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from utils.metrics import registry
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Length of the sliding window the limits apply to, in seconds
+WINDOW_SECONDS = 60
+
+QUEUE_WAIT_SECONDS = registry.histogram(
+    'genai_rate_limit_wait_seconds', 'Time requests spend queued for a model\'s rate limit', ('model',),
+    buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    ticket_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tickets_model ON tickets (model, ticket_id);
+
+CREATE TABLE IF NOT EXISTS grants (
+    grant_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    granted_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS grants_model ON grants (model, granted_at);
+
+CREATE TABLE IF NOT EXISTS pauses (
+    model TEXT PRIMARY KEY,
+    until REAL NOT NULL
+);
+"""
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a request is still queued for its model's rate limit after its timeout"""
+
+
+class RateLimiter:
+    """
+    Admission queue for each model's requests and tokens per minute.
+
+    Every request takes a ticket in its model's queue and is admitted in
+    ticket order once the requests and tokens granted over the last minute
+    leave room for it. Tickets, grants and pauses (after a 429 from the API)
+    live in SQLite, so the limits and the queue order are shared by every
+    thread and worker process using the same database.
+    """
+
+    def __init__(self, db_path, limits, poll_interval=0.5, ticket_ttl=30):
+        """
+        Initialize the limiter, creating the database if needed
+
+        Args:
+            db_path (str): Path to the SQLite database file
+            limits (dict): For each model ID, a dict with 'rpm' and 'tpm' (0 or missing for no limit)
+            poll_interval (float): Longest time in seconds between checks while queued
+            ticket_ttl (float): Seconds after which a ticket that is no longer polled is dropped
+        """
+        self.db_path = db_path
+        self.limits = limits
+        self.poll_interval = poll_interval
+        self.ticket_ttl = ticket_ttl
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(SCHEMA)
+
+    def _connection(self):
+        """Return this thread's connection to the database"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def is_limited(self, model):
+        """Whether any limit applies to a model"""
+        limits = self.limits.get(model) or {}
+        return bool(limits.get('rpm') or limits.get('tpm'))
+
+    def _wait_for_room(self, connection, model, tokens, now):
+        """Seconds until a request of ``tokens`` fits within the model's limits (0 if it fits now)"""
+        limits = self.limits.get(model) or {}
+        rpm, tpm = limits.get('rpm') or 0, limits.get('tpm') or 0
+        waits = [0]
+
+        pause = connection.execute('SELECT until FROM pauses WHERE model = ?', (model,)).fetchone()
+        if pause is not None:
+            waits.append(pause['until'] - now)
+
+        grants = connection.execute('SELECT tokens, granted_at FROM grants WHERE model = ? AND granted_at > ? '
+                                    'ORDER BY granted_at', (model, now - WINDOW_SECONDS)).fetchall()
+        if rpm and len(grants) >= rpm:
+            waits.append(grants[len(grants) - rpm]['granted_at'] + WINDOW_SECONDS - now)
+        if tpm:
+            # A request larger than the whole limit is let through once the window is empty
+            excess = sum(grant['tokens'] for grant in grants) + min(tokens, tpm) - tpm
+            for grant in grants:
+                if excess <= 0:
+                    break
+                excess -= grant['tokens']
+                waits.append(grant['granted_at'] + WINDOW_SECONDS - now)
+        return max(waits)
+
+    def would_wait(self, model, tokens):
+        """
+        Check whether a request would have to queue right now
+
+        Args:
+            model (str): Model ID
+            tokens (int): Estimated tokens for the request
+
+        Returns:
+            bool: True if other requests are queued or the limits have no room for this one
+        """
+        if not self.is_limited(model):
+            return False
+        now = time.time()
+        connection = self._connection()
+        queued = connection.execute('SELECT COUNT(*) FROM tickets WHERE model = ? AND seen_at >= ?',
+                                    (model, now - self.ticket_ttl)).fetchone()[0]
+        return queued > 0 or self._wait_for_room(connection, model, tokens, now) > 0
+
+    def enqueue(self, model, tokens):
+        """
+        Join the back of a model's queue
+
+        Args:
+            model (str): Model ID
+            tokens (int): Estimated tokens for the request, counting the completion's max_tokens
+
+        Returns:
+            dict: Ticket to pass to poll() and cancel()
+        """
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            cursor = connection.execute(
+                'INSERT INTO tickets (model, tokens, created_at, seen_at) VALUES (?, ?, ?, ?)',
+                (model, tokens, now, now))
+        return {'ticket_id': cursor.lastrowid, 'model': model, 'tokens': tokens, 'created_at': now}
+
+    def poll(self, ticket):
+        """
+        Admit the ticket if it is first in its queue and the limits have room
+
+        Args:
+            ticket (dict): Ticket from enqueue()
+
+        Returns:
+            dict: 'admitted', 'position' (1 for the front of the queue) and 'wait_seconds',
+                an estimate of how long the front of the queue still has to wait
+        """
+        model = ticket['model']
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            # The write lock is held until commit, so two requests cannot take the same room
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('DELETE FROM tickets WHERE seen_at < ?', (now - self.ticket_ttl,))
+            connection.execute('DELETE FROM grants WHERE granted_at <= ?', (now - WINDOW_SECONDS,))
+            connection.execute('DELETE FROM pauses WHERE until <= ?', (now,))
+
+            # A ticket dropped while this process was stalled goes back in at its old place
+            connection.execute(
+                'INSERT OR IGNORE INTO tickets (ticket_id, model, tokens, created_at, seen_at) VALUES (?, ?, ?, ?, ?)',
+                (ticket['ticket_id'], model, ticket['tokens'], ticket['created_at'], now))
+            connection.execute('UPDATE tickets SET seen_at = ? WHERE ticket_id = ?', (now, ticket['ticket_id']))
+
+            position = connection.execute('SELECT COUNT(*) FROM tickets WHERE model = ? AND ticket_id <= ?',
+                                          (model, ticket['ticket_id'])).fetchone()[0]
+            head = connection.execute('SELECT tokens FROM tickets WHERE model = ? ORDER BY ticket_id LIMIT 1',
+                                      (model,)).fetchone()
+            wait = self._wait_for_room(connection, model, head['tokens'], now)
+
+            if position == 1 and wait <= 0:
+                connection.execute('INSERT INTO grants (model, tokens, granted_at) VALUES (?, ?, ?)',
+                                   (model, ticket['tokens'], now))
+                connection.execute('DELETE FROM tickets WHERE ticket_id = ?', (ticket['ticket_id'],))
+                return {'admitted': True, 'position': 0, 'wait_seconds': 0}
+
+        return {'admitted': False, 'position': position, 'wait_seconds': round(max(wait, 0), 1)}
+
+    def cancel(self, ticket):
+        """
+        Leave the queue without being admitted
+
+        Args:
+            ticket (dict): Ticket from enqueue()
+        """
+        connection = self._connection()
+        with connection:
+            connection.execute('DELETE FROM tickets WHERE ticket_id = ?', (ticket['ticket_id'],))
+
+    def pause(self, model, seconds):
+        """
+        Admit no requests for a model for a while, e.g. after the API answers 429
+
+        Args:
+            model (str): Model ID
+            seconds (float): How long to pause for
+        """
+        until = time.time() + seconds
+        connection = self._connection()
+        with connection:
+            connection.execute('INSERT INTO pauses (model, until) VALUES (?, ?) '
+                               'ON CONFLICT (model) DO UPDATE SET until = MAX(until, excluded.until)',
+                               (model, until))
+        logger.info(f"Pausing requests to {model} for {seconds:.1f}s")
+
+    def _delay(self, state):
+        return min(max(state['wait_seconds'], 0.05), self.poll_interval) if state['position'] == 1 \
+            else self.poll_interval
+
+    def wait_turn(self, model, tokens, timeout=None):
+        """
+        Queue for a model, reporting the queue position until the request is admitted
+
+        Stopping iteration early, e.g. because the client went away, gives up the place in the queue.
+
+        Args:
+            model (str): Model ID
+            tokens (int): Estimated tokens for the request
+            timeout (float): Seconds to wait before raising RateLimitTimeout (None to wait indefinitely)
+
+        Yields:
+            dict: 'position' and 'wait_seconds', whenever the position changes
+        """
+        if not self.is_limited(model):
+            return
+
+        ticket = self.enqueue(model, tokens)
+        started = time.monotonic()
+        admitted = False
+        last_position = None
+        try:
+            while True:
+                state = self.poll(ticket)
+                if state['admitted']:
+                    admitted = True
+                    QUEUE_WAIT_SECONDS.observe(time.monotonic() - started, model=model)
+                    return
+                if timeout is not None and time.monotonic() - started >= timeout:
+                    raise RateLimitTimeout(f"Still waiting for {model}'s rate limit after {timeout:g} seconds "
+                                           f"(position {state['position']} in the queue)")
+                if state['position'] != last_position:
+                    last_position = state['position']
+                    yield {'position': state['position'], 'wait_seconds': state['wait_seconds']}
+                time.sleep(self._delay(state))
+        finally:
+            if not admitted:
+                self.cancel(ticket)
+
+    async def wait_turn_async(self, model, tokens, timeout=None):
+        """
+        Asyncio version of wait_turn, which waits without holding a thread
+
+        Args:
+            model (str): Model ID
+            tokens (int): Estimated tokens for the request
+            timeout (float): Seconds to wait before raising RateLimitTimeout (None to wait indefinitely)
+
+        Yields:
+            dict: 'position' and 'wait_seconds', whenever the position changes
+        """
+        if not self.is_limited(model):
+            return
+
+        ticket = await asyncio.to_thread(self.enqueue, model, tokens)
+        started = time.monotonic()
+        admitted = False
+        last_position = None
+        try:
+            while True:
+                state = await asyncio.to_thread(self.poll, ticket)
+                if state['admitted']:
+                    admitted = True
+                    QUEUE_WAIT_SECONDS.observe(time.monotonic() - started, model=model)
+                    return
+                if timeout is not None and time.monotonic() - started >= timeout:
+                    raise RateLimitTimeout(f"Still waiting for {model}'s rate limit after {timeout:g} seconds "
+                                           f"(position {state['position']} in the queue)")
+                if state['position'] != last_position:
+                    last_position = state['position']
+                    yield {'position': state['position'], 'wait_seconds': state['wait_seconds']}
+                await asyncio.sleep(self._delay(state))
+        finally:
+            if not admitted:
+                await asyncio.to_thread(self.cancel, ticket)
+
+    def acquire(self, model, tokens, timeout=None):
+        """
+        Block until a request is admitted
+
+        Args:
+            model (str): Model ID
+            tokens (int): Estimated tokens for the request
+            timeout (float): Seconds to wait before raising RateLimitTimeout (None to wait indefinitely)
+        """
+        for state in self.wait_turn(model, tokens, timeout):
+            logger.info(f"Queued for {model}: position {state['position']}, "
+                        f"about {state['wait_seconds']:g}s until the front is admitted")
+
+    def try_acquire(self, model, tokens):
+        """
+        Admit a request only if it would not have to wait, e.g. for an optional hedged request
+
+        Args:
+            model (str): Model ID
+            tokens (int): Estimated tokens for the request
+
+        Returns:
+            bool: True if the request was admitted and counted against the limits
+        """
+        if not self.is_limited(model):
+            return True
+        ticket = self.enqueue(model, tokens)
+        if self.poll(ticket)['admitted']:
+            return True
+        self.cancel(ticket)
+        return False
+
+    def status(self):
+        """
+        Summarise each limited model's queue and usage over the last minute
+
+        Returns:
+            dict: For each model, its limits, 'queued', 'requests' and 'tokens'
+        """
+        now = time.time()
+        connection = self._connection()
+        summary = {}
+        for model, limits in self.limits.items():
+            if not self.is_limited(model):
+                continue
+            queued = connection.execute('SELECT COUNT(*) FROM tickets WHERE model = ? AND seen_at >= ?',
+                                        (model, now - self.ticket_ttl)).fetchone()[0]
+            used = connection.execute('SELECT COUNT(*), COALESCE(SUM(tokens), 0) FROM grants '
+                                      'WHERE model = ? AND granted_at > ?', (model, now - WINDOW_SECONDS)).fetchone()
+            summary[model] = {'rpm': limits.get('rpm') or 0, 'tpm': limits.get('tpm') or 0, 'queued': queued,
+                              'requests': used[0], 'tokens': used[1]}
+        return summary
@@ -0,0 +1,424 @@
+"""
+SQLite store for prompts and model responses
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_STREAMING = 'streaming'
+STATUS_COMPLETE = 'complete'
+
+# Turns that are waiting for a response or being answered
+UNFINISHED = (STATUS_PENDING, STATUS_STREAMING)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_owner ON runs (owner, created_at);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (created_at);
+
+CREATE TABLE IF NOT EXISTS responses (
+    run_id TEXT NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    model TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    response TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL,
+    cached INTEGER NOT NULL DEFAULT 0,
+    pending_prompt TEXT,
+    cache_key TEXT,
+    context TEXT,
+    context_images TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (run_id, model)
+);
+
+CREATE TABLE IF NOT EXISTS followups (
+    run_id TEXT NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    model TEXT NOT NULL,
+    turn INTEGER NOT NULL,
+    prompt TEXT NOT NULL,
+    response TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (run_id, model, turn)
+);
+"""
+
+# Columns added since the first release, created on databases that predate them
+ADDED_COLUMNS = {
+    'responses': [('context', 'TEXT'), ('context_images', 'TEXT')],
+}
+
+
+class ResultStore:
+    """
+    Prompts and responses stored in SQLite, keyed by run ID.
+
+    The database runs in WAL mode so readers never block the writer, and
+    every gunicorn worker can open it. The session only needs to keep the
+    ID of the latest run.
+
+    Each model's response starts a conversation that can be continued with
+    follow-up prompts. The document context sent with the first prompt is
+    stored once and resent unchanged as the first message of every turn,
+    so the API can reuse its cached prompt prefix.
+    """
+
+    def __init__(self, db_path, ttl, cleanup_interval=600):
+        """
+        Initialize the store, creating the database if needed
+
+        Args:
+            db_path (str): Path to the SQLite database file
+            ttl (float): Seconds to keep a run before it is cleaned up
+            cleanup_interval (float): Minimum seconds between cleanups in this process
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = 0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(SCHEMA)
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {row['name'] for row in connection.execute(f'PRAGMA table_info({table})')}
+            for name, column_type in columns:
+                if name not in existing:
+                    connection.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+
+    def _connection(self):
+        """Return this thread's connection to the database"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('PRAGMA foreign_keys=ON')
+            self._local.connection = connection
+        return connection
+
+    def create_run(self, owner, prompt, responses):
+        """
+        Record a new run
+
+        Args:
+            owner (str): ID of the session that submitted the prompt
+            prompt (str): The user's prompt
+            responses (list): One dict per model with 'model' and either 'response'
+                (finished) or 'pending_prompt' (still to be generated), plus
+                optional 'cached', 'cache_key', 'context' (the document context
+                sent before the prompt) and 'context_images' (a list of
+                JSON-serialisable references to images sent with the context)
+
+        Returns:
+            str: The new run ID
+        """
+        run_id = uuid.uuid4().hex
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN')
+            connection.execute('INSERT INTO runs (run_id, owner, prompt, created_at) VALUES (?, ?, ?, ?)',
+                               (run_id, owner, prompt, now))
+            connection.executemany(
+                'INSERT INTO responses (run_id, model, position, response, status, cached, pending_prompt, '
+                'cache_key, context, context_images, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(run_id, item['model'], position, item.get('response') or '',
+                  STATUS_PENDING if item.get('pending_prompt') else STATUS_COMPLETE,
+                  int(bool(item.get('cached'))), item.get('pending_prompt'), item.get('cache_key'),
+                  item.get('context'), json.dumps(item.get('context_images') or []), now)
+                 for position, item in enumerate(responses)])
+
+        self.maybe_cleanup()
+        return run_id
+
+    def get_run(self, run_id):
+        """
+        Load a run and its responses
+
+        Args:
+            run_id (str): Run ID
+
+        Returns:
+            dict: The run with a 'responses' list in model selection order, each with
+                its 'followups' in turn order, or None
+        """
+        connection = self._connection()
+        run = connection.execute('SELECT * FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        if run is None:
+            return None
+
+        responses = connection.execute(
+            'SELECT model, response, status, cached FROM responses WHERE run_id = ? ORDER BY position',
+            (run_id,)).fetchall()
+        followups = connection.execute(
+            'SELECT model, turn, prompt, response, status FROM followups WHERE run_id = ? ORDER BY turn',
+            (run_id,)).fetchall()
+        result = dict(run)
+        result['responses'] = [dict(response, followups=[dict(followup) for followup in followups
+                                                         if followup['model'] == response['model']])
+                               for response in responses]
+        return result
+
+    def get_owner(self, run_id):
+        """
+        Look up which session a run belongs to, without loading its responses
+
+        Args:
+            run_id (str): Run ID
+
+        Returns:
+            str: Owner ID, or None if the run does not exist
+        """
+        row = self._connection().execute('SELECT owner FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        return row['owner'] if row else None
+
+    def _unfinished_turn(self, connection, run_id, model):
+        """Load a model's turn that is still waiting or streaming, with what is needed to answer it"""
+        row = connection.execute(
+            'SELECT s.response, s.status, s.pending_prompt, s.cache_key, s.context, s.context_images, '
+            's.updated_at, r.prompt '
+            'FROM responses s JOIN runs r ON r.run_id = s.run_id WHERE s.run_id = ? AND s.model = ?',
+            (run_id, model)).fetchone()
+        if row is None:
+            return None
+
+        pending = {'context': row['context'],
+                   'context_images': json.loads(row['context_images']) if row['context_images'] else []}
+        if row['status'] in UNFINISHED:
+            return dict(pending, turn=0, pending_prompt=row['pending_prompt'], cache_key=row['cache_key'],
+                        history=[], status=row['status'], updated_at=row['updated_at'])
+
+        followups = connection.execute(
+            'SELECT turn, prompt, response, status, updated_at FROM followups WHERE run_id = ? AND model = ? '
+            'ORDER BY turn', (run_id, model)).fetchall()
+        history = [{'role': 'user', 'content': row['prompt']}, {'role': 'assistant', 'content': row['response']}]
+        for followup in followups:
+            if followup['status'] in UNFINISHED:
+                return dict(pending, turn=followup['turn'], pending_prompt=followup['prompt'], cache_key=None,
+                            history=history, status=followup['status'], updated_at=followup['updated_at'])
+            history += [{'role': 'user', 'content': followup['prompt']},
+                        {'role': 'assistant', 'content': followup['response']}]
+        return None
+
+    def claim_pending(self, run_id, model, stale_after=300):
+        """
+        Claim a model's waiting response, so only one request generates it
+
+        The turn is marked as streaming in the same transaction that reads it,
+        so a reloaded results page or a second tab follows the first stream
+        (see get_progress) instead of starting another completion. A stream
+        that has not saved progress for ``stale_after`` seconds is assumed to
+        have died with its worker, and its turn can be claimed again.
+
+        Args:
+            run_id (str): Run ID
+            model (str): Model ID
+            stale_after (float): Seconds without progress before a claim is taken over
+
+        Returns:
+            dict: 'turn' (0 for the first response), 'pending_prompt', 'cache_key',
+                'context', 'context_images' (a list), 'history' (the finished turns
+                before this one, as chat messages) and 'claimed' (False if another
+                request is already streaming it), or None if nothing is waiting
+        """
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            pending = self._unfinished_turn(connection, run_id, model)
+            if pending is None:
+                return None
+            claimed = pending['status'] == STATUS_PENDING or now - pending['updated_at'] > stale_after
+            if claimed:
+                if pending['turn']:
+                    connection.execute(
+                        "UPDATE followups SET status = ?, response = '', updated_at = ? "
+                        "WHERE run_id = ? AND model = ? AND turn = ?",
+                        (STATUS_STREAMING, now, run_id, model, pending['turn']))
+                else:
+                    connection.execute(
+                        "UPDATE responses SET status = ?, response = '', updated_at = ? WHERE run_id = ? AND model = ?",
+                        (STATUS_STREAMING, now, run_id, model))
+        return dict(pending, claimed=claimed)
+
+    def save_progress(self, run_id, model, turn, response):
+        """
+        Store the text streamed so far, for other requests following the stream
+
+        Args:
+            run_id (str): Run ID
+            model (str): Model ID
+            turn (int): 0 for the first response, or the follow-up's turn number
+            response (str): Text so far
+        """
+        connection = self._connection()
+        with connection:
+            if turn:
+                connection.execute(
+                    'UPDATE followups SET response = ?, updated_at = ? '
+                    'WHERE run_id = ? AND model = ? AND turn = ? AND status = ?',
+                    (response, time.time(), run_id, model, turn, STATUS_STREAMING))
+            else:
+                connection.execute(
+                    'UPDATE responses SET response = ?, updated_at = ? WHERE run_id = ? AND model = ? AND status = ?',
+                    (response, time.time(), run_id, model, STATUS_STREAMING))
+
+    def release(self, run_id, model, turn):
+        """
+        Give up a claimed turn without answering it, so the next request can claim it
+
+        Args:
+            run_id (str): Run ID
+            model (str): Model ID
+            turn (int): 0 for the first response, or the follow-up's turn number
+        """
+        connection = self._connection()
+        with connection:
+            if turn:
+                connection.execute(
+                    "UPDATE followups SET status = ?, response = '', updated_at = ? "
+                    "WHERE run_id = ? AND model = ? AND turn = ? AND status = ?",
+                    (STATUS_PENDING, time.time(), run_id, model, turn, STATUS_STREAMING))
+            else:
+                connection.execute(
+                    "UPDATE responses SET status = ?, response = '', updated_at = ? "
+                    "WHERE run_id = ? AND model = ? AND status = ?",
+                    (STATUS_PENDING, time.time(), run_id, model, STATUS_STREAMING))
+
+    def get_progress(self, run_id, model, turn):
+        """
+        Read a turn's response as it stands
+
+        Args:
+            run_id (str): Run ID
+            model (str): Model ID
+            turn (int): 0 for the first response, or the follow-up's turn number
+
+        Returns:
+            dict: 'response' (the text so far), 'status' and 'updated_at' (when progress was
+                last saved), or None if there is no such turn
+        """
+        if turn:
+            row = self._connection().execute(
+                'SELECT response, status, updated_at FROM followups WHERE run_id = ? AND model = ? AND turn = ?',
+                (run_id, model, turn)).fetchone()
+        else:
+            row = self._connection().execute(
+                'SELECT response, status, updated_at FROM responses WHERE run_id = ? AND model = ?',
+                (run_id, model)).fetchone()
+        return dict(row) if row is not None else None
+
+    def add_followup(self, run_id, model, prompt):
+        """
+        Queue a follow-up prompt in a model's conversation
+
+        Args:
+            run_id (str): Run ID
+            model (str): Model ID
+            prompt (str): The follow-up prompt
+
+        Returns:
+            int: The new turn number, or None if the model is not part of the run
+                or is still answering an earlier prompt
+        """
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            response = connection.execute('SELECT status FROM responses WHERE run_id = ? AND model = ?',
+                                          (run_id, model)).fetchone()
+            if response is None or response['status'] in UNFINISHED:
+                return None
+            last = connection.execute(
+                'SELECT turn, status FROM followups WHERE run_id = ? AND model = ? ORDER BY turn DESC LIMIT 1',
+                (run_id, model)).fetchone()
+            if last is not None and last['status'] in UNFINISHED:
+                return None
+
+            turn = last['turn'] + 1 if last is not None else 1
+            connection.execute(
+                'INSERT INTO followups (run_id, model, turn, prompt, status, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', (run_id, model, turn, prompt, STATUS_PENDING, now, now))
+        return turn
+
+    def complete_response(self, run_id, model, response, turn=0):
+        """
+        Store a finished response and drop the prompt that was kept to generate it
+
+        Args:
+            run_id (str): Run ID
+            model (str): Model ID
+            response (str): Response text (or error message)
+            turn (int): 0 for the first response, or the follow-up's turn number
+        """
+        connection = self._connection()
+        with connection:
+            if turn:
+                connection.execute(
+                    'UPDATE followups SET response = ?, status = ?, updated_at = ? '
+                    'WHERE run_id = ? AND model = ? AND turn = ?',
+                    (response, STATUS_COMPLETE, time.time(), run_id, model, turn))
+            else:
+                connection.execute(
+                    'UPDATE responses SET response = ?, status = ?, pending_prompt = NULL, updated_at = ? '
+                    'WHERE run_id = ? AND model = ?',
+                    (response, STATUS_COMPLETE, time.time(), run_id, model))
+
+    def list_runs(self, owner, limit=50):
+        """
+        List an owner's recent runs, newest first
+
+        Args:
+            owner (str): Session owner ID
+            limit (int): Maximum number of runs
+
+        Returns:
+            list: Dicts with run_id, prompt, created_at and models
+        """
+        rows = self._connection().execute(
+            "SELECT r.run_id, r.prompt, r.created_at, group_concat(s.model, ',') AS models "
+            "FROM runs r JOIN responses s ON s.run_id = r.run_id "
+            "WHERE r.owner = ? GROUP BY r.run_id ORDER BY r.created_at DESC LIMIT ?",
+            (owner, limit)).fetchall()
+        return [dict(row, models=row['models'].split(',') if row['models'] else []) for row in rows]
+
+    def maybe_cleanup(self):
+        """Delete expired runs, at most once per cleanup interval in this process"""
+        now = time.time()
+        if now - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = now
+        self.cleanup()
+
+    def cleanup(self):
+        """
+        Delete runs older than the TTL
+
+        Returns:
+            int: Number of runs deleted
+        """
+        connection = self._connection()
+        with connection:
+            deleted = connection.execute('DELETE FROM runs WHERE created_at < ?',
+                                         (time.time() - self.ttl,)).rowcount
+        if deleted:
+            logger.info(f"Deleted {deleted} expired result runs")
+        return deleted
@@ -0,0 +1,325 @@
+"""
+Lexical retrieval of the most relevant document chunks for a prompt
+"""
+import re
+import logging
+import threading
+from collections import Counter, OrderedDict
+from utils.tokens import estimate_tokens
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# Rough characters-per-token ratio for English text, used to size chunks before they are counted
+CHARS_PER_TOKEN = 4
+
+# Number of document sets whose index is kept in memory
+INDEX_CACHE_SIZE = 32
+
+
+# Column separators that mark a paragraph as a rendered table (CSV, tab-separated or Markdown)
+TABLE_DELIMITERS = (',', '\t', '|')
+
+# Data rows checked for the header's delimiter before a paragraph is treated as a table
+TABLE_SAMPLE_ROWS = 5
+
+
+def _table_header(lines):
+    """
+    Find the lines that head a rendered table, so they can be repeated in each of its chunks
+
+    Args:
+        lines (list): Lines of one paragraph
+
+    Returns:
+        list: The sheet title, column header and Markdown separator lines, or an empty list
+            if the paragraph does not look like a table
+    """
+    start = 1 if lines[0].startswith('Sheet: ') else 0
+    if len(lines) < start + 2:
+        return []
+    header = lines[start]
+    sample = lines[start + 1:start + 1 + TABLE_SAMPLE_ROWS]
+    if not any(delimiter in header and all(delimiter in line for line in sample) for delimiter in TABLE_DELIMITERS):
+        return []
+    end = start + 1
+    if header.startswith('|') and re.fullmatch(r'\|(-+\|)+', lines[end]):
+        end += 1
+    return lines[:end]
+
+
+def _split_words(line, max_chars):
+    """Split a single line longer than a chunk on whitespace"""
+    pieces = []
+    piece = []
+    piece_len = 0
+    for word in line.split():
+        if piece_len + len(word) + 1 > max_chars and piece:
+            pieces.append(' '.join(piece))
+            piece, piece_len = [], 0
+        piece.append(word)
+        piece_len += len(word) + 1
+    if piece:
+        pieces.append(' '.join(piece))
+    return pieces
+
+
+def _split_paragraph(paragraph, max_chars):
+    """
+    Split a paragraph longer than a chunk on line breaks
+
+    Tables keep their rows whole and repeat their header at the start of
+    every piece. Only a line that is longer than a chunk on its own is
+    split on whitespace.
+
+    Args:
+        paragraph (str): Paragraph to split
+        max_chars (int): Maximum piece size in characters
+
+    Returns:
+        list: Piece strings, in order
+    """
+    lines = paragraph.split('\n')
+    header = _table_header(lines)
+    prefix = '\n'.join(header)
+    # A header too wide to leave room for rows is sent once, like any other line
+    if len(prefix) > max_chars // 2:
+        header, prefix = [], ''
+
+    pieces = []
+    piece = []
+    piece_len = 0
+    for line in lines[len(header):]:
+        if len(line) > max_chars:
+            if piece:
+                pieces.append(piece)
+                piece, piece_len = [], 0
+            pieces.extend([word_piece] for word_piece in _split_words(line, max_chars - len(prefix)))
+            continue
+        if piece_len + len(line) + len(prefix) > max_chars and piece:
+            pieces.append(piece)
+            piece, piece_len = [], 0
+        piece.append(line)
+        piece_len += len(line) + 1
+    if piece:
+        pieces.append(piece)
+    return ['\n'.join(header + piece) for piece in pieces]
+
+
+def chunk_text(text, chunk_tokens=400):
+    """
+    Split text into chunks of roughly ``chunk_tokens`` tokens on paragraph boundaries
+
+    Paragraphs longer than a chunk are split between lines, repeating a
+    table's header in each piece, and only single overlong lines on whitespace.
+
+    Args:
+        text (str): Text to split
+        chunk_tokens (int): Target chunk size in tokens
+
+    Returns:
+        list: Chunk strings, in document order
+    """
+    max_chars = chunk_tokens * CHARS_PER_TOKEN
+    chunks = []
+    current = []
+    current_len = 0
+
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+
+        pieces = [paragraph]
+        if len(paragraph) > max_chars:
+            pieces = _split_paragraph(paragraph, max_chars)
+
+        for piece in pieces:
+            if current_len + len(piece) > max_chars and current:
+                chunks.append('\n\n'.join(current))
+                current, current_len = [], 0
+            current.append(piece)
+            current_len += len(piece) + 2
+
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+
+def tokenize(text):
+    """Lower-case word tokens used for indexing and querying"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 index over document chunks.
+
+    Postings are held as flat NumPy arrays (term, chunk, frequency), so a
+    query is scored for every chunk at once with a mask and a bincount
+    rather than a Python loop over chunks.
+    """
+
+    def __init__(self, documents, chunk_tokens=400, k1=1.5, b=0.75):
+        """
+        Build the index
+
+        Args:
+            documents (list): Dicts with 'filename' and 'content' keys
+            chunk_tokens (int): Target chunk size in tokens
+            k1 (float): BM25 term frequency saturation
+            b (float): BM25 length normalisation
+        """
+        # NumPy is only needed once documents outgrow a budget, so it is not imported at startup
+        import numpy as np
+
+        self.k1 = k1
+        self.b = b
+        self.chunks = []
+        vocabulary = {}
+        term_ids, chunk_ids, frequencies, lengths = [], [], [], []
+
+        for doc_index, document in enumerate(documents):
+            for chunk in chunk_text(document['content'], chunk_tokens):
+                chunk_id = len(self.chunks)
+                self.chunks.append({'document': doc_index, 'filename': document['filename'], 'text': chunk,
+                                    'tokens': estimate_tokens(chunk)})
+                counts = Counter(tokenize(chunk))
+                lengths.append(sum(counts.values()))
+                for term, count in counts.items():
+                    term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                    chunk_ids.append(chunk_id)
+                    frequencies.append(count)
+
+        self.vocabulary = vocabulary
+        self.term_ids = np.asarray(term_ids, dtype=np.int64)
+        self.chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        self.frequencies = np.asarray(frequencies, dtype=np.float64)
+        self.lengths = np.asarray(lengths, dtype=np.float64)
+        self.chunk_tokens = np.asarray([chunk['tokens'] for chunk in self.chunks], dtype=np.int64)
+
+        num_chunks = len(self.chunks)
+        document_frequency = np.bincount(self.term_ids, minlength=len(vocabulary))
+        self.idf = np.log1p((num_chunks - document_frequency + 0.5) / (document_frequency + 0.5))
+        self.average_length = self.lengths.mean() if num_chunks else 0.0
+
+    def score(self, query):
+        """
+        Score every chunk against a query
+
+        Args:
+            query (str): Query text
+
+        Returns:
+            numpy.ndarray: BM25 score for each chunk
+        """
+        import numpy as np
+
+        query_ids = [self.vocabulary[term] for term in set(tokenize(query)) if term in self.vocabulary]
+        if not query_ids or not self.chunks:
+            return np.zeros(len(self.chunks))
+
+        mask = np.isin(self.term_ids, query_ids)
+        terms = self.term_ids[mask]
+        chunks = self.chunk_ids[mask]
+        tf = self.frequencies[mask]
+        norm = self.k1 * (1 - self.b + self.b * self.lengths[chunks] / self.average_length)
+        contributions = self.idf[terms] * tf * (self.k1 + 1) / (tf + norm)
+        return np.bincount(chunks, weights=contributions, minlength=len(self.chunks))
+
+    def select(self, query, token_budget):
+        """
+        Pick the best-scoring chunks that fit within a token budget
+
+        Args:
+            query (str): Query text
+            token_budget (int): Maximum total tokens of the selected chunks
+
+        Returns:
+            list: Dicts with 'filename', 'content' and 'tokens' keys, one per document
+                with selected chunks, keeping chunks in their original order
+        """
+        import numpy as np
+
+        scores = self.score(query)
+        # Stable sort keeps earlier chunks first when scores tie (e.g. no query terms match)
+        order = np.argsort(-scores, kind='stable')
+        within_budget = np.cumsum(self.chunk_tokens[order]) <= token_budget
+        selected = sorted(order[within_budget].tolist())
+
+        documents = OrderedDict()
+        for chunk_id in selected:
+            chunk = self.chunks[chunk_id]
+            documents.setdefault((chunk['document'], chunk['filename']), []).append(chunk)
+
+        return [{'filename': filename, 'content': '\n\n[...]\n\n'.join(chunk['text'] for chunk in chunks),
+                 'tokens': sum(chunk['tokens'] for chunk in chunks)}
+                for (_, filename), chunks in documents.items()]
+
+
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def get_index(key, documents, chunk_tokens=400):
+    """
+    Return the BM25 index for a set of documents, building it on first use
+
+    Indexes are kept in a small in-memory LRU so follow-up prompts against
+    the same uploads reuse the index.
+
+    Args:
+        key (tuple): Identifies the document set, e.g. the documents' content hashes
+        documents (list): Dicts with 'filename' and 'content' keys
+        chunk_tokens (int): Target chunk size in tokens
+
+    Returns:
+        BM25Index: The index
+    """
+    key = (key, chunk_tokens)
+    with _index_lock:
+        if key in _index_cache:
+            _index_cache.move_to_end(key)
+            return _index_cache[key]
+
+    index = BM25Index(documents, chunk_tokens)
+    logger.info(f"Built retrieval index with {len(index.chunks)} chunks")
+
+    with _index_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def fit_documents(prompt, documents, token_budget, key, chunk_tokens=400):
+    """
+    Fit reference documents into a token budget
+
+    Documents that already fit are returned whole. Otherwise they are
+    chunked and only the chunks most relevant to the prompt are kept.
+
+    Args:
+        prompt (str): The user's prompt, used as the retrieval query
+        documents (list): Dicts with 'filename' and 'content' keys, and optionally
+            'tokens' if the content has already been counted
+        token_budget (int): Maximum tokens of document text to include
+        key (tuple): Identifies the document set for index caching
+        chunk_tokens (int): Target chunk size in tokens
+
+    Returns:
+        list: Dicts with 'filename' and 'content' keys, and 'tokens' where known
+    """
+    total_tokens = sum(document['tokens'] if 'tokens' in document else estimate_tokens(document['content'])
+                       for document in documents)
+    if total_tokens <= token_budget:
+        return documents
+
+    index = get_index(key, documents, chunk_tokens)
+    selected = index.select(prompt, token_budget)
+    logger.info(f"Retrieved {sum(document['tokens'] for document in selected)} of {total_tokens} "
+                f"document tokens for a budget of {token_budget}")
+    return selected
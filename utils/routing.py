@@ -0,0 +1,177 @@
+"""
+Latency-aware routing of model requests across API endpoints
+"""
+import time
+import logging
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# What is timed: the whole response, or the first token of a streamed one
+KIND_TOTAL = 'total'
+KIND_TTFB = 'ttfb'
+
+
+def endpoint_host(endpoint):
+    """Return an endpoint URL's host, which is enough to tell endpoints apart in logs"""
+    return urlsplit(endpoint).netloc or endpoint
+
+
+class LatencyWindow:
+    """The most recent latencies of one model at one endpoint"""
+
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, point):
+        """
+        Nearest-rank percentile of the window
+
+        Args:
+            point (float): Percentile, 0-100
+
+        Returns:
+            float: Latency in seconds, or None with no samples
+        """
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, max(0, -(-point * len(ordered) // 100) - 1))]
+
+
+class RoutingPolicy:
+    """
+    Tracks rolling p50/p95 latency per model and endpoint, and decides where
+    requests go and when to hedge them.
+
+    Endpoints that have just failed are tried last for a cooldown period,
+    and otherwise the endpoint with the lowest median latency goes first once
+    both have enough samples. A request still running when its endpoint's
+    p95 has passed is worth hedging: a second copy is likely to finish first.
+    Latencies are kept per process, which is enough to find each process's
+    tail.
+    """
+
+    def __init__(self, window=200, min_samples=20, hedge_percentile=95, min_hedge_delay=1.0, cooldown=30,
+                 hedging=True):
+        """
+        Initialize the policy
+
+        Args:
+            window (int): Latencies kept per model and endpoint
+            min_samples (int): Latencies needed before routing or hedging on them
+            hedge_percentile (float): Percentile after which a request is hedged
+            min_hedge_delay (float): Fewest seconds to wait before hedging
+            cooldown (float): Seconds a failed endpoint is tried last
+            hedging (bool): Whether to hedge slow requests at all
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.cooldown = cooldown
+        self.hedging = hedging
+        self._latencies = {}
+        self._failed_at = {}
+        self._lock = threading.Lock()
+
+    def _window(self, model, endpoint, kind):
+        key = (model, endpoint, kind)
+        if key not in self._latencies:
+            self._latencies[key] = LatencyWindow(self.window)
+        return self._latencies[key]
+
+    def record(self, model, endpoint, kind, seconds):
+        """
+        Record a successful request's latency
+
+        Args:
+            model (str): Model ID
+            endpoint (str): Endpoint URL
+            kind (str): 'total' or 'ttfb'
+            seconds (float): Latency
+        """
+        with self._lock:
+            self._window(model, endpoint, kind).add(seconds)
+
+    def record_failure(self, endpoint):
+        """Note that an endpoint has just failed, so it is tried last for a while"""
+        with self._lock:
+            self._failed_at[endpoint] = time.monotonic()
+
+    def _failing(self, endpoint):
+        failed_at = self._failed_at.get(endpoint)
+        return failed_at is not None and time.monotonic() - failed_at < self.cooldown
+
+    def _percentile(self, model, endpoint, kind, point):
+        window = self._latencies.get((model, endpoint, kind))
+        if window is None or len(window.samples) < self.min_samples:
+            return None
+        return window.percentile(point)
+
+    def order(self, model, endpoints, kind=KIND_TOTAL):
+        """
+        Put endpoints in the order to try them
+
+        Args:
+            model (str): Model ID
+            endpoints (list): Endpoint URLs in configured order
+            kind (str): 'total' or 'ttfb', whichever the request will be judged on
+
+        Returns:
+            list: The same endpoints, healthy ones first, then fastest first where known
+        """
+        if len(endpoints) < 2:
+            return list(endpoints)
+
+        def key(item):
+            position, endpoint = item
+            median = self._percentile(model, endpoint, kind, 50)
+            # Without enough samples an endpoint keeps its configured place
+            return self._failing(endpoint), median if median is not None else float('inf'), position
+
+        with self._lock:
+            return [endpoint for _, endpoint in sorted(enumerate(endpoints), key=key)]
+
+    def hedge_delay(self, model, endpoint, kind=KIND_TOTAL):
+        """
+        How long to wait for a request before sending a hedge
+
+        Args:
+            model (str): Model ID
+            endpoint (str): Endpoint the request goes to first
+            kind (str): 'total' or 'ttfb'
+
+        Returns:
+            float: Seconds, or None if the request should not be hedged
+        """
+        if not self.hedging:
+            return None
+        with self._lock:
+            tail = self._percentile(model, endpoint, kind, self.hedge_percentile)
+        return None if tail is None else max(tail, self.min_hedge_delay)
+
+    def status(self):
+        """
+        Summarise latencies for the debug page
+
+        Returns:
+            dict: For each model, each endpoint host's sample count, p50 and p95 per kind,
+                and whether the endpoint is in its failure cooldown
+        """
+        with self._lock:
+            summary = {}
+            for (model, endpoint, kind), window in sorted(self._latencies.items()):
+                entry = summary.setdefault(model, {}).setdefault(endpoint_host(endpoint),
+                                                                 {'failing': self._failing(endpoint)})
+                entry[kind] = {'count': len(window.samples),
+                               'p50': round(window.percentile(50), 3),
+                               'p95': round(window.percentile(95), 3)}
+            return summary
@@ -0,0 +1,148 @@
+"""
+Fingerprinted, precompressed static assets
+
+At startup each stylesheet and script under static/ is copied to a name
+containing a hash of its content, alongside gzip and (if the brotli package
+is installed) brotli copies. A changed file gets a new name, so browsers and
+proxies can cache every copy for a year without revalidating it, and
+compression is done once rather than on every response.
+"""
+import os
+import gzip
+import hashlib
+import logging
+import tempfile
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Files worth fingerprinting and compressing; images and fonts are already compressed
+ASSET_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.map', '.txt'}
+
+# Precompressed copies, in order of preference, with the suffix each is stored under
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+FINGERPRINT_LENGTH = 12
+
+
+def _write(path, data):
+    # Written to a temporary file first, so other processes building at the same time never see half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _compress(encoding, data):
+    """Compress an asset as small as possible, or return None if the encoding is unavailable"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=11) if brotli is not None else None
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class StaticAssets:
+    """
+    Fingerprinted copies of the app's static files, with their compressed variants.
+
+    The manifest maps each file's path under static/ to its fingerprinted path
+    under the build folder. Earlier builds' copies are kept, so pages rendered
+    before a deploy can still load the assets they refer to.
+    """
+
+    def __init__(self, static_folder, build_folder):
+        """
+        Initialize the assets
+
+        Args:
+            static_folder (str): The app's static folder
+            build_folder (str): Where fingerprinted and compressed copies are written
+        """
+        self.static_folder = static_folder
+        self.build_folder = build_folder
+        self.manifest = {}
+
+    def build(self):
+        """
+        Fingerprint and compress every asset, skipping copies that already exist
+
+        Returns:
+            dict: Mapping of path under static/ to fingerprinted path
+        """
+        manifest = {}
+        written = 0
+        for root, _, files in os.walk(self.static_folder):
+            for name in sorted(files):
+                stem, ext = os.path.splitext(name)
+                if ext.lower() not in ASSET_EXTENSIONS:
+                    continue
+
+                source = os.path.join(root, name)
+                with open(source, 'rb') as file:
+                    data = file.read()
+                digest = hashlib.sha256(data).hexdigest()[:FINGERPRINT_LENGTH]
+                directory = os.path.relpath(root, self.static_folder).replace(os.sep, '/')
+                prefix = '' if directory == '.' else directory + '/'
+                fingerprinted = f"{prefix}{stem}.{digest}{ext}"
+
+                target = os.path.join(self.build_folder, fingerprinted)
+                if not os.path.exists(target):
+                    _write(target, data)
+                    written += 1
+                for encoding, suffix in ENCODINGS:
+                    if os.path.exists(target + suffix):
+                        continue
+                    compressed = _compress(encoding, data)
+                    # A variant no smaller than the original is not worth sending
+                    if compressed is not None and len(compressed) < len(data):
+                        _write(target + suffix, compressed)
+                manifest[prefix + name] = fingerprinted
+
+        self.manifest = manifest
+        logger.info(f"Fingerprinted {len(manifest)} static assets ({written} new) in {self.build_folder}"
+                    + ('' if brotli is not None else "; brotli is not installed, so only gzip copies are made"))
+        return manifest
+
+    def url_path(self, filename):
+        """
+        Look up an asset's fingerprinted path
+
+        Args:
+            filename (str): Path under static/, e.g. 'stylesheets/application.css'
+
+        Returns:
+            str: Fingerprinted path, or None if the file is not a fingerprinted asset
+        """
+        return self.manifest.get(filename)
+
+    def variant(self, fingerprinted, accept_encodings):
+        """
+        Choose which copy of an asset to send
+
+        Args:
+            fingerprinted (str): Fingerprinted path, from this build's manifest or an earlier one's
+            accept_encodings (Accept): The request's parsed Accept-Encoding header
+
+        Returns:
+            tuple: (file name under the build folder, Content-Encoding or None),
+                or None if there is no such asset
+        """
+        path = safe_join(self.build_folder, fingerprinted)
+        if path is None or os.path.splitext(path)[1].lower() not in ASSET_EXTENSIONS or not os.path.isfile(path):
+            return None
+        for encoding, suffix in ENCODINGS:
+            if accept_encodings[encoding] and os.path.exists(path + suffix):
+                return fingerprinted + suffix, encoding
+        return fingerprinted, None
@@ -0,0 +1,412 @@
+"""
+Streaming, row-capped rendering and statistical profiles of spreadsheets and CSV files
+"""
+import io
+import os
+import csv
+import math
+import logging
+import numpy as np
+import pandas as pd
+import openpyxl
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rows read up front to infer column types for the chunked reader
+DTYPE_SAMPLE_ROWS = 1000
+CSV_CHUNK_ROWS = 5000
+# Bytes scanned for line breaks to estimate how many rows a truncated CSV has
+ROW_COUNT_SAMPLE_BYTES = 1024 * 1024
+
+
+def _cell(value):
+    """Render a single cell compactly"""
+    if value is None or value is pd.NA or value is pd.NaT:
+        return ''
+    if isinstance(value, float):
+        if math.isnan(value):
+            return ''
+        if value.is_integer():
+            return str(int(value))
+    return str(value)
+
+
+class TableWriter:
+    """
+    Renders rows as compact CSV or a markdown table, stopping at a row or byte cap
+    """
+
+    def __init__(self, fmt='csv', max_rows=None, max_bytes=None):
+        """
+        Initialize the writer
+
+        Args:
+            fmt (str): 'csv' or 'markdown'
+            max_rows (int): Maximum number of data rows (None for no limit)
+            max_bytes (int): Maximum size of the rendered table (None for no limit)
+        """
+        self.fmt = fmt
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.rows = 0
+        self.size = 0
+        self.truncated = False
+        self._lines = []
+        self._buffer = io.StringIO()
+        self._csv = csv.writer(self._buffer, lineterminator='')
+
+    def _render(self, cells):
+        if self.fmt == 'markdown':
+            return '| ' + ' | '.join(cell.replace('|', '\\|').replace('\n', ' ') for cell in cells) + ' |'
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._csv.writerow(cells)
+        return self._buffer.getvalue()
+
+    def header(self, columns):
+        """Write the header row"""
+        cells = [_cell(column) for column in columns]
+        self._append(self._render(cells))
+        if self.fmt == 'markdown':
+            self._append('|' + '---|' * len(cells))
+
+    def _append(self, line):
+        self._lines.append(line)
+        self.size += len(line) + 1
+
+    def add_row(self, values):
+        """
+        Write a data row
+
+        Args:
+            values (iterable): Cell values
+
+        Returns:
+            bool: False once a cap has been reached and no more rows should be sent
+        """
+        if self.truncated:
+            return False
+        if self.max_rows is not None and self.rows >= self.max_rows:
+            self.truncated = True
+            return False
+
+        line = self._render([_cell(value) for value in values])
+        if self.max_bytes is not None and self.size + len(line) + 1 > self.max_bytes:
+            self.truncated = True
+            return False
+
+        self._append(line)
+        self.rows += 1
+        return True
+
+    def getvalue(self):
+        """Return the rendered table"""
+        return '\n'.join(self._lines)
+
+
+def infer_csv_dtypes(file_path, sample_rows=DTYPE_SAMPLE_ROWS):
+    """
+    Infer column types from the first rows of a CSV file
+
+    Integer columns use pandas' nullable Int64 so missing values further
+    down the file do not break the chunked reader.
+
+    Args:
+        file_path (str): Path to the CSV file
+        sample_rows (int): Number of rows to sample
+
+    Returns:
+        dict: Column name to dtype
+    """
+    sample = pd.read_csv(file_path, nrows=sample_rows)
+    dtypes = {}
+    for column, dtype in sample.dtypes.items():
+        if pd.api.types.is_integer_dtype(dtype):
+            dtypes[column] = 'Int64'
+        elif pd.api.types.is_float_dtype(dtype):
+            dtypes[column] = 'float64'
+        else:
+            dtypes[column] = 'object'
+    return dtypes
+
+
+def _count_csv_rows(file_path, total_size):
+    """
+    Count the data rows in a CSV from its line breaks, scaling up from a sample of a large file
+
+    Args:
+        file_path (str): Path to the CSV file
+        total_size (int): Size of the file in bytes
+
+    Returns:
+        tuple: (rows, exact) where exact is False if the count was estimated from a sample
+    """
+    with open(file_path, 'rb') as handle:
+        sample = handle.read(ROW_COUNT_SAMPLE_BYTES)
+    lines = sample.count(b'\n') + (0 if sample.endswith(b'\n') else 1)
+    if len(sample) >= total_size:
+        return lines - 1, True
+    return round(lines * total_size / len(sample)) - 1, False
+
+
+def render_csv(file_path, fmt='csv', max_rows=None, max_bytes=None):
+    """
+    Render a CSV file as a compact table without loading it all into memory
+
+    Args:
+        file_path (str): Path to the CSV file
+        fmt (str): 'csv' or 'markdown'
+        max_rows (int): Maximum number of data rows to include
+        max_bytes (int): Maximum size of the rendered table
+
+    Returns:
+        str: The rendered table, followed by a note if it was truncated
+    """
+    try:
+        dtypes = infer_csv_dtypes(file_path)
+    except pd.errors.EmptyDataError:
+        return ''
+
+    total_size = os.path.getsize(file_path)
+
+    with open(file_path, 'rb') as handle:
+        # If the sampled types do not hold further down the file, start again reading everything as text
+        for dtype in (dtypes, str):
+            handle.seek(0)
+            writer = TableWriter(fmt, max_rows, max_bytes)
+            try:
+                for index, chunk in enumerate(pd.read_csv(handle, dtype=dtype, chunksize=CSV_CHUNK_ROWS)):
+                    if index == 0:
+                        writer.header(chunk.columns)
+                    for row in chunk.astype(object).itertuples(index=False, name=None):
+                        if not writer.add_row(row):
+                            break
+                    if writer.truncated:
+                        break
+                break
+            except (ValueError, TypeError) as e:
+                logger.info(f"Sampled column types did not fit {file_path} ({str(e)}), reading as text")
+
+    content = writer.getvalue()
+    if writer.truncated:
+        total_rows, exact = _count_csv_rows(file_path, total_size)
+        of_total = f"{total_rows:,}" if exact else f"roughly {total_rows:,}"
+        content += f"\n[Truncated: showing the first {writer.rows:,} of {of_total} rows]"
+    return content
+
+
+def render_excel(file_path, fmt='csv', max_rows=None, max_bytes=None):
+    """
+    Render each sheet of a workbook as a compact table, streaming rows
+
+    XLSX files are read with openpyxl in read-only mode so rows are
+    iterated without building the whole workbook in memory. Legacy XLS
+    files fall back to pandas, reading only the capped number of rows.
+
+    Args:
+        file_path (str): Path to the Excel file
+        fmt (str): 'csv' or 'markdown'
+        max_rows (int): Maximum number of data rows per sheet
+        max_bytes (int): Maximum size of each rendered sheet
+
+    Returns:
+        str: The rendered sheets, each with a note if it was truncated
+    """
+    content = []
+
+    try:
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    except Exception as e:
+        logger.warning(f"Could not open workbook with openpyxl: {str(e)}. Trying with pandas...")
+        sheets = pd.read_excel(file_path, sheet_name=None, nrows=max_rows + 1 if max_rows else None)
+        for sheet_name, df in sheets.items():
+            writer = TableWriter(fmt, max_rows, max_bytes)
+            writer.header(df.columns)
+            for row in df.astype(object).itertuples(index=False, name=None):
+                if not writer.add_row(row):
+                    break
+            content.append(_sheet_text(sheet_name, writer, None))
+        return '\n\n'.join(content)
+
+    try:
+        for sheet_name in workbook.sheetnames:
+            sheet = workbook[sheet_name]
+            writer = TableWriter(fmt, max_rows, max_bytes)
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is not None:
+                writer.header(header)
+                for row in rows:
+                    if not writer.add_row(row):
+                        break
+            total_rows = sheet.max_row - 1 if sheet.max_row else None
+            content.append(_sheet_text(sheet_name, writer, total_rows))
+    finally:
+        workbook.close()
+
+    return '\n\n'.join(content)
+
+
+def _sheet_text(sheet_name, writer, total_rows):
+    text = f"Sheet: {sheet_name}\n{writer.getvalue()}"
+    if writer.truncated:
+        of_total = f" of {total_rows:,}" if total_rows else ""
+        text += f"\n[Truncated: showing the first {writer.rows}{of_total} rows]"
+    return text
+
+
+def _frame_text(df, fmt, index=True):
+    """Render a small summary DataFrame with TableWriter"""
+    writer = TableWriter(fmt)
+    if index:
+        df = df.reset_index()
+    writer.header(df.columns)
+    for row in df.astype(object).itertuples(index=False, name=None):
+        writer.add_row(row)
+    return writer.getvalue()
+
+
+def profile_dataframe(df, fmt='csv', top_k=5, sample_rows=20, max_correlations=10):
+    """
+    Summarise a DataFrame for a model instead of sending every row
+
+    The profile covers the schema and null counts, describe() statistics
+    for numeric columns, the most common values of categorical columns,
+    the strongest correlations between numeric columns and a small
+    stratified sample of rows.
+
+    Args:
+        df (pandas.DataFrame): Data to profile
+        fmt (str): 'csv' or 'markdown' for the tables in the profile
+        top_k (int): Number of common values to list per categorical column
+        sample_rows (int): Approximate number of sample rows
+        max_correlations (int): Number of column pairs to list
+
+    Returns:
+        str: The profile as text
+    """
+    sections = [f"Rows: {len(df):,}  Columns: {len(df.columns):,}"]
+
+    non_null = df.count()
+    schema = pd.DataFrame({
+        'dtype': df.dtypes.astype(str),
+        'non_null': non_null,
+        'nulls': len(df) - non_null,
+        'null_pct': ((len(df) - non_null) / max(len(df), 1) * 100).round(1),
+        'unique': df.nunique(dropna=True)
+    })
+    schema.index.name = 'column'
+    sections.append("Schema:\n" + _frame_text(schema, fmt))
+
+    numeric = df.select_dtypes(include='number')
+    if not numeric.empty:
+        stats = numeric.describe().T.astype(float).round(4)
+        stats.index.name = 'column'
+        sections.append("Numeric columns:\n" + _frame_text(stats, fmt))
+
+    categorical = df.select_dtypes(exclude=['number', 'datetime'])
+    if not categorical.empty:
+        rows = []
+        for column in categorical.columns:
+            if schema.at[column, 'unique'] > len(df) / 2:
+                # Identifier-like columns have no meaningful common values
+                rows.append({'column': column, 'top_values': 'mostly unique'})
+                continue
+            counts = categorical[column].value_counts(dropna=True).head(top_k)
+            values = '; '.join(f"{value} ({count:,})" for value, count in counts.items())
+            rows.append({'column': column, 'top_values': values})
+        sections.append(f"Most common values (top {top_k}):\n" + _frame_text(pd.DataFrame(rows), fmt, index=False))
+
+    datetimes = df.select_dtypes(include='datetime')
+    if not datetimes.empty:
+        ranges = pd.DataFrame({'min': datetimes.min(), 'max': datetimes.max()})
+        ranges.index.name = 'column'
+        sections.append("Date ranges:\n" + _frame_text(ranges, fmt))
+
+    if numeric.shape[1] > 1:
+        corr = numeric.corr().to_numpy()
+        upper = np.triu_indices_from(corr, k=1)
+        values = corr[upper]
+        valid = ~np.isnan(values)
+        order = np.argsort(-np.abs(values[valid]))[:max_correlations]
+        columns = numeric.columns.to_numpy()
+        pairs = pd.DataFrame({
+            'column_a': columns[upper[0][valid][order]],
+            'column_b': columns[upper[1][valid][order]],
+            'correlation': values[valid][order].round(3)
+        })
+        if not pairs.empty:
+            sections.append("Strongest correlations:\n" + _frame_text(pairs, fmt, index=False))
+
+    if len(df):
+        sample = df.iloc[_stratified_positions(df, categorical, sample_rows)]
+        sections.append(f"Sample rows ({len(sample)}):\n" + _frame_text(sample, fmt, index=False))
+
+    return '\n\n'.join(sections)
+
+
+def _stratified_positions(df, categorical, sample_rows, max_strata=20):
+    """
+    Pick row positions for a sample, stratified by the lowest-cardinality
+    categorical column when there is a suitable one
+    """
+    rng = np.random.default_rng(0)
+    cardinality = categorical.nunique(dropna=False)
+    candidates = cardinality[(cardinality > 1) & (cardinality <= max_strata)]
+
+    if candidates.empty:
+        count = min(sample_rows, len(df))
+        return np.sort(rng.choice(len(df), size=count, replace=False))
+
+    column = candidates.idxmin()
+    per_stratum = max(1, sample_rows // int(candidates.min()))
+    order = rng.permutation(len(df))
+    keys = df[column].astype(str).to_numpy()[order]
+    ranks = pd.Series(keys).groupby(keys).cumcount().to_numpy()
+    return np.sort(order[ranks < per_stratum])
+
+
+def profile_csv(file_path, fmt='csv', max_rows=None):
+    """
+    Profile a CSV file
+
+    Args:
+        file_path (str): Path to the CSV file
+        fmt (str): 'csv' or 'markdown' for the tables in the profile
+        max_rows (int): Maximum number of rows to load (None loads all)
+
+    Returns:
+        str: The profile as text
+    """
+    try:
+        dtypes = infer_csv_dtypes(file_path)
+    except pd.errors.EmptyDataError:
+        return ''
+
+    try:
+        df = pd.read_csv(file_path, dtype=dtypes, nrows=max_rows)
+    except (ValueError, TypeError):
+        df = pd.read_csv(file_path, nrows=max_rows)
+
+    profile = profile_dataframe(df, fmt)
+    if max_rows and len(df) == max_rows:
+        profile += f"\n[Profile covers the first {max_rows:,} rows only]"
+    return profile
+
+
+def profile_excel(file_path, fmt='csv', max_rows=None):
+    """
+    Profile each sheet of a workbook
+
+    Args:
+        file_path (str): Path to the Excel file
+        fmt (str): 'csv' or 'markdown' for the tables in the profile
+        max_rows (int): Maximum number of rows to load per sheet (None loads all)
+
+    Returns:
+        str: The profiles of all sheets as text
+    """
+    sheets = pd.read_excel(file_path, sheet_name=None, nrows=max_rows)
+    return '\n\n'.join(f"Sheet: {sheet_name}\n{profile_dataframe(df, fmt)}" for sheet_name, df in sheets.items())
@@ -0,0 +1,157 @@
+"""
+Offline token estimates for prompts and documents
+
+The models count text in BPE tokens (o200k_base for gpt-4o), and a flat
+characters-per-token ratio is only right for English prose: it undercounts
+CSVs, code and non-Latin scripts by half or more. Downloading the real
+vocabulary at runtime would hang an offline deployment, so tokens are
+estimated from a handful of character classes instead, weighted by a fit
+against o200k_base counts for prose, code, markdown, CSV, HTML, European,
+Cyrillic and CJK text. The estimate is usually within 3-7% of the true
+count, and within about 12% for accented European languages.
+"""
+import re
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Latin letters, including accented ones, which BPE merges into whole words
+LATIN = 'A-Za-zÀ-ɏḀ-ỿ'
+WORD_PATTERN = re.compile(f'[{LATIN}]+')
+# Words longer than the vocabulary tends to hold in one token
+LONG_WORD_PATTERN = re.compile(f'[{LATIN}]{{8,}}')
+ACCENTED_PATTERN = re.compile('[À-ɏḀ-ỿ]')
+# Greek, Cyrillic, Armenian, Hebrew, Arabic, Indic and other alphabetic scripts
+SCRIPT = 'Ͱ-᷿Ⰰ-ⷿꙀ-ꚟ'
+SCRIPT_WORD_PATTERN = re.compile(f'[{SCRIPT}]+')
+SCRIPT_CHAR_PATTERN = re.compile(f'[{SCRIPT}]')
+# Kana, CJK ideographs and Hangul, roughly one token per character or less
+CJK_PATTERN = re.compile('[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]')
+DIGITS_PATTERN = re.compile(r'\d+')
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+PUNCTUATION_RUN_PATTERN = re.compile(r'[^\w\s]+')
+WHITESPACE_RUN_PATTERN = re.compile(r'[ \t]{2,}|\n+')
+NON_ASCII_PATTERN = re.compile('[^\x00-\x7f]')
+
+# Bump when the features or weights change, so cached counts are recomputed
+ESTIMATOR_VERSION = 1
+
+# Tokens per feature, fitted by least squares on relative error against o200k_base
+TOKENS_PER_WORD = 0.75
+TOKENS_PER_LONG_WORD_LETTER = 0.39
+TOKENS_PER_ACCENTED_LETTER = 0.93
+TOKENS_PER_SCRIPT_WORD = 0.48
+TOKENS_PER_SCRIPT_LETTER = 0.29
+TOKENS_PER_NUMBER = 0.71
+TOKENS_PER_DIGIT = 0.35
+TOKENS_PER_PUNCTUATION = 0.05
+TOKENS_PER_PUNCTUATION_RUN = 0.87
+TOKENS_PER_WHITESPACE_RUN = 1.29
+TOKENS_PER_CJK_CHARACTER = 0.71
+TOKENS_PER_OTHER_CHARACTER = 1.77
+
+
+def estimate_tokens(text):
+    """
+    Estimate how many model tokens a piece of text uses
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Approximate token count, at least 1
+    """
+    if not text:
+        return 1
+
+    long_words = LONG_WORD_PATTERN.findall(text)
+    numbers = DIGITS_PATTERN.findall(text)
+    accented = script = script_words = cjk = other = 0
+    if not text.isascii():
+        accented = len(ACCENTED_PATTERN.findall(text))
+        script = len(SCRIPT_CHAR_PATTERN.findall(text))
+        script_words = len(SCRIPT_WORD_PATTERN.findall(text))
+        cjk = len(CJK_PATTERN.findall(text))
+        # Emoji, symbols and scripts not matched above are usually a token or two per character
+        other = len(NON_ASCII_PATTERN.findall(text)) - accented - script - cjk
+
+    tokens = (TOKENS_PER_WORD * len(WORD_PATTERN.findall(text))
+              + TOKENS_PER_LONG_WORD_LETTER * (sum(map(len, long_words)) - 7 * len(long_words))
+              + TOKENS_PER_ACCENTED_LETTER * accented
+              + TOKENS_PER_SCRIPT_WORD * script_words
+              + TOKENS_PER_SCRIPT_LETTER * script
+              + TOKENS_PER_NUMBER * len(numbers)
+              + TOKENS_PER_DIGIT * sum(map(len, numbers))
+              + TOKENS_PER_PUNCTUATION * len(PUNCTUATION_PATTERN.findall(text))
+              + TOKENS_PER_PUNCTUATION_RUN * len(PUNCTUATION_RUN_PATTERN.findall(text))
+              + TOKENS_PER_WHITESPACE_RUN * len(WHITESPACE_RUN_PATTERN.findall(text))
+              + TOKENS_PER_CJK_CHARACTER * cjk
+              + TOKENS_PER_OTHER_CHARACTER * other)
+    return max(1, round(tokens))
+
+
+def truncate_to_tokens(text, max_tokens, marker=''):
+    """
+    Cut text down to roughly ``max_tokens`` tokens, at a paragraph or word boundary
+
+    Args:
+        text (str): Text to shorten
+        max_tokens (int): Tokens to keep, including the marker
+        marker (str): Appended to show the text was cut
+
+    Returns:
+        str: The text unchanged if it already fits, otherwise its start followed by the marker
+    """
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+
+    keep = max(0, max_tokens - estimate_tokens(marker))
+    # Token density varies through a document, so shrink until the estimate fits
+    cut = len(text) * keep // tokens
+    while cut > 0:
+        boundary = text.rfind('\n\n', 0, cut)
+        if boundary < cut // 2:
+            boundary = text.rfind(' ', 0, cut)
+        if boundary > 0:
+            cut = boundary
+        head = text[:cut].rstrip()
+        head_tokens = estimate_tokens(head)
+        if head_tokens <= keep:
+            return head + marker
+        cut = cut * keep // head_tokens
+    return marker.lstrip()
+
+
+def trim_to_fit(token_counts, excess):
+    """
+    Decide how far to shorten documents to free up tokens, largest first
+
+    The largest documents are cut down to a common size, just enough to save
+    ``excess`` tokens, so small documents are kept whole wherever possible.
+
+    Args:
+        token_counts (list): Tokens in each document
+        excess (int): Tokens to save in total
+
+    Returns:
+        list: Tokens to keep of each document, in the same order
+    """
+    if excess <= 0:
+        return list(token_counts)
+    remaining = sum(token_counts) - excess
+    if remaining <= 0:
+        return [0] * len(token_counts)
+
+    # Lower the cap from the top until the documents under it fit in what remains
+    ordered = sorted(token_counts)
+    cap = 0
+    for index, count in enumerate(ordered):
+        larger = len(ordered) - index
+        cap = remaining // larger
+        if cap <= count:
+            break
+        remaining -= count
+    return [min(count, cap) for count in token_counts]